@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+"""Ingest and query benchmark for the sensor history store.
+
+Records polls of a large fabric (4096 nodes x 20 sensors by default) at a
+10 second interval, then times range queries at each resolution.
+
+Usage: python benchmarks/history_benchmark.py [polls] [nodes] [sensors]
+"""
+
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+from cxmanage_api.history import HistoryStore
+
+
+def make_polls(polls, nodes, sensors):
+    """ Build synthetic poll results """
+    names = ["Sensor %02i" % i for i in xrange(sensors)]
+    base = dict(((node_id, name), random.uniform(20, 80))
+                for node_id in xrange(nodes) for name in names)
+    for i in xrange(polls):
+        yield 1e9 + 10 * i, dict((key, value + i % 7)
+                                 for key, value in base.iteritems())
+
+
+def main():
+    """ Run the benchmark """
+    polls = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    nodes = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    sensors = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    directory = tempfile.mkdtemp(prefix="cxmanage_benchmark-")
+    try:
+        store = HistoryStore(directory)
+        elapsed = 0.0
+        for timestamp, samples in make_polls(polls, nodes, sensors):
+            start = time.time()
+            store.append(timestamp, samples)
+            elapsed += time.time() - start
+        start = time.time()
+        store.flush()
+        elapsed += time.time() - start
+        print "ingest   %6i polls  %8.1f ms/poll  %10.0f samples/s" % (
+            polls, elapsed / polls * 1e3, polls * nodes * sensors / elapsed
+        )
+
+        end = 1e9 + 10 * polls
+        for resolution, window in [(0, 600), (0, None), (60, None)]:
+            queries = 1000
+            start = time.time()
+            for i in xrange(queries):
+                returned = store.query(
+                    i % nodes, "Sensor %02i" % (i % sensors),
+                    start=end - window if window else None,
+                    resolution=resolution
+                )
+            elapsed = time.time() - start
+            print "query    res %4is window %5s  %8.1f us/query  " \
+                  "(%i samples)" % (resolution, window or "all",
+                                    elapsed / queries * 1e6, len(returned))
+        store.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# End of file: ./benchmarks/history_benchmark.py
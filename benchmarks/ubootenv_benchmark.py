@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+"""Microbenchmarks for UbootEnv parsing and serialization.
+
+Compares the current UbootEnv against the original string-concatenation
+implementation with the pure-Python CRC.
+
+Usage: python benchmarks/ubootenv_benchmark.py [iterations]
+"""
+
+import sys
+import struct
+import timeit
+
+from cxmanage_api.crc32 import TABLE
+from cxmanage_api.ubootenv import UbootEnv, ENVIRONMENT_SIZE
+
+
+def legacy_crc32(string, crc=0):
+    """ Original table-driven crc32 """
+    for char in string:
+        crc = TABLE[(crc ^ ord(char)) & 0xff] ^ (crc >> 8)
+    return crc
+
+
+def legacy_parse(contents):
+    """ Original UbootEnv constructor """
+    variables = {}
+    contents = contents.rstrip("%c%c" % (chr(0), chr(255)))[4:]
+    for line in contents.split(chr(0)):
+        part = line.partition("=")
+        variables[part[0]] = part[2]
+    return variables
+
+
+def legacy_get_contents(variables):
+    """ Original UbootEnv.get_contents """
+    contents = ""
+    for variable in variables:
+        contents += "%s=%s\0" % (variable, variables[variable])
+    contents += "\0"
+    contents += "".join([chr(255)
+            for _ in range(ENVIRONMENT_SIZE - len(contents) - 4)])
+    crc32 = legacy_crc32(contents, 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return struct.pack("<I", crc32) + contents
+
+
+def make_ubootenv():
+    """ Build an environment about the size of a real one """
+    ubootenv = UbootEnv()
+    for i in xrange(64):
+        ubootenv.variables["variable%02i" % i] = "run something_%i" % i
+    return ubootenv
+
+
+def report(name, legacy, current, iterations):
+    """ Print timings for one benchmark """
+    legacy_time = timeit.timeit(legacy, number=iterations)
+    current_time = timeit.timeit(current, number=iterations)
+    print "%-16s legacy %8.1f us  current %8.1f us  (%.1fx)" % (
+        name, legacy_time / iterations * 1e6,
+        current_time / iterations * 1e6, legacy_time / current_time
+    )
+
+
+def main():
+    """ Run the benchmarks """
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    ubootenv = make_ubootenv()
+    variables = dict(ubootenv.variables)
+    contents = ubootenv.get_contents()
+
+    report("get_contents", lambda: legacy_get_contents(variables),
+           ubootenv.get_contents, iterations)
+    report("parse", lambda: legacy_parse(contents),
+           lambda: UbootEnv(contents), iterations)
+    report("round trip",
+           lambda: legacy_get_contents(legacy_parse(contents)),
+           lambda: UbootEnv(contents).get_contents(), iterations)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# End of file: ./benchmarks/ubootenv_benchmark.py
@@ -33,6 +33,7 @@
 
 
 import os
+import uuid
 import atexit
 import shutil
 import tempfile
@@ -67,5 +68,26 @@ def temp_dir():
     """
     return tempfile.mkdtemp(dir=WORK_DIR)
 
+def atomic_write(filename, data):
+    """
+    Write data to a file atomically, creating its directory if needed.
+
+    The data goes to a uniquely named file next to the target first, then
+    gets renamed into place, so readers never see a partial file.
+
+    :param filename: File to write.
+    :type filename: string
+    :param data: Contents of the file.
+    :type data: string
+
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    tmp_filename = "%s.%s.tmp" % (filename, uuid.uuid4().hex)
+    with open(tmp_filename, "w") as tmp_file:
+        tmp_file.write(data)
+    os.rename(tmp_filename, filename)
+
 
 # End of file:./__init__.py
@@ -0,0 +1,297 @@
+"""Calxeda: aggregate.py"""
+
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import math
+import operator
+from array import array
+from collections import OrderedDict
+
+from cxmanage_api.poller import parse_reading, nearest_rank
+from cxmanage_api.topology import node_slot
+
+
+NAN = float("nan")
+
+
+class SensorMatrix(object):
+    """Sensor readings from many nodes, parsed into per-sensor columns.
+
+    Every reading is parsed once. Each sensor gets a column of floats with
+    one slot per node (NaN where the node has no numeric reading), so
+    statistics are computed over flat arrays rather than reparsing strings.
+
+    >>> from cxmanage_api.aggregate import SensorMatrix
+    >>> results = fabric.get_sensors('Power')
+    >>> matrix = SensorMatrix(results)
+    >>> [value for _, value, _ in matrix.readings('Node Power')]
+    [4.2, 4.6, 5.8, 9.8]
+    >>> matrix.statistics('Node Power')
+    {'count': 4, 'min': 4.2, 'max': 9.8, 'mean': 6.1,
+     'stddev': 2.215851980616036, 'percentiles': {50: 4.6, 90: 9.8, 99: 9.8},
+     'outliers': []}
+    >>> matrix.rollup_by_slot('Node Power')
+    OrderedDict([(0, {'count': 4, 'min': 4.2, ...})])
+
+    :param results: Sensor readings, as returned by get_sensors(), keyed
+                    by node (or node ID).
+    :type results: dictionary
+    :param nodes: Nodes, in order. Default: the keys of results, sorted.
+    :type nodes: list
+
+    """
+
+    def __init__(self, results, nodes=None):
+        """Default constructor for the SensorMatrix class."""
+        if nodes is None:
+            nodes = sorted(results)
+        self.nodes = [x for x in nodes if x in results]
+        self.sensors = []
+        self.units = {}
+        self.columns = {}
+        self.text = {}
+        self._units = {}
+        self._index = dict((node, i) for i, node in enumerate(self.nodes))
+
+        index = self._index
+        mixed = set()
+        for node in self.nodes:
+            for name, sensor in results[node].iteritems():
+                if name not in self.columns:
+                    self.sensors.append(name)
+                    self.columns[name] = array("d", [NAN] * len(self.nodes))
+                value, units = parse_reading(sensor.sensor_reading)
+                if value is None:
+                    self.text[(node, name)] = sensor.sensor_reading
+                    continue
+                self.columns[name][index[node]] = value
+                self._units[(node, name)] = units
+                if self.units.setdefault(name, units) != units:
+                    mixed.add(name)
+        for name in mixed:
+            self.units[name] = None
+
+    def reading(self, node, sensor_name):
+        """Get one node's reading of a sensor.
+
+        :returns: The value, the raw reading if it isn't numeric, or None if
+                  the node doesn't have the sensor.
+        :rtype: float or string
+
+        """
+        if (node, sensor_name) in self.text:
+            return self.text[(node, sensor_name)]
+        value = self.columns[sensor_name][self._index[node]]
+        return None if math.isnan(value) else value
+
+    def readings(self, sensor_name):
+        """Get every node's reading of a sensor, in node order.
+
+        :returns: (node, reading, units) tuples, for the nodes that have the
+                  sensor. Non-numeric readings come back as the raw string,
+                  with empty units.
+        :rtype: list
+
+        """
+        column = self.columns[sensor_name]
+        readings = []
+        for i, node in enumerate(self.nodes):
+            if (node, sensor_name) in self.text:
+                readings.append((node, self.text[(node, sensor_name)], ""))
+            elif not math.isnan(column[i]):
+                readings.append((node, column[i],
+                                 self._units[(node, sensor_name)]))
+        return readings
+
+    def is_uniform(self, sensor_name):
+        """Check that every reading of a sensor is numeric, in one unit.
+
+        Statistics over readings in different units, or with gaps where a
+        node reported something like "No Reading", would be misleading.
+
+        :rtype: boolean
+
+        """
+        return (self.units.get(sensor_name) is not None and
+                not any(name == sensor_name for _, name in self.text))
+
+    def statistics(self, sensor_name, percentiles=(50, 90, 99),
+                   threshold=3.0, nodes=None):
+        """Summarize a sensor across nodes.
+
+        The readings are sorted once: count, min, max and percentiles
+        (nearest-rank) come straight from the sorted list, and the sums from
+        builtins, with no per-reading Python code. Nodes whose reading is
+        more than threshold standard deviations from the mean are flagged as
+        outliers; that takes a scan only if min or max is out of bounds.
+
+        :param percentiles: Percentiles to compute, 0-100.
+        :type percentiles: tuple
+        :param threshold: Outlier threshold, in standard deviations.
+        :type threshold: float
+        :param nodes: Only these nodes. Default: all nodes.
+        :type nodes: list
+
+        :returns: Dictionary with count, min, max, mean, stddev,
+                  percentiles and outliers. Values are None if there are no
+                  readings.
+        :rtype: dictionary
+
+        """
+        indices = None
+        if nodes is not None:
+            indices = sorted(self._index[x] for x in nodes
+                             if x in self._index)
+        return self._statistics(sensor_name, indices, percentiles,
+                                threshold)
+
+    def _statistics(self, sensor_name, indices, percentiles=(50, 90, 99),
+                    threshold=3.0):
+        """Summarize a sensor over the nodes at these indices (None for
+        all of them). See statistics().
+        """
+        column = self.columns[sensor_name]
+        if indices is not None:
+            column = [column[i] for i in indices]
+        # NaN is the only value that isn't equal to itself
+        values = sorted(x for x in column if x == x)
+        count = len(values)
+        if not count:
+            return {"count": 0, "min": None, "max": None, "mean": None,
+                    "stddev": None,
+                    "percentiles": dict((p, None) for p in percentiles),
+                    "outliers": []}
+
+        mean = math.fsum(values) / count
+        squares = math.fsum(map(operator.mul, values, values))
+        stddev = math.sqrt(max(squares / count - mean * mean, 0.0))
+        low = mean - threshold * stddev
+        high = mean + threshold * stddev
+        outliers = []
+        if stddev > 0 and (values[0] < low or values[-1] > high):
+            if indices is None:
+                indices = range(len(self.nodes))
+            outliers = [self.nodes[i] for i, value in zip(indices, column)
+                        if value < low or value > high]
+        return {
+            "count": count, "min": values[0], "max": values[-1],
+            "mean": mean, "stddev": stddev,
+            "percentiles": dict(
+                (p, nearest_rank(values, p)) for p in percentiles
+            ),
+            "outliers": outliers
+        }
+
+    def rollup(self, sensor_name, key, **kwargs):
+        """Summarize a sensor per group of nodes (e.g. per slot or chassis).
+
+        >>> matrix.rollup('Node Power', lambda node: node.chassis_id)
+
+        :param key: Function mapping a node to its group.
+        :type key: function
+
+        :returns: Statistics (see statistics()) keyed by group.
+        :rtype: dictionary
+
+        """
+        groups = OrderedDict()
+        for i, node in enumerate(self.nodes):
+            groups.setdefault(key(node), []).append(i)
+        return OrderedDict(
+            (group, self._statistics(sensor_name, indices, **kwargs))
+            for group, indices in groups.iteritems()
+        )
+
+    def rollup_by_slot(self, sensor_name, **kwargs):
+        """Summarize a sensor per slot. See rollup().
+
+        >>> matrix.rollup_by_slot('Node Power')
+
+        :returns: Statistics (see statistics()) keyed by slot.
+        :rtype: dictionary
+
+        """
+        return self.rollup(
+            sensor_name,
+            lambda node: node_slot(getattr(node, "node_id", node)),
+            **kwargs
+        )
+
+    def as_dict(self, labels=None, **kwargs):
+        """Get readings and statistics as a JSON-ready dictionary.
+
+        :param labels: Strings to use for nodes. Default: str(node).
+        :type labels: dictionary
+
+        :returns: Readings, units and statistics, keyed by sensor name.
+        :rtype: dictionary
+
+        """
+        label = lambda node: (labels or {}).get(node, str(node))
+        output = OrderedDict()
+        for name in self.sensors:
+            if self.is_uniform(name):
+                stats = self.statistics(name, **kwargs)
+                stats["percentiles"] = OrderedDict(
+                    (str(p), v)
+                    for p, v in sorted(stats["percentiles"].iteritems())
+                )
+                stats["outliers"] = [label(x) for x in stats["outliers"]]
+            else:
+                stats = None
+            output[name] = OrderedDict([
+                ("units", self.units.get(name)),
+                ("readings", OrderedDict(
+                    (label(node), value)
+                    for node, value, _ in self.readings(name)
+                )),
+                ("statistics", stats)
+            ])
+        return output
+
+    def rows(self, labels=None):
+        """Get the readings as flat rows, one per node and sensor.
+
+        :param labels: Strings to use for nodes. Default: str(node).
+        :type labels: dictionary
+
+        :returns: (node, sensor, value, units) tuples.
+        :rtype: list
+
+        """
+        return [((labels or {}).get(node, str(node)), name, value, units)
+                for name in self.sensors
+                for node, value, units in self.readings(name)]
+
+
+# End of file: ./aggregate.py
@@ -32,11 +32,18 @@
 
 import sys
 import time
+from itertools import chain
+from collections import OrderedDict
 
 from cxmanage_api.tftp import InternalTftp, ExternalTftp
 from cxmanage_api.node import Node
 from cxmanage_api.tasks import TaskQueue
-from cxmanage_api.cx_exceptions import TftpException
+from cxmanage_api.rmcp import DEFAULT_PINGER
+from cxmanage_api.discovery import Discovery, iter_ip_range, iter_cidr
+from cxmanage_api.topology import TopologyCache, DEFAULT_TTL
+from cxmanage_api.ipmishell import IpmitoolShellPool
+from cxmanage_api.sdrcache import SdrCache
+from cxmanage_api.cx_exceptions import TftpException, TimeoutError
 
 
 COMPONENTS = [
@@ -94,10 +101,6 @@ def get_tftp(args):
 # pylint: disable=R0912
 def get_nodes(args, tftp, verify_prompt=False):
     """Get nodes"""
-    hosts = []
-    for entry in args.hostname.split(','):
-        hosts.extend(parse_host_entry(entry))
-
     credentials = {
         "ecme_username": args.user,
         "ecme_password": args.password,
@@ -105,34 +108,82 @@ def get_nodes(args, tftp, verify_prompt=False):
         "linux_password": args.linux_password
     }
 
-    nodes = [
-        Node(
-            ip_address=x, credentials=credentials, tftp=tftp,
-            ecme_tftp_port=args.ecme_tftp_port, verbose=args.verbose
-        )
-        for x in hosts
-    ]
+    node_kwargs = {}
+    if getattr(args, "ipmitool_shell", False):
+        node_kwargs["ipmitool_pool"] = IpmitoolShellPool()
+    if getattr(args, "sdr_cache", None):
+        node_kwargs["sdr_cache"] = SdrCache(directory=args.sdr_cache)
+
+    if getattr(args, "discover", False):
+        nodes = discover_nodes(args, tftp, credentials, **node_kwargs)
+    else:
+        hosts = []
+        for entry in args.hostname.split(','):
+            hosts.extend(parse_host_entry(entry))
+
+        nodes = [
+            Node(
+                ip_address=x, credentials=credentials, tftp=tftp,
+                ecme_tftp_port=args.ecme_tftp_port, verbose=args.verbose,
+                **node_kwargs
+            )
+            for x in hosts
+        ]
 
     if args.all_nodes:
         if not args.quiet:
             print("Getting IP addresses...")
 
-        results, errors = run_command(
-            args, nodes, "get_fabric_ipinfo", args.force
-        )
-
-        all_nodes = []
-        for node in nodes:
-            if node in results:
-                for node_id, ip_address in sorted(results[node].iteritems()):
+        topology_cache = None
+        if getattr(args, "topology_cache", None):
+            topology_cache = TopologyCache(
+                filename=args.topology_cache,
+                ttl=getattr(args, "topology_cache_ttl", DEFAULT_TTL)
+            )
+        # Still record what we read, but don't trust what's cached
+        refresh = getattr(args, "refresh_topology", False)
+
+        # Query every host we know nothing about, plus one ECME per cached
+        # fabric, all in parallel (up to args.threads). Another round only
+        # happens for cached fabrics whose ECME failed.
+        all_nodes = OrderedDict()
+        guids = set()
+        errors = {}
+        if getattr(args, "skip_unreachable", False):
+            errors = _ping_nodes(nodes)
+
+        pending = [x for x in nodes if x not in errors]
+        while pending:
+            wave = _fabric_wave(pending, None if refresh else topology_cache)
+            results, wave_errors = run_command(
+                args, wave, _get_topology, args.force, topology_cache,
+                refresh
+            )
+            errors.update(wave_errors)
+            for node in wave:
+                if node not in results:
+                    continue
+                for node_id, (ip_address, guid) in sorted(
+                        results[node].iteritems()):
+                    if ip_address in all_nodes or guid in guids:
+                        continue
                     new_node = Node(
                         ip_address=ip_address, credentials=credentials,
                         tftp=tftp, ecme_tftp_port=args.ecme_tftp_port,
-                        verbose=args.verbose
+                        verbose=args.verbose, **node_kwargs
                     )
                     new_node.node_id = node_id
-                    if not new_node in all_nodes:
-                        all_nodes.append(new_node)
+                    if guid:
+                        new_node.guid = guid
+                        guids.add(guid)
+                    all_nodes[ip_address] = new_node
+            pending = [x for x in pending if x not in wave and
+                       x.ip_address not in all_nodes]
+
+        # A failed host doesn't matter if another host covered its fabric
+        errors = dict((node, err) for node, err in errors.iteritems()
+                      if node.ip_address not in all_nodes)
+        all_nodes = all_nodes.values()
 
         node_strings = get_node_strings(args, all_nodes, justify=False)
         if not args.quiet and all_nodes:
@@ -142,6 +193,7 @@ def get_nodes(args, tftp, verify_prompt=False):
             print
 
         if errors:
+            _print_errors(args, nodes, errors)
             print("ERROR: Failed to get IP addresses. Aborting.\n")
             sys.exit(1)
 
@@ -166,6 +218,84 @@ def get_nodes(args, tftp, verify_prompt=False):
     return nodes
 
 
+def _fabric_wave(nodes, topology_cache=None):
+    """Pick the next hosts to ask for their fabric's layout.
+
+    Hosts in a cached fabric are grouped, and only one per fabric is picked
+    (the one the entry was read from, if it's there). Every host we know
+    nothing about is picked as well.
+    """
+    wave = []
+    fabrics = OrderedDict()
+    for node in nodes:
+        fabric = topology_cache and topology_cache.fabric_of(node.ip_address)
+        if fabric:
+            if node.ip_address == fabric or fabric not in fabrics:
+                fabrics[fabric] = node
+        else:
+            wave.append(node)
+    return fabrics.values() + wave
+
+
+def _get_topology(node, force=False, topology_cache=None, refresh=False):
+    """Get {node_id: (ip_address, guid)} for the fabric this node is in.
+
+    If we have a topology cache, a known fabric costs a single GUID read,
+    unless we're asked to refresh it.
+    """
+    if (topology_cache and not refresh and
+            topology_cache.guid(node.ip_address)):
+        topology = topology_cache.get(node.ip_address, node.guid)
+        if topology:
+            return topology
+
+    ipinfo = node.get_fabric_ipinfo(force)
+    topology = dict((node_id, (ip_address, None))
+                    for node_id, ip_address in ipinfo.iteritems())
+    if topology_cache:
+        topology_cache.record(node.ip_address, node.guid, topology)
+    return topology
+
+
+def discover_nodes(args, tftp, credentials, **node_kwargs):
+    """Sweep the host entries and get nodes for the live ECMEs only.
+
+    Extra keyword arguments are passed on to each Node.
+    """
+    if not args.quiet:
+        print("Discovering nodes...")
+
+    if args.threads != None:
+        task_queue = TaskQueue(threads=args.threads)
+    else:
+        task_queue = TaskQueue()
+
+    discovery = Discovery(
+        task_queue=task_queue, credentials=credentials, tftp=tftp,
+        ecme_tftp_port=args.ecme_tftp_port, verbose=args.verbose,
+        **node_kwargs
+    )
+    entries = chain.from_iterable(
+        _parse_discovery_entry(x) for x in args.hostname.split(',')
+    )
+    nodes = discovery.discover(entries)
+
+    if not nodes:
+        print("ERROR: No nodes answered. Aborting.\n")
+        sys.exit(1)
+    if not args.quiet:
+        print("Found %i nodes.\n" % len(nodes))
+    return nodes
+
+
+def _parse_discovery_entry(entry):
+    """Expand hostfiles, but leave ranges for discovery to expand lazily"""
+    try:
+        return parse_hostfile_entry(entry)
+    except ValueError:
+        return [entry]
+
+
 def get_node_strings(args, nodes, justify=False):
     """ Get string representations for the nodes. """
     if args.ids:
@@ -182,21 +312,31 @@ def get_node_strings(args, nodes, justify=False):
 
 # pylint: disable=R0915
 def run_command(args, nodes, name, *method_args):
-    """Runs a command on nodes."""
+    """Runs a command on nodes. The command is a node method name (which
+    may be dotted, e.g. "bmc.get_info"), or a function that takes the node
+    as its first argument."""
     if args.threads != None:
         task_queue = TaskQueue(threads=args.threads, delay=args.command_delay)
     else:
         task_queue = TaskQueue(delay=args.command_delay)
 
+    results = {}
+    errors = {}
+    if getattr(args, "skip_unreachable", False):
+        errors = _ping_nodes(nodes)
+
     tasks = {}
     for node in nodes:
+        if node in errors:
+            continue
+        if callable(name):
+            tasks[node] = task_queue.put(name, node, *method_args)
+            continue
         target = node
         for member in name.split("."):
             target = getattr(target, member)
         tasks[node] = task_queue.put(target, *method_args)
 
-    results = {}
-    errors = {}
     try:
         counter = 0
         while any(x.is_alive() for x in tasks.values()):
@@ -284,7 +424,10 @@ def parse_host_entry(entry, hostfiles=None):
         try:
             return parse_ip_range_entry(entry)
         except ValueError:
-            return [entry]
+            try:
+                return parse_cidr_entry(entry)
+            except ValueError:
+                return [entry]
 
 
 def parse_hostfile_entry(entry, hostfiles=None):
@@ -320,28 +463,14 @@ def parse_ip_range_entry(entry):
     """ Get a list of ip addresses in a given range"""
     try:
         start, end = entry.split('-')
-
-        # Convert start address to int
-        start_bytes = [int(x) for x in start.split('.')]
-
-        start_i = ((start_bytes[0] << 24) | (start_bytes[1] << 16)
-                | (start_bytes[2] << 8) | (start_bytes[3]))
-
-        # Convert end address to int
-        end_bytes = [int(x) for x in end.split('.')]
-        end_i = ((end_bytes[0] << 24) | (end_bytes[1] << 16)
-                | (end_bytes[2] << 8) | (end_bytes[3]))
-
-        # Get ip addresses in range
-        addresses = []
-        for i in range(start_i, end_i + 1):
-            address_bytes = [(i >> (24 - 8 * x)) & 0xff for x in range(4)]
-            addresses.append('%i.%i.%i.%i' % tuple(address_bytes))
-
-    except (ValueError, IndexError):
+        return list(iter_ip_range(start, end))
+    except ValueError:
         raise ValueError('%s is not an IP range' % entry)
 
-    return addresses
+
+def parse_cidr_entry(entry):
+    """ Get a list of host addresses in a CIDR block"""
+    return list(iter_cidr(entry))
 
 
 def _print_errors(args, nodes, errors):
@@ -364,6 +493,15 @@ def _print_errors(args, nodes, errors):
             )
 
 
+def _ping_nodes(nodes):
+    """ Ping nodes, and return errors for the ones that didn't answer """
+    latencies = DEFAULT_PINGER.sweep(set(x.ip_address for x in nodes))
+    return dict(
+        (x, TimeoutError("Node did not answer an RMCP ping"))
+        for x in nodes if latencies[x.ip_address] is None
+    )
+
+
 def _print_command_status(tasks, counter):
     """ Print the status of a command """
     message = "\r%i successes  |  %i errors  |  %i nodes left  |  %s"
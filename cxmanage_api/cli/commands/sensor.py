@@ -32,60 +32,74 @@
 # DAMAGE.
 
 
+import csv
+import json
+import sys
+
+from cxmanage_api.aggregate import SensorMatrix
 from cxmanage_api.cli import get_tftp, get_nodes, get_node_strings, run_command
 
 # pylint: disable=R0914
 def sensor_command(args):
     """read sensor values from a cluster or host"""
-    tftp = get_tftp(args)
-    nodes = get_nodes(args, tftp)
-
-    if not args.quiet:
-        print "Getting sensor readings..."
-    results, errors = run_command(args, nodes, "get_sensors",
-            args.sensor_name)
-
-    sensors = {}
-    for node in nodes:
-        if node in results:
-            for sensor_name, sensor in results[node].iteritems():
-                if not sensor_name in sensors:
-                    sensors[sensor_name] = []
-
-                reading = sensor.sensor_reading.replace("(+/- 0) ", "")
-                try:
-                    value = float(reading.split()[0])
-                    suffix = reading.lstrip("%f " % value)
-                    sensors[sensor_name].append((node, value, suffix))
-                except ValueError:
-                    sensors[sensor_name].append((node, reading, ""))
+    output_format = getattr(args, "format", "text")
+
+    # With json/csv, stdout carries only the data: status goes to stderr
+    stdout = sys.stdout
+    if output_format != "text":
+        sys.stdout = sys.stderr
+    try:
+        tftp = get_tftp(args)
+        nodes = get_nodes(args, tftp)
+
+        if not args.quiet:
+            print "Getting sensor readings..."
+        results, errors = run_command(args, nodes, "get_sensors",
+                args.sensor_name)
+    finally:
+        sys.stdout = stdout
+
+    matrix = SensorMatrix(results, nodes)
+    if output_format == "json":
+        labels = get_node_strings(args, nodes)
+        print json.dumps({
+            "sensors": matrix.as_dict(labels),
+            "errors": dict((labels[x], str(e)) for x, e in errors.iteritems())
+        }, indent=4)
+    elif output_format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["node", "sensor", "value", "units"])
+        writer.writerows(matrix.rows(get_node_strings(args, nodes)))
+    else:
+        _print_text(args, matrix, results)
 
+    if not args.quiet and errors:
+        status = sys.stdout if output_format == "text" else sys.stderr
+        print >> status, "Some errors occured during the command.\n"
+
+    return len(errors) > 0
+
+
+def _print_text(args, matrix, results):
+    """Print each sensor's readings, then min/max/average if they're all
+    numbers in the same units."""
     node_strings = get_node_strings(args, results, justify=True)
     if node_strings:
         jsize = len(node_strings.itervalues().next())
-    for sensor_name, readings in sensors.iteritems():
+    for sensor_name in matrix.sensors:
         print sensor_name
 
-        for node, reading, suffix in readings:
-            try:
+        for node, reading, suffix in matrix.readings(sensor_name):
+            if isinstance(reading, float):
                 print "%s: %.2f %s" % (node_strings[node], reading, suffix)
-            except TypeError:
+            else:
                 print "%s: %s" % (node_strings[node], reading)
 
-        try:
-            if all(suffix == x[2] for x in readings):
-                minimum = min(x[1] for x in readings)
-                maximum = max(x[1] for x in readings)
-                average = sum(x[1] for x in readings) / len(readings)
-                print "%s: %.2f %s" % ("Minimum".ljust(jsize), minimum, suffix)
-                print "%s: %.2f %s" % ("Maximum".ljust(jsize), maximum, suffix)
-                print "%s: %.2f %s" % ("Average".ljust(jsize), average, suffix)
-        except TypeError:
-            pass
+        if matrix.is_uniform(sensor_name):
+            stats = matrix.statistics(sensor_name)
+            suffix = matrix.units[sensor_name]
+            for label, key in [("Minimum", "min"), ("Maximum", "max"),
+                               ("Average", "mean")]:
+                print "%s: %.2f %s" % (label.ljust(jsize), stats[key], suffix)
 
         print
-
-    if not args.quiet and errors:
-        print "Some errors occured during the command.\n"
-
-    return len(errors) > 0
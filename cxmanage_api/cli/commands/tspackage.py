@@ -53,6 +53,13 @@ import cxmanage_api
 from cxmanage_api.cli import get_tftp, get_nodes, run_command, COMPONENTS
 
 
+# BMC reads the collectors below make, batched into one ipmitool exec per node
+TSPACKAGE_READS = [
+    "get_info_basic", "get_firmware_info", "get_info_card",
+    "pmic_get_version", "lan_print", "sdr_list", "sel_elist"
+]
+
+
 def tspackage_command(args):
     """Get information pertaining to each node.
     This includes:
@@ -89,6 +96,10 @@ def tspackage_command(args):
 
     write_client_info()
 
+    if not quiet:
+        print("Collecting IPMI data...")
+    run_command(args, nodes, "prefetch", TSPACKAGE_READS)
+
     if not quiet:
         print("Getting version information...")
     write_version_info(args, nodes)
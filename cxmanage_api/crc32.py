@@ -32,8 +32,13 @@
 """
 This is a python implementation of freebsd's ssh/crc32.c.
 Written in python for convenient use in the cxmanage script.
+
+The table is kept for reference; get_crc32 uses zlib, which computes the
+same checksum in C.
 """
 
+import zlib
+
 TABLE = [0x00000000, 0x77073096, 0xee0e612c, 0x990951ba,
         0x076dc419, 0x706af48f, 0xe963a535, 0x9e6495a3,
         0x0edb8832, 0x79dcb8a4, 0xe0d5e91e, 0x97d2d988,
@@ -117,10 +122,9 @@ def get_crc32(string, crc=0):
     :type crc: integer
 
     """
-    for char in string:
-        byte = ord(char)
-        crc = TABLE[(crc ^ byte) & 0xff] ^ (crc >> 8)
-    return crc
+    # zlib inverts the register on the way in and out, we don't.
+    crc = zlib.crc32(string, crc ^ 0xFFFFFFFF) & 0xFFFFFFFF
+    return crc ^ 0xFFFFFFFF
 
 
 # End of file: ./crc32.py
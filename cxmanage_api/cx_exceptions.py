@@ -378,6 +378,32 @@ class CommandFailedError(Exception):
         return str(dict((x, str(y)) for x, y in self.errors.iteritems()))
 
 
+class DeadlineExceededError(CommandFailedError):
+    """Raised when some nodes didn't finish a command before the deadline.
+
+    >>> from cxmanage_api.cx_exceptions import DeadlineExceededError
+    >>> try:
+    ...     fabric.get_power()
+    ... except DeadlineExceededError as err:
+    ...     print err.results, err.stragglers
+    {0: False, 1: False, 2: False} [3]
+
+    :param results: Results from the nodes that finished in time.
+    :type results: dictionary
+    :param errors: Command errors, including a TimeoutError per straggler.
+    :type errors: dictionary
+    :param stragglers: IDs of the nodes that didn't finish in time.
+    :type stragglers: list
+    :raised: When a fabric command deadline passes.
+
+    """
+
+    def __init__(self, results, errors, stragglers):
+        """Default constructor for the DeadlineExceededError class."""
+        super(DeadlineExceededError, self).__init__(results, errors)
+        self.stragglers = stragglers
+
+
 class PartitionInUseError(Exception):
     """Raised when trying to upload to a CDB/BOOT_LOG partition that's in use.
 
@@ -428,6 +454,32 @@ class IPDiscoveryError(Exception):
         return self.msg
 
 
+class CircuitOpenError(Exception):
+    """Raised when a node's circuit breaker is open, so we fail fast instead
+    of talking to a node that keeps failing.
+
+    >>> from cxmanage_api.cx_exceptions import CircuitOpenError
+    >>> raise CircuitOpenError('My custom exception text!')
+    Traceback (most recent call last):
+      File "<stdin>", line 1, in <module>
+    cxmanage_api.cx_exceptions.CircuitOpenError: My custom exception text!
+
+    :param msg: Exceptions message and details to return to the user.
+    :type msg: string
+    :raised: When a command is attempted while the circuit breaker is open.
+
+    """
+
+    def __init__(self, msg):
+        """Default constructor for the CircuitOpenError class."""
+        super(CircuitOpenError, self).__init__()
+        self.msg = msg
+
+    def __str__(self):
+        """String representation of this Exception class."""
+        return self.msg
+
+
 class ParseError(Exception):
     """Raised when there's an error parsing some output"""
     pass
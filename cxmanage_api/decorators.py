@@ -32,38 +32,205 @@
 
 """ Decorators used in cxmanage_api """
 
+import time
+import random
 from functools import wraps
+from threading import Lock, local
 
+from cxmanage_api.cx_exceptions import CircuitOpenError
 
-def retry(count, allowed_errors=Exception):
+
+def _error_tuple(errors):
+    """ Turn an exception type or iterable of types into a tuple """
+    try:
+        return tuple(errors)
+    except TypeError:
+        return (errors,)
+
+
+# pylint: disable=R0913
+def retry(count, allowed_errors=Exception, delay=0, backoff=2,
+          max_delay=None, jitter=0, budget=None):
     """ Create a decorator that retries a function call up to 'count' times.
 
+    Between attempts, wait 'delay' seconds, multiplied by 'backoff' after each
+    attempt (up to 'max_delay') and randomized by +/- 'jitter' (a fraction).
+    If a 'budget' is given, stop retrying once another wait would take us
+    past it, and make one last attempt.
+
     :param count: Max retry count
     :type count: integer
     :param allowed_errors: Types of errors to allow
     :type allowed_errors: Exception or iterable
+    :param delay: Seconds to wait before the first retry
+    :type delay: float
+    :param backoff: Multiplier applied to the delay after each retry
+    :type backoff: float
+    :param max_delay: Largest delay between retries, in seconds
+    :type max_delay: float
+    :param jitter: Fraction of each delay to randomize by
+    :type jitter: float
+    :param budget: Total seconds to spend retrying
+    :type budget: float
 
     :return: Function decorator that retries the wrapped function
     :rtype: function
 
     """
-    try:
-        allowed_errors = tuple(allowed_errors)
-    except TypeError:
-        allowed_errors = (allowed_errors,)
+    allowed_errors = _error_tuple(allowed_errors)
 
     def decorator(function):
         """ The decorator """
         @wraps(function)
         def wrapper(*args, **kwargs):
             """ The wrapper function """
+            start = time.time()
+            wait = delay
             for _ in range(count):
                 try:
                     return function(*args, **kwargs)
-                except tuple(allowed_errors):
+                except allowed_errors:
                     pass
-            else:
-                return function(*args, **kwargs)
+
+                if wait > 0:
+                    sleep_time = wait * random.uniform(1 - jitter, 1 + jitter)
+                    if (budget is not None and
+                            time.time() - start + sleep_time > budget):
+                        break
+                    time.sleep(sleep_time)
+                    wait *= backoff
+                    if max_delay is not None:
+                        wait = min(wait, max_delay)
+                elif budget is not None and time.time() - start > budget:
+                    break
+
+            return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class CircuitBreaker(object):
+    """ Tracks failures for one target, and fails fast once it looks dead.
+
+    After 'threshold' consecutive failures the breaker opens, and calls raise
+    CircuitOpenError without touching the target. After 'cooldown' seconds
+    one trial call is let through: success closes the breaker, failure opens
+    it for another cooldown.
+
+    >>> from cxmanage_api.decorators import CircuitBreaker
+    >>> breaker = CircuitBreaker(threshold=5, cooldown=30)
+    >>> breaker.call(node.bmc.get_chassis_status)
+
+    :param threshold: Consecutive failures before the breaker opens
+    :type threshold: integer
+    :param cooldown: Seconds to stay open before trying again
+    :type cooldown: float
+    :param name: Name to use in error messages
+    :type name: string
+
+    """
+
+    def __init__(self, threshold=5, cooldown=30, name="target"):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.name = name
+
+        self.failures = 0
+        self.opened_at = None
+
+        self._lock = Lock()
+        self._local = local()
+
+    @property
+    def is_open(self):
+        """ Whether calls are currently being refused
+
+        :return: True if the breaker is open and still cooling down
+        :rtype: boolean
+
+        """
+        with self._lock:
+            return (self.opened_at is not None and
+                    time.time() - self.opened_at < self.cooldown)
+
+    def reset(self):
+        """ Close the breaker and forget past failures """
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def call(self, function, errors, *args, **kwargs):
+        """ Call a function through the breaker.
+
+        Nested calls on the same thread only count once, so a method that
+        calls other guarded methods isn't charged for each of them.
+
+        :param function: Function to call
+        :type function: function
+        :param errors: Errors that count as failures
+        :type errors: tuple
+
+        :return: Whatever the function returns
+
+        :raises CircuitOpenError: If the breaker is open
+
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth > 0:
+            return function(*args, **kwargs)
+
+        with self._lock:
+            if self.opened_at is not None:
+                if time.time() - self.opened_at < self.cooldown:
+                    raise CircuitOpenError(
+                        "Too many failures on %s, not retrying for %i seconds"
+                        % (self.name,
+                           self.cooldown - (time.time() - self.opened_at))
+                    )
+                # Half open: let this call through as a trial
+                self.opened_at = time.time()
+
+        self._local.depth = 1
+        try:
+            result = function(*args, **kwargs)
+        except errors:
+            with self._lock:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.time()
+            raise
+        finally:
+            self._local.depth = 0
+
+        self.reset()
+        return result
+
+
+def breaker(errors=Exception):
+    """ Create a decorator that runs a method through self.breaker.
+
+    Methods without a breaker on their instance run unguarded.
+
+    :param errors: Types of errors that count as failures
+    :type errors: Exception or iterable
+
+    :return: Function decorator that guards the wrapped method
+    :rtype: function
+
+    """
+    errors = _error_tuple(errors)
+
+    def decorator(function):
+        """ The decorator """
+        @wraps(function)
+        def wrapper(self, *args, **kwargs):
+            """ The wrapper function """
+            circuit = getattr(self, "breaker", None)
+            if circuit is None:
+                return function(self, *args, **kwargs)
+            return circuit.call(function, errors, self, *args, **kwargs)
 
         return wrapper
 
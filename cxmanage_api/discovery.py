@@ -0,0 +1,248 @@
+"""Calxeda: discovery.py"""
+
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+
+import socket
+import struct
+
+from cxmanage_api.rmcp import DEFAULT_PINGER
+from cxmanage_api.tasks import DEFAULT_TASK_QUEUE
+from cxmanage_api.node import Node as NODE
+
+
+def ip_to_int(address):
+    """Convert a dotted IPv4 address to an integer.
+
+    :raises ValueError: If this isn't a dotted-quad IPv4 address.
+
+    """
+    # inet_aton also takes short forms like "5" (0.0.0.5); we don't
+    if address.count(".") != 3:
+        raise ValueError("%s is not an IP address" % address)
+    try:
+        return struct.unpack("!I", socket.inet_aton(address))[0]
+    except socket.error:
+        raise ValueError("%s is not an IP address" % address)
+
+
+def int_to_ip(value):
+    """Convert an integer to a dotted IPv4 address."""
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+
+def iter_ip_range(start, end):
+    """Lazily generate every address from start to end, inclusive.
+
+    >>> from cxmanage_api.discovery import iter_ip_range
+    >>> list(iter_ip_range('10.20.1.9', '10.20.1.11'))
+    ['10.20.1.9', '10.20.1.10', '10.20.1.11']
+
+    :param start: First address.
+    :type start: string
+    :param end: Last address.
+    :type end: string
+
+    :returns: Generator of IP addresses.
+    :rtype: generator
+
+    :raises ValueError: If either end isn't an IPv4 address, or the range
+                        ends before it starts.
+
+    """
+    start_i, end_i = ip_to_int(start), ip_to_int(end)
+    if end_i < start_i:
+        raise ValueError("%s comes before %s" % (end, start))
+    return (int_to_ip(x) for x in xrange(start_i, end_i + 1))
+
+
+def iter_cidr(network):
+    """Lazily generate the host addresses in a CIDR block.
+
+    The network and broadcast addresses are skipped, except for /31 and /32
+    blocks which have none.
+
+    >>> from cxmanage_api.discovery import iter_cidr
+    >>> list(iter_cidr('10.20.1.8/30'))
+    ['10.20.1.9', '10.20.1.10']
+
+    :param network: Block in address/prefix form.
+    :type network: string
+
+    :returns: Generator of IP addresses.
+    :rtype: generator
+
+    :raises ValueError: If this isn't a CIDR block.
+
+    """
+    try:
+        address, prefix = network.split("/")
+        prefix = int(prefix)
+    except ValueError:
+        raise ValueError("%s is not a CIDR block" % network)
+    if not 0 <= prefix <= 32:
+        raise ValueError("%s is not a CIDR block" % network)
+
+    mask = (0xffffffff << (32 - prefix)) & 0xffffffff
+    first = ip_to_int(address) & mask
+    last = first | (~mask & 0xffffffff)
+    if prefix < 31:
+        first, last = first + 1, last - 1
+    return (int_to_ip(x) for x in xrange(first, last + 1))
+
+
+def iter_hosts(entry):
+    """Lazily expand a host entry: a CIDR block, a range, or a single host.
+
+    >>> from cxmanage_api.discovery import iter_hosts
+    >>> list(iter_hosts('10.20.1.9-10.20.1.10'))
+    ['10.20.1.9', '10.20.1.10']
+
+    :param entry: The host entry.
+    :type entry: string
+
+    :returns: Generator of hosts.
+    :rtype: generator
+
+    """
+    if "/" in entry:
+        return iter_cidr(entry)
+    elif "-" in entry:
+        try:
+            start, end = entry.split("-")
+            return iter_ip_range(start, end)
+        except ValueError:
+            pass
+    return iter([entry])
+
+
+class Discovery(object):
+    """Finds live ECMEs on a management network.
+
+    Host entries are expanded lazily and swept with RMCP presence pings a
+    window at a time, so a /22 costs a couple of rounds of pings rather than
+    a thousand IPMI timeouts. Optionally, each live address is confirmed by
+    asking for its system GUID, and addresses that answer with the same
+    GUID are collapsed to one node.
+
+    >>> from cxmanage_api.discovery import Discovery
+    >>> discovery = Discovery()
+    >>> discovery.discover(['10.20.1.0/24'])
+    [<cxmanage_api.node.Node object at 0x...>, ...]
+
+    :param pinger: RMCP pinger used for the sweep.
+    :type pinger: `RmcpPinger <rmcp.html>`_
+    :param task_queue: Task queue used to confirm nodes.
+    :type task_queue: `TaskQueue <tasks.html>`_
+    :param node: Node type, for dependency injection.
+    :type node: `Node <node.html>`_
+    :param node_kwargs: Extra arguments for each Node, e.g. credentials.
+    :type node_kwargs: dictionary
+
+    """
+
+    def __init__(self, pinger=None, task_queue=None, node=None,
+                 **node_kwargs):
+        """Default constructor for the Discovery class."""
+        self.pinger = pinger
+        self.task_queue = task_queue
+        self.node = node
+        self.node_kwargs = node_kwargs
+
+        if (not self.pinger):
+            self.pinger = DEFAULT_PINGER
+
+        if (not self.task_queue):
+            self.task_queue = DEFAULT_TASK_QUEUE
+
+        if (not self.node):
+            self.node = NODE
+
+    def iter_alive(self, entries):
+        """Sweep host entries, yielding the addresses that answered.
+
+        Duplicate addresses across entries are only pinged once.
+
+        >>> list(discovery.iter_alive(['10.20.1.0/24']))
+        [('10.20.1.9', 0.0012), ('10.20.1.10', 0.0009)]
+
+        :param entries: Host entries (CIDR blocks, ranges or hosts).
+        :type entries: iterable
+
+        :returns: Generator of (IP address, round trip time) tuples.
+        :rtype: generator
+
+        """
+        seen = set()
+
+        def hosts():
+            """Yield each host once, across all entries."""
+            for entry in entries:
+                for host in iter_hosts(entry):
+                    if host not in seen:
+                        seen.add(host)
+                        yield host
+
+        return self.pinger.iter_alive(hosts())
+
+    def discover(self, entries, confirm=True):
+        """Get a Node for every live ECME in the given host entries.
+
+        :param entries: Host entries (CIDR blocks, ranges or hosts).
+        :type entries: iterable
+        :param confirm: Ask each live address for its GUID, dropping the ones
+                        that don't answer and collapsing duplicates.
+        :type confirm: boolean
+
+        :returns: Nodes, in the order they were found.
+        :rtype: list
+
+        """
+        nodes = [self.node(ip_address=host, **self.node_kwargs)
+                 for host, _ in self.iter_alive(entries)]
+        if not confirm:
+            return nodes
+
+        tasks = [(node, self.task_queue.put(lambda n: n.guid, node))
+                 for node in nodes]
+        confirmed = []
+        guids = set()
+        for node, task in tasks:
+            task.join()
+            if task.status == "Completed" and not task.result in guids:
+                guids.add(task.result)
+                confirmed.append(node)
+        return confirmed
+
+
+# End of file: ./discovery.py
@@ -0,0 +1,273 @@
+"""Calxeda: energy.py"""
+
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import os
+import time
+import json
+from threading import Lock
+
+from cxmanage_api import atomic_write
+from cxmanage_api.poller import SensorPoller
+from cxmanage_api.topology import node_slot
+
+
+JOULES_PER_KWH = 3600000.0
+
+
+class EnergyMeter(object):
+    """Accounts the energy used by a fabric's nodes.
+
+    Only the power sensor is read on each poll. Each node's readings are
+    integrated as they arrive (trapezoidal rule), so nothing but the total
+    and the last reading is kept per node. Intervals longer than max_gap
+    (missed polls, unreachable nodes, downtime) aren't integrated; they're
+    counted as unaccounted time instead, and can be estimated from the
+    node's average power on request.
+
+    With a filename, the totals are checkpointed every save_interval
+    seconds and on stop(), and loaded again on construction, so restarts
+    keep the accumulated energy. A restart shorter than max_gap doesn't
+    even leave a gap.
+
+    >>> from cxmanage_api.energy import EnergyMeter
+    >>> meter = EnergyMeter(fabric, filename='energy.json')
+    >>> meter.start()
+    >>> meter.by_node()
+    {0: 1.52, 1: 1.49, 2: 1.61, 3: 1.50, 4: 0.98, ...}
+    >>> meter.by_slot()
+    {0: 6.12, 1: 4.07, ...}
+    >>> meter.total()
+    10.19
+    >>> meter.stop()
+
+    :param fabric: Fabric to meter.
+    :type fabric: `Fabric <fabric.html>`_
+    :param filename: Checkpoint file. Default: keep totals in memory only.
+    :type filename: string
+    :param sensor: Name of the power sensor, reading in Watts.
+    :type sensor: string
+    :param interval: Seconds between polls.
+    :type interval: float
+    :param max_gap: Longest interval, in seconds, to integrate across.
+    :type max_gap: float
+    :param save_interval: Seconds between checkpoints.
+    :type save_interval: float
+    :param slot_of: Function mapping a node ID to its slot.
+                    Default: topology.node_slot
+    :type slot_of: function
+
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, fabric, filename=None, sensor="Node Power",
+                 interval=10, max_gap=60, save_interval=300,
+                 slot_of=node_slot):
+        """Default constructor for the EnergyMeter class."""
+        self.fabric = fabric
+        self.filename = filename
+        self.sensor = sensor
+        self.max_gap = max_gap
+        self.save_interval = save_interval
+        self.slot_of = slot_of
+        self.poller = SensorPoller(fabric, sensors=[sensor],
+                                   interval=interval, size=1, store=self)
+
+        self._lock = Lock()
+        self._nodes = {}
+        self._saved = time.time()
+
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def start(self):
+        """Start polling in a background thread."""
+        self.poller.start()
+
+    def stop(self):
+        """Stop polling, and checkpoint."""
+        self.poller.stop()
+
+    def poll(self):
+        """Read the power sensors once, and account for the readings.
+
+        :returns: Number of readings recorded.
+        :rtype: integer
+
+        """
+        return self.poller.poll()
+
+    def add(self, node_id, timestamp, watts):
+        """Account for one power reading.
+
+        Readings older than the node's last one are ignored.
+
+        :param node_id: Node ID.
+        :type node_id: integer
+        :param timestamp: Time of the reading.
+        :type timestamp: float
+        :param watts: Power drawn.
+        :type watts: float
+
+        """
+        with self._lock:
+            entry = self._nodes.get(node_id)
+            if entry is None:
+                self._nodes[node_id] = {"joules": 0.0, "covered": 0.0,
+                                        "gaps": 0.0,
+                                        "last": (timestamp, watts)}
+                return
+            last_timestamp, last_watts = entry["last"]
+            elapsed = timestamp - last_timestamp
+            if elapsed <= 0:
+                return
+            if elapsed <= self.max_gap:
+                entry["joules"] += (last_watts + watts) / 2.0 * elapsed
+                entry["covered"] += elapsed
+            else:
+                entry["gaps"] += elapsed
+            entry["last"] = (timestamp, watts)
+
+    def append(self, timestamp, samples):
+        """Account for one poll's readings (the SensorPoller store hook).
+
+        :param timestamp: Time of the poll.
+        :type timestamp: float
+        :param samples: Values keyed by (node_id, sensor_name).
+        :type samples: dictionary
+
+        """
+        for (node_id, name), value in samples.iteritems():
+            if name == self.sensor:
+                self.add(node_id, timestamp, value)
+        if self.filename and time.time() - self._saved >= self.save_interval:
+            self.save()
+
+    def flush(self):
+        """Checkpoint, if we have a file."""
+        if self.filename:
+            self.save()
+
+    def by_node(self, estimate=False):
+        """Get the energy used by each node.
+
+        :param estimate: Include an estimate for unaccounted time, at the
+                         node's average power.
+        :type estimate: boolean
+
+        :returns: kWh keyed by node ID.
+        :rtype: dictionary
+
+        """
+        with self._lock:
+            return dict((node_id, self._joules(entry, estimate) /
+                         JOULES_PER_KWH)
+                        for node_id, entry in self._nodes.iteritems())
+
+    def by_slot(self, estimate=False):
+        """Get the energy used by the nodes in each slot.
+
+        :returns: kWh keyed by slot.
+        :rtype: dictionary
+
+        """
+        slots = {}
+        for node_id, energy in self.by_node(estimate).iteritems():
+            slot = self.slot_of(node_id)
+            slots[slot] = slots.get(slot, 0.0) + energy
+        return slots
+
+    def total(self, estimate=False):
+        """Get the energy used by the whole fabric.
+
+        :returns: kWh.
+        :rtype: float
+
+        """
+        return sum(self.by_node(estimate).itervalues())
+
+    def unaccounted(self):
+        """Get the time not integrated for each node, because of gaps.
+
+        :returns: Seconds keyed by node ID.
+        :rtype: dictionary
+
+        """
+        with self._lock:
+            return dict((node_id, entry["gaps"])
+                        for node_id, entry in self._nodes.iteritems())
+
+    def reset(self):
+        """Zero the totals, e.g. at the start of a billing period. The last
+        readings are kept, so integration carries on without a gap."""
+        with self._lock:
+            for entry in self._nodes.itervalues():
+                entry.update(joules=0.0, covered=0.0, gaps=0.0)
+
+    def load(self):
+        """Load totals from our file, skipping any that are malformed."""
+        try:
+            nodes = json.load(open(self.filename))["nodes"]
+        except (IOError, ValueError, KeyError, TypeError):
+            return
+
+        with self._lock:
+            for node_id, entry in nodes.iteritems():
+                try:
+                    last_timestamp, last_watts = entry["last"]
+                    self._nodes[int(node_id)] = {
+                        "joules": float(entry["joules"]),
+                        "covered": float(entry["covered"]),
+                        "gaps": float(entry["gaps"]),
+                        "last": (float(last_timestamp), float(last_watts))
+                    }
+                except (KeyError, TypeError, ValueError):
+                    pass
+
+    def save(self):
+        """Write totals to our file. The write is atomic."""
+        with self._lock:
+            data = json.dumps({"nodes": self._nodes})
+            self._saved = time.time()
+        atomic_write(self.filename, data)
+
+    @staticmethod
+    def _joules(entry, estimate):
+        """Get a node's energy, optionally filling in its gaps."""
+        joules = entry["joules"]
+        if estimate and entry["covered"]:
+            joules += joules / entry["covered"] * entry["gaps"]
+        return joules
+
+
+# End of file: ./energy.py
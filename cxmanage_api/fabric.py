@@ -38,13 +38,18 @@
 
 import time
 import re
+import hashlib
+from threading import Lock
 
-from cxmanage_api.tasks import DEFAULT_TASK_QUEUE
+from cxmanage_api.tasks import DEFAULT_TASK_QUEUE, failed_task
+from cxmanage_api.rmcp import DEFAULT_PINGER
+from cxmanage_api.wait import DEFAULT_WAIT_SCHEDULE
 from cxmanage_api.tftp import InternalTftp
+from cxmanage_api.topology import node_slot
 from cxmanage_api.node import Node as NODE
 from cxmanage_api.credentials import Credentials
 from cxmanage_api.cx_exceptions import CommandFailedError, IpmiError, \
-    TftpException, ParseError, TimeoutError
+    TftpException, ParseError, TimeoutError, DeadlineExceededError
 
 
 class Fabric(object):
@@ -65,8 +70,45 @@ class Fabric(object):
     :type verbose: boolean
     :param node: Node type, for dependency integration.
     :type node: `Node <node.html>`_
+    :param hedge_policy: Hedge slow read-only commands. Default: no hedging.
+    :type hedge_policy: `HedgePolicy <tasks.html>`_
+    :param deadline: Seconds to wait for all nodes before giving up on the
+                     stragglers, for read-only commands (get_*, is_*).
+                     Commands that write always wait. Default: wait
+                     forever.
+    :type deadline: float
+    :param pinger: RMCP pinger used to check which nodes are alive.
+    :type pinger: `RmcpPinger <rmcp.html>`_
+    :param skip_unreachable: Ping nodes before each command, and don't send
+                             the command to nodes that don't answer.
+    :type skip_unreachable: boolean
+    :param wait_schedule: Polling schedule used by refresh(wait=True).
+                          Default: wait.DEFAULT_WAIT_SCHEDULE
+    :type wait_schedule: `WaitSchedule <wait.html>`_
+    :param topology_cache: Where to remember the fabric layout between runs.
+                           Default: None (always read ipinfo)
+    :type topology_cache: `TopologyCache <topology.html>`_
     """
 
+    # Prefixes of read-only node methods, which a deadline may cut short
+    READ_ONLY_PREFIXES = ("get_", "is_")
+
+    # Read-only node methods that are safe to issue twice
+    HEDGED_METHODS = ["get_power", "get_power_policy", "get_sensors",
+                      "get_versions", "get_firmware_info"]
+
+    # Per-node queries that the primary node can answer for the whole fabric
+    # in a single call: node method -> fabric-wide node method
+    FABRIC_QUERIES = {
+        "get_uplink_info": "get_fabric_uplink_info",
+        "get_mac_addresses": "get_fabric_macaddrs"
+    }
+
+    # Nodes to try a fabric-wide query on before asking each node. Asking
+    # each node can be expensive: get_mac_addresses, for one, dumps the
+    # whole fabric's MACs on every node.
+    FABRIC_QUERY_ATTEMPTS = 2
+
     class CompositeBMC(object):
         """ Composite BMC object. Provides a mechanism to run BMC
         commands in parallel across all nodes.
@@ -116,7 +158,9 @@ class Fabric(object):
 
     def __init__(self, ip_address, credentials=None, tftp=None,
                  ecme_tftp_port=5001, task_queue=None, verbose=False,
-                 node=None):
+                 node=None, hedge_policy=None, deadline=None, pinger=None,
+                 skip_unreachable=False, wait_schedule=None,
+                 topology_cache=None):
         """Default constructor for the Fabric class."""
         self.ip_address = ip_address
         self.credentials = Credentials(credentials)
@@ -125,16 +169,40 @@ class Fabric(object):
         self.task_queue = task_queue
         self.verbose = verbose
         self.node = node
+        self.hedge_policy = hedge_policy
+        self.deadline = deadline
+        self.pinger = pinger
+        self.skip_unreachable = skip_unreachable
+        self.wait_schedule = wait_schedule
+        self.topology_cache = topology_cache
         self.cbmc = Fabric.CompositeBMC(self)
 
         self._nodes = {}
 
+        # Lookup indexes, kept in step with self._nodes by _update_indexes()
+        self._indexed_nodes = None
+        self._index_entries = {}
+        self._guid_index = {}
+        self._ip_index = {}
+        self._slot_index = {}
+        self._mac_index = {}
+        self._node_macs = {}
+
+        # Which path (fabric or fanout) each planned query last took
+        self.query_paths = {}
+
         if (not self.node):
             self.node = NODE
 
         if (not self.task_queue):
             self.task_queue = DEFAULT_TASK_QUEUE
 
+        if (not self.pinger):
+            self.pinger = DEFAULT_PINGER
+
+        if (not self.wait_schedule):
+            self.wait_schedule = DEFAULT_WAIT_SCHEDULE
+
     def __eq__(self, other):
         return (isinstance(other, Fabric) and self.nodes == other.nodes)
 
@@ -185,12 +253,14 @@ class Fabric(object):
 
         .. note::
             * Fabric nodes are lazily initialized.
+            * If the topology cache knows this fabric, and the primary
+              node's GUID still matches, the nodes are loaded from the cache.
 
         :returns: A mapping of node ids to node objects.
         :rtype: dictionary
 
         """
-        if not self._nodes:
+        if not self._nodes and not self._load_topology():
             self.refresh()
 
         return self._nodes
@@ -213,7 +283,23 @@ class Fabric(object):
             return self.nodes["0.0"]
 
     def refresh(self, wait=False, timeout=600):
-        """Gets the nodes of this fabric by pulling IP info from a BMC."""
+        """Gets the nodes of this fabric by pulling IP info from a BMC.
+
+        Nodes that kept their IP address and node ID are reused as-is. GUIDs
+        for the rest are fetched in parallel through the task queue.
+
+        :param wait: Keep trying (backing off between attempts) until at
+                     least as many nodes as before are reported.
+        :type wait: boolean
+        :param timeout: Seconds to keep trying for, if waiting.
+        :type timeout: integer
+
+        :raises TimeoutError: If waiting and the nodes don't come back.
+
+        """
+        self._update_indexes()
+        ip_index = dict(self._ip_index)
+
         def get_nodes():
             """Returns a dictionary of nodes reported by the primary node IP"""
             new_nodes = {}
@@ -223,42 +309,153 @@ class Fabric(object):
                 verbose=self.verbose
             )
             ipinfo = root_node.get_fabric_ipinfo()
+
+            tasks = {}
             for node_id, node_address in ipinfo.items():
+                node = ip_index.get(node_address)
+                if node is not None and node.node_id == node_id:
+                    new_nodes[node_id] = node
+                    continue
                 node = self.node(
                     ip_address=node_address, credentials=self.credentials,
                     tftp=self.tftp, ecme_tftp_port=self.ecme_tftp_port,
                     verbose=self.verbose
                 )
                 node.node_id = node_id
-                new_nodes[node.guid] = node
+                tasks[node] = self.task_queue.put(lambda x: x.guid, node)
+
+            for node, task in tasks.iteritems():
+                task.join()
+                if task.status != "Completed":
+                    raise task.error
+                new_nodes[node.node_id] = node
             return new_nodes
 
         initial_node_count = len(self._nodes)
-        old_nodes = {node.guid: node for node in self._nodes.values()}
 
         if wait:
-            error = TimeoutError(
-                'Timeout after %s seconds occurred.' % timeout
-            )
-            deadline = time.time() + timeout
-            while time.time() < deadline:
+            errors = []
+
+            def condition():
+                """Try to get at least as many nodes as we had before."""
                 try:
                     new_nodes = get_nodes()
-                    if len(new_nodes) >= initial_node_count:
-                        break
                 except (IpmiError, TftpException, ParseError) as err:
-                    error = err
-            else:
-                raise error
+                    errors.append(err)
+                    return None
+                if len(new_nodes) >= initial_node_count:
+                    return [new_nodes]
+
+            try:
+                new_nodes = self.wait_schedule.wait_for(
+                    condition, timeout,
+                    message='Timeout after %s seconds occurred.' % timeout
+                ).result[0]
+            except TimeoutError:
+                if errors:
+                    raise errors[-1]
+                raise
         else:
             new_nodes = get_nodes()
 
-        for guid, node in new_nodes.items():
-            if guid in old_nodes:
-                old_nodes[guid].refresh(node)
-                new_nodes[guid] = old_nodes[guid]
+        # New node objects may be old nodes that moved: match them by GUID
+        old_nodes = set(id(node) for node in self._nodes.itervalues())
+        created = dict((node_id, node) for node_id, node in new_nodes.items()
+                       if id(node) not in old_nodes)
+        if created and old_nodes:
+            self._index_guids()
+            for node_id, node in created.iteritems():
+                old_node = self._guid_index.get(node.guid)
+                if old_node is not None:
+                    old_node.refresh(node)
+                    new_nodes[node_id] = old_node
+
+        self._nodes = new_nodes
+        self._update_indexes()
+        self._save_topology()
+
+    def node_by_guid(self, guid):
+        """Look up a node by its GUID.
+
+        >>> fabric.node_by_guid('99cfa980-2076-11e3-d5c7-76db821cea20')
+        <cxmanage_api.node.Node object at 0x210d790>
+
+        :param guid: GUID of the node.
+        :type guid: string
+
+        GUIDs that nodes don't know yet are read in parallel through the
+        task queue, the first time a lookup misses.
+
+        :return: The node, or None if it isn't in this fabric.
+        :rtype: Node object
+
+        :raises IpmiError: If reading a GUID fails.
+
+        """
+        if self.nodes:
+            self._update_indexes()
+        if guid not in self._guid_index:
+            self._index_guids()
+        return self._guid_index.get(guid)
+
+    def node_by_ip(self, ip_address):
+        """Look up a node by its ECME IP address.
+
+        >>> fabric.node_by_ip('10.20.1.9')
+        <cxmanage_api.node.Node object at 0x210d790>
+
+        :param ip_address: IP address of the node.
+        :type ip_address: string
+
+        :return: The node, or None if it isn't in this fabric.
+        :rtype: Node object
+
+        """
+        if self.nodes:
+            self._update_indexes()
+        return self._ip_index.get(ip_address)
+
+    def nodes_in_slot(self, slot):
+        """Get the nodes in a slot. See topology.node_slot().
+
+        >>> fabric.nodes_in_slot(1)
+        {4: <cxmanage_api.node.Node object at 0x210d790>, 5: ...}
+
+        :param slot: Slot number.
+        :type slot: integer
+
+        :return: Map of node ID to node, empty if nothing is in the slot.
+        :rtype: dictionary
+
+        """
+        if self.nodes:
+            self._update_indexes()
+        return dict(self._slot_index.get(slot, {}))
+
+    def node_by_mac(self, mac_address):
+        """Look up a node by one of its MAC addresses.
+
+        MAC addresses are read from the primary node the first time they're
+        needed, and again only when nodes change.
+
+        >>> fabric.node_by_mac('fc:2f:40:3b:ec:40')
+        <cxmanage_api.node.Node object at 0x210d790>
+
+        :param mac_address: MAC address of any of the node's interfaces.
+        :type mac_address: string
 
-        self._nodes = {node.node_id: node for node in new_nodes.values()}
+        :return: The node, or None if it isn't in this fabric.
+        :rtype: Node object
+
+        :raises IpmiError: If the IPMI command fails.
+        :raises TftpException: If the TFTP transfer fails.
+
+        """
+        if self.nodes:
+            self._update_indexes()
+        if any(x not in self._node_macs for x in self._nodes):
+            self.get_mac_addresses()
+        return self._mac_index.get(mac_address.lower())
 
     def get_mac_addresses(self):
         """Gets MAC addresses from all nodes.
@@ -275,7 +472,13 @@ class Fabric(object):
         :rtype: dictionary
 
         """
-        return self.primary_node.get_fabric_macaddrs()
+        results = self._plan_query(False, "get_mac_addresses")
+        self._index_macs(results)
+        if self.topology_cache:
+            self.topology_cache.record_macs(self.ip_address, dict(
+                (node_id, results.get(node_id, {})) for node_id in self._nodes
+            ))
+        return results
 
     def get_uplink_info(self, async=False):
         """Gets the fabric uplink info.
@@ -294,7 +497,7 @@ class Fabric(object):
         :rtype: dictionary
 
         """
-        return self._run_on_all_nodes(async, "get_uplink_info")
+        return self._plan_query(async, "get_uplink_info")
 
     def get_uplink_mode(self):
         """Gets the fabric uplink mode
@@ -495,7 +698,8 @@ class Fabric(object):
         """
         return self._run_on_all_nodes(async, "get_power")
 
-    def set_power(self, mode, async=False, ignore_existing_state=False):
+    def set_power(self, mode, async=False, ignore_existing_state=False,
+                  wait=False):
         """Send an IPMI power command to all nodes.
 
         >>> # On ...
@@ -515,9 +719,12 @@ class Fabric(object):
                                       to turn on or off nodes that are not
                                       turned on or off, respectively.
         :type ignore_existing_state: boolean
+        :param wait: Wait for the nodes to reach the requested power state.
+        :type wait: boolean
 
         """
-        self._run_on_all_nodes(async, "set_power", mode, ignore_existing_state)
+        self._run_on_all_nodes(async, "set_power", mode, ignore_existing_state,
+                wait)
 
     def get_power_policy(self, async=False):
         """Gets the power policy from all nodes.
@@ -761,7 +968,7 @@ class Fabric(object):
         :type async: boolean
 
         """
-        self._run_on_all_nodes(async, "set_boot_order", boot_args)
+        return self._edit_ubootenvs(async, "set_boot_order", boot_args)
 
     def get_boot_order(self, async=False):
         """Gets the boot order from all nodes.
@@ -796,7 +1003,7 @@ class Fabric(object):
         :type async: boolean
 
         """
-        self._run_on_all_nodes(async, "set_pxe_interface", interface)
+        return self._edit_ubootenvs(async, "set_pxe_interface", interface)
 
     def get_pxe_interface(self, async=False):
         """Gets the pxe interface from all nodes.
@@ -842,7 +1049,16 @@ class Fabric(object):
         :rtype: dictionary or `Task <tasks.html>`__
 
         """
-        return self._run_on_all_nodes(async, "get_versions")
+        results = self._run_on_all_nodes(async, "get_versions")
+        if self.topology_cache and not async:
+            self.topology_cache.record_hardware_versions(
+                self.ip_address, dict(
+                    (node_id, result.hardware_version)
+                    for node_id, result in results.iteritems()
+                    if result.hardware_version != "Unknown"
+                )
+            )
+        return results
 
     def get_versions_dict(self, async=False):
         """Gets the version info from all nodes.
@@ -1300,24 +1516,313 @@ class Fabric(object):
         """
         return self._run_on_all_nodes(async, "get_depth_chart")
 
+    def ping(self):
+        """Check which nodes are alive with an RMCP presence ping.
+
+        All nodes are pinged at once from a single socket, so this takes
+        about one round trip rather than one IPMI timeout per dead node.
+
+        >>> fabric.ping()
+        {0: 0.0011, 1: 0.0009, 2: None, 3: 0.0012}
+
+        :return: Map of node id to round trip time in seconds, or None if the
+                 node didn't answer.
+        :rtype: dictionary
+
+        """
+        results = self.pinger.sweep(
+            set(node.ip_address for node in self.nodes.itervalues())
+        )
+        return dict((node_id, results[node.ip_address])
+                    for node_id, node in self.nodes.iteritems())
+
+    def _update_indexes(self):
+        """Bring the lookup indexes up to date with self._nodes.
+
+        Only nodes that were added, removed, replaced or moved to a new IP
+        address are touched, so this is cheap after a refresh. GUIDs are
+        only indexed if the node already knows them; see _index_guids().
+        """
+        nodes = self._nodes
+        if self._indexed_nodes is nodes:
+            return
+
+        entries = dict((node_id, (node, node.ip_address))
+                       for node_id, node in nodes.iteritems())
+
+        def unchanged(node_id, entry, other_entries):
+            """Same node object at the same address?"""
+            other = other_entries.get(node_id)
+            return (other is not None and other[0] is entry[0] and
+                    other[1] == entry[1])
+
+        for node_id, entry in self._index_entries.iteritems():
+            if not unchanged(node_id, entry, entries):
+                node, ip_address = entry
+                if self._ip_index.get(ip_address) is node:
+                    del self._ip_index[ip_address]
+                if (node.has_guid and
+                        self._guid_index.get(node.guid) is node):
+                    del self._guid_index[node.guid]
+                slot = self._slot_index.get(node_slot(node_id), {})
+                if slot.get(node_id) is node:
+                    del slot[node_id]
+                    if not slot:
+                        del self._slot_index[node_slot(node_id)]
+                for mac_address in self._node_macs.pop(node_id, []):
+                    self._mac_index.pop(mac_address, None)
+
+        for node_id, entry in entries.iteritems():
+            if not unchanged(node_id, entry, self._index_entries):
+                node, ip_address = entry
+                self._ip_index[ip_address] = node
+                if node.has_guid:
+                    self._guid_index[node.guid] = node
+                self._slot_index.setdefault(node_slot(node_id),
+                                            {})[node_id] = node
+
+        self._index_entries = entries
+        self._indexed_nodes = nodes
+
+    def _index_guids(self):
+        """Index every node by GUID, reading the ones nodes don't know
+        yet in parallel through the task queue."""
+        tasks = {}
+        for node in self._nodes.itervalues():
+            if node.has_guid:
+                self._guid_index[node.guid] = node
+            else:
+                tasks[node] = self.task_queue.put(lambda x: x.guid, node)
+
+        for node, task in tasks.iteritems():
+            task.join()
+            if task.status != "Completed":
+                raise task.error
+            self._guid_index[task.result] = node
+
+    def _index_macs(self, macaddrs):
+        """Index the results of get_fabric_macaddrs by MAC address."""
+        self._update_indexes()
+        for node_id, ports in macaddrs.iteritems():
+            node = self._nodes.get(node_id)
+            if node is None:
+                continue
+
+            mac_addresses = []
+            for addresses in ports.itervalues():
+                if isinstance(addresses, basestring):
+                    addresses = [addresses]
+                mac_addresses.extend(x.lower() for x in addresses)
+
+            for mac_address in self._node_macs.get(node_id, []):
+                self._mac_index.pop(mac_address, None)
+            for mac_address in mac_addresses:
+                self._mac_index[mac_address] = node
+            self._node_macs[node_id] = mac_addresses
+
+        # Don't go looking again for nodes the primary didn't report
+        for node_id in self._nodes:
+            self._node_macs.setdefault(node_id, [])
+
+    def _load_topology(self):
+        """Load nodes from the topology cache, if it's still valid.
+
+        Costs a single GUID read from the primary node. Returns True if the
+        nodes were loaded. Cached hardware versions are set on the nodes,
+        and cached MAC addresses are indexed if we have them for every node.
+        """
+        if (not self.topology_cache or
+                self.topology_cache.guid(self.ip_address) is None):
+            return False
+
+        root_node = self.node(
+            ip_address=self.ip_address, credentials=self.credentials,
+            tftp=self.tftp, ecme_tftp_port=self.ecme_tftp_port,
+            verbose=self.verbose
+        )
+        try:
+            topology = self.topology_cache.get(self.ip_address,
+                                               root_node.guid)
+        except IpmiError:
+            return False
+        if not topology:
+            return False
+
+        nodes = {}
+        for node_id, (ip_address, guid) in topology.iteritems():
+            if ip_address == self.ip_address:
+                node = root_node
+            else:
+                node = self.node(
+                    ip_address=ip_address, credentials=self.credentials,
+                    tftp=self.tftp, ecme_tftp_port=self.ecme_tftp_port,
+                    verbose=self.verbose
+                )
+                if guid:
+                    node.guid = guid
+            node.node_id = node_id
+            nodes[node_id] = node
+
+        hardware_versions = self.topology_cache.hardware_versions(
+            self.ip_address
+        )
+        for node_id, hardware_version in hardware_versions.iteritems():
+            if node_id in nodes:
+                nodes[node_id].hardware_version = hardware_version
+
+        self._nodes = nodes
+        macs = self.topology_cache.macs(self.ip_address)
+        if all(node_id in macs for node_id in nodes):
+            self._index_macs(macs)
+        return True
+
+    def _save_topology(self):
+        """Record our nodes in the topology cache."""
+        if not self.topology_cache:
+            return
+        topology = dict(
+            (node_id, (node.ip_address, node.guid if node.has_guid else None))
+            for node_id, node in self._nodes.iteritems()
+        )
+        for node_id, node in self._nodes.iteritems():
+            if node.ip_address == self.ip_address:
+                topology[node_id] = (node.ip_address, node.guid)
+                self.topology_cache.record(self.ip_address, node.guid,
+                                           topology)
+                break
+        else:
+            self.topology_cache.invalidate(self.ip_address)
+
+    def _edit_ubootenvs(self, async, name, *args):
+        """Apply a UbootEnv edit to all nodes.
+
+        Each node downloads its environment in its own task. Nodes whose
+        environment and image settings (type, daddr, skip_crc32, version)
+        match share a group: the first one to get there edits the
+        environment and builds the image, and the rest upload that same
+        image. A node that fails (download, edit or upload) only fails its
+        own task.
+        """
+        images = {}
+        locks = {}
+        lock = Lock()
+
+        def edit(node):
+            """Edit one node's environment, sharing images by group."""
+            ubootenv = node.get_ubootenv()
+            key = (hashlib.sha1(ubootenv.get_contents()).hexdigest(),
+                   node.get_ubootenv_image_settings())
+            with lock:
+                group_lock = locks.setdefault(key, Lock())
+            with group_lock:
+                if key not in images:
+                    getattr(ubootenv, name)(*args)
+                    images[key] = node.build_ubootenv_image(ubootenv)
+            node.upload_ubootenv_image(images[key])
+
+        tasks = dict((node_id, self.task_queue.put(edit, node))
+                     for node_id, node in self.nodes.iteritems())
+        return self._collect_tasks(async, tasks)
+
+    def _plan_query(self, async, name):
+        """Run a per-node query, using a fabric-wide query if there is one.
+
+        The fabric-wide query goes to the primary node first. If it fails,
+        or doesn't cover every node, it's retried on other nodes, up to
+        FABRIC_QUERY_ATTEMPTS in all; only then do we fall back to asking
+        each node. Async queries always fan out, so there's a task per node.
+        The path taken is recorded in self.query_paths.
+        """
+        if not async and name in self.FABRIC_QUERIES:
+            primary_node = self.primary_node
+            candidates = [primary_node] + [
+                node for _, node in sorted(self.nodes.iteritems())
+                if node is not primary_node
+            ]
+            for node in candidates[:self.FABRIC_QUERY_ATTEMPTS]:
+                try:
+                    fabric_results = getattr(
+                        node, self.FABRIC_QUERIES[name]
+                    )()
+                    results = dict((node_id, fabric_results[node_id])
+                                   for node_id in self.nodes)
+                    self.query_paths[name] = "fabric"
+                    return results
+                except (IpmiError, TftpException, ParseError, KeyError,
+                        ValueError, IndexError):
+                    pass
+
+        self.query_paths[name] = "fanout"
+        return self._run_on_all_nodes(async, name)
+
     def _run_on_all_nodes(self, async, name, *args, **kwargs):
         """Start a command on all nodes."""
+        hedge = (self.hedge_policy and name in self.HEDGED_METHODS)
+
+        unreachable = []
+        if self.skip_unreachable:
+            unreachable = [node_id for node_id, latency
+                           in self.ping().iteritems() if latency is None]
+
         tasks = {}
         for node_id, node in self.nodes.iteritems():
-            tasks[node_id] = self.task_queue.put(getattr(node, name), *args,
-                                                 **kwargs)
-
+            if node_id in unreachable:
+                continue
+            elif hedge:
+                tasks[node_id] = self.task_queue.put(
+                    self.hedge_policy.call_as, name, getattr(node, name),
+                    *args, **kwargs
+                )
+            else:
+                tasks[node_id] = self.task_queue.put(getattr(node, name),
+                                                     *args, **kwargs)
+
+        for node_id in unreachable:
+            tasks[node_id] = failed_task(TimeoutError(
+                "Node %s did not answer an RMCP ping" % node_id
+            ))
+
+        deadline = None
+        if name.startswith(self.READ_ONLY_PREFIXES):
+            deadline = self.deadline
+        return self._collect_tasks(async, tasks, deadline)
+
+    def _collect_tasks(self, async, tasks, deadline=None):
+        """Return tasks if async, otherwise wait for and return results.
+
+        With a deadline (only given for read-only commands, so writes are
+        never reported as failed while still running), nodes that miss it
+        are reported as stragglers, and their tasks keep running in the
+        background.
+        """
         if async:
             return tasks
         else:
+            timeout = deadline
+            if timeout is not None:
+                deadline = time.time() + timeout
+
             results = {}
             errors = {}
+            stragglers = []
             for node_id, task in tasks.iteritems():
-                task.join()
+                if timeout is None:
+                    task.join()
+                elif not task.join(max(deadline - time.time(), 0)):
+                    stragglers.append(node_id)
+                    errors[node_id] = TimeoutError(
+                        "Node %s missed the %s second deadline"
+                        % (node_id, timeout)
+                    )
+                    continue
+
                 if task.status == "Completed":
                     results[node_id] = task.result
                 else:
                     errors[node_id] = task.error
+            if stragglers:
+                raise DeadlineExceededError(results, errors,
+                                            sorted(stragglers))
             if errors:
                 raise CommandFailedError(results, errors)
             return results
@@ -0,0 +1,628 @@
+"""Calxeda: history.py"""
+
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import os
+import sys
+import glob
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import izip
+from threading import Lock
+
+
+MAGIC = "CXTS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+BLOCK = struct.Struct("<II")
+NAN = float("nan")
+STATS = ("mean", "min", "max")
+
+
+def _pack(values):
+    """Get the little-endian bytes of an array."""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tostring()
+
+
+def _unpack(typecode, data):
+    """Build an array from little-endian bytes."""
+    values = array(typecode)
+    values.fromstring(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class Segment(object):
+    """An append-only file of sensor samples, stored by column.
+
+    The file starts with a header naming its columns (one per series), then
+    holds blocks of rows. Each block is the row count, the rows' float64
+    timestamps, then each column's float32 values for those rows, so a
+    query for one series reads one contiguous run per block. Missing
+    values are NaN. Reads go through a read-only memory map of the file.
+
+    A block cut short by a crash is dropped when the segment is reopened.
+
+    >>> from cxmanage_api.history import Segment
+    >>> segment = Segment('raw.0000.seg', columns=[(0, 'Node Power')])
+    >>> segment.append_block(array('d', [1000.0]), [array('f', [6.5])])
+    >>> segment.read((0, 'Node Power'))
+    [(1000.0, 6.5)]
+
+    :param path: Path of the segment file.
+    :type path: string
+    :param columns: Series keys, to create a new segment. Default: open an
+                    existing one.
+    :type columns: list
+
+    """
+
+    def __init__(self, path, columns=None):
+        """Default constructor for the Segment class."""
+        self.path = path
+        if columns is not None:
+            meta = json.dumps({"columns": list(columns)})
+            meta += " " * (-(HEADER.size + len(meta)) % 8)
+            with open(path, "wb") as segment_file:
+                segment_file.write(HEADER.pack(MAGIC, VERSION, 0, len(meta)))
+                segment_file.write(meta)
+
+        self._file = open(path, "r+b")
+        magic, version, _, length = HEADER.unpack(
+            self._file.read(HEADER.size)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a sensor history segment" % path)
+        meta = json.loads(self._file.read(length))
+        # Sensor names come back from JSON as unicode; match pyipmi's str.
+        self.columns = [
+            tuple(x.encode("utf-8") if isinstance(x, unicode) else x
+                  for x in key)
+            for key in meta["columns"]
+        ]
+        self._index = dict((key, i) for i, key in enumerate(self.columns))
+        self._map = None
+        self._blocks = []
+        self._end = HEADER.size + length
+        self._scan()
+
+    @property
+    def first(self):
+        """Timestamp of the first row, or None if there are no rows."""
+        return self._blocks[0][2] if self._blocks else None
+
+    @property
+    def last(self):
+        """Timestamp of the last row, or None if there are no rows."""
+        return self._blocks[-1][3] if self._blocks else None
+
+    @property
+    def size(self):
+        """Size of the segment in bytes."""
+        return self._end
+
+    def append_block(self, timestamps, columns):
+        """Append rows to the segment.
+
+        :param timestamps: Timestamps of the rows, in order.
+        :type timestamps: array
+        :param columns: Values for each column, in column order, one per
+                        row.
+        :type columns: list
+
+        """
+        rows = len(timestamps)
+        if not rows:
+            return
+        self._file.seek(self._end)
+        self._file.write(BLOCK.pack(rows, 0))
+        self._file.write(_pack(timestamps))
+        for column in columns:
+            self._file.write(_pack(column))
+        self._file.flush()
+        self._blocks.append((self._end, rows, timestamps[0], timestamps[-1]))
+        self._end += BLOCK.size + rows * (8 + 4 * len(self.columns))
+
+    def read(self, key, start=None, end=None):
+        """Read one series.
+
+        :param key: Series key.
+        :type key: tuple
+        :param start: Only samples at or after this time.
+        :type start: float
+        :param end: Only samples at or before this time.
+        :type end: float
+
+        :returns: (timestamp, value) pairs, oldest first.
+        :rtype: list
+
+        """
+        column = self._index.get(key)
+        if column is None:
+            return []
+        samples = []
+        for offset, rows, first, last in self._blocks:
+            if ((start is not None and last < start) or
+                    (end is not None and first > end)):
+                continue
+            data = self._mapping()
+            offset += BLOCK.size
+            timestamps = _unpack("d", data[offset:offset + 8 * rows])
+            offset += 8 * rows + 4 * rows * column
+            values = _unpack("f", data[offset:offset + 4 * rows])
+            low = 0 if start is None else bisect_left(timestamps, start)
+            high = rows if end is None else bisect_right(timestamps, end)
+            samples.extend(
+                (t, v) for t, v in izip(timestamps[low:high],
+                                        values[low:high])
+                if v == v
+            )
+        return samples
+
+    def read_rows(self, start=None):
+        """Read whole rows.
+
+        :param start: Only rows at or after this time.
+        :type start: float
+
+        :returns: (timestamp, row) pairs, oldest first. Each row is an
+                  array of values in column order, NaN where missing.
+        :rtype: list
+
+        """
+        result = []
+        width = len(self.columns)
+        for offset, rows, _, last in self._blocks:
+            if start is not None and last < start:
+                continue
+            data = self._mapping()
+            offset += BLOCK.size
+            timestamps = _unpack("d", data[offset:offset + 8 * rows])
+            offset += 8 * rows
+            values = _unpack("f", data[offset:offset + 4 * rows * width])
+            low = 0 if start is None else bisect_left(timestamps, start)
+            result.extend((timestamps[i], array("f", values[i::rows]))
+                          for i in xrange(low, rows))
+        return result
+
+    def close(self):
+        """Close the segment file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _scan(self):
+        """Index the blocks, dropping a trailing partial block."""
+        size = os.fstat(self._file.fileno()).st_size
+        row_size = 8 + 4 * len(self.columns)
+        while self._end + BLOCK.size <= size:
+            self._file.seek(self._end)
+            rows, _ = BLOCK.unpack(self._file.read(BLOCK.size))
+            length = BLOCK.size + rows * row_size
+            if not rows or self._end + length > size:
+                break
+            first = _unpack("d", self._file.read(8))[0]
+            self._file.seek(self._end + BLOCK.size + 8 * (rows - 1))
+            last = _unpack("d", self._file.read(8))[0]
+            self._blocks.append((self._end, rows, first, last))
+            self._end += length
+        if self._end < size:
+            self._file.truncate(self._end)
+
+    def _mapping(self):
+        """Get a memory map covering every block."""
+        if self._map is None or len(self._map) < self._end:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        return self._map
+
+
+class _Series(object):
+    """A chain of segments holding one resolution of history.
+
+    Rows are buffered in memory and written one block at a time. A new
+    segment is started when new series show up (the column set is fixed
+    per segment) or the current one spans segment_span seconds.
+    """
+
+    def __init__(self, directory, name, block_rows, segment_span):
+        """Default constructor for the _Series class."""
+        self.directory = directory
+        self.name = name
+        self.block_rows = block_rows
+        self.segment_span = segment_span
+        self.segments = [
+            Segment(path) for path in
+            sorted(glob.glob(os.path.join(directory, "%s.*.seg" % name)))
+        ]
+        self._timestamps = array("d")
+        self._rows = []
+        self._index = {}
+        if self.segments:
+            self._index = dict((key, i) for i, key
+                               in enumerate(self.segments[-1].columns))
+
+    @property
+    def columns(self):
+        """Series keys of the current segment."""
+        return self.segments[-1].columns if self.segments else []
+
+    @property
+    def last(self):
+        """Timestamp of the last row written, or None."""
+        for segment in reversed(self.segments):
+            if segment.last is not None:
+                return segment.last
+        return None
+
+    def add(self, timestamp, samples):
+        """Buffer a row, writing a block once enough rows are buffered.
+
+        :returns: The row, with values in the order of self.columns.
+        """
+        current = self.segments[-1] if self.segments else None
+        start = current and current.first
+        if start is None and self._timestamps:
+            start = self._timestamps[0]
+        if start is not None and timestamp - start >= self.segment_span:
+            self._rotate(self.columns)
+
+        # Every sample found a column unless some are left over.
+        values = map(samples.get, self.columns)
+        missing = values.count(None)
+        if not self.segments or len(values) - missing < len(samples):
+            self._rotate(set(self.columns) | set(samples))
+            values = map(samples.get, self.columns)
+            missing = values.count(None)
+        if missing:
+            values = [NAN if x is None else x for x in values]
+        row = array("f", values)
+
+        self._timestamps.append(timestamp)
+        self._rows.append(row)
+        if len(self._rows) >= self.block_rows:
+            self.flush()
+        return row
+
+    def flush(self):
+        """Write the buffered rows."""
+        if not self._rows:
+            return
+        rows = self._rows
+        self.segments[-1].append_block(self._timestamps, [
+            array("f", [row[i] for row in rows])
+            for i in xrange(len(self.columns))
+        ])
+        self._timestamps = array("d")
+        self._rows = []
+
+    def read(self, key, start=None, end=None):
+        """Read one series from every segment and the buffered rows."""
+        samples = []
+        for segment in self.segments:
+            samples.extend(segment.read(key, start, end))
+        column = self._index.get(key)
+        if column is not None:
+            samples.extend(
+                (t, row[column]) for t, row
+                in izip(self._timestamps, self._rows)
+                if (start is None or t >= start) and
+                (end is None or t <= end) and row[column] == row[column]
+            )
+        return samples
+
+    def read_rows(self, start):
+        """Read the rows written at or after a time.
+
+        :returns: (timestamp, columns, row) tuples, oldest first. Rows from
+                  the same segment share its columns list.
+        """
+        rows = []
+        for segment in self.segments:
+            if segment.last is not None and segment.last >= start:
+                rows.extend((timestamp, segment.columns, row)
+                            for timestamp, row in segment.read_rows(start))
+        return rows
+
+    def prune(self, before):
+        """Delete segments that end before a time, except the current one.
+
+        :returns: Number of segments deleted.
+        """
+        old = [x for x in self.segments[:-1]
+               if x.last is None or x.last < before]
+        for segment in old:
+            segment.close()
+            os.remove(segment.path)
+            self.segments.remove(segment)
+        return len(old)
+
+    def close(self):
+        """Write the buffered rows and close the segments."""
+        self.flush()
+        for segment in self.segments:
+            segment.close()
+
+    def _rotate(self, columns):
+        """Start a new segment."""
+        self.flush()
+        number = 0
+        if self.segments:
+            number = int(self.segments[-1].path.split(".")[-2]) + 1
+        path = os.path.join(self.directory,
+                            "%s.%04i.seg" % (self.name, number))
+        self.segments.append(Segment(path, sorted(columns)))
+        self._index = dict((key, i) for i, key
+                           in enumerate(self.segments[-1].columns))
+
+
+class _Rollup(object):
+    """Summarizes rows into fixed-width time buckets.
+
+    Rows are kept (by reference) until their bucket is complete, then each
+    column is summarized at once. Input columns are either raw series
+    (node_id, sensor), which give a mean, min and max, or another rollup's
+    (node_id, sensor, stat), which are combined stat by stat, so coarse
+    rollups can be built from finer ones.
+    """
+
+    def __init__(self, width):
+        """Default constructor for the _Rollup class."""
+        self.width = width
+        self.bucket = None
+        self._rows = []
+
+    def add(self, timestamp, columns, row):
+        """Add a row.
+
+        :returns: (bucket start, {(node_id, sensor, stat): value}) for the
+                  previous bucket when this row starts a new one, or None.
+        """
+        bucket = timestamp - timestamp % self.width
+        summary = None
+        if self.bucket is not None and bucket != self.bucket:
+            summary = self.bucket, self._summarize()
+        self.bucket = bucket
+        self._rows.append((columns, row))
+        return summary
+
+    def _summarize(self):
+        """Summarize the buffered rows, and start over."""
+        summary = {}
+        groups = []
+        for columns, row in self._rows:
+            if groups and groups[-1][0] is columns:
+                groups[-1][1].append(row)
+            else:
+                groups.append((columns, [row]))
+        self._rows = []
+
+        for columns, rows in groups:
+            for key, values in izip(columns, izip(*rows)):
+                total = sum(values)
+                if total != total:
+                    values = [x for x in values if x == x]
+                    if not values:
+                        continue
+                    total = sum(values)
+                if len(key) == 2:
+                    node_id, name = key
+                    summary[(node_id, name, "mean")] = total / len(values)
+                    summary[(node_id, name, "min")] = min(values)
+                    summary[(node_id, name, "max")] = max(values)
+                elif key[2] == "mean":
+                    summary[key] = total / len(values)
+                elif key[2] == "min":
+                    summary[key] = min(values)
+                else:
+                    summary[key] = max(values)
+        return summary
+
+
+class HistoryStore(object):
+    """Persistent sensor history for one fabric.
+
+    Samples go to a directory of append-only, column-oriented segment files
+    (see Segment), with float32 values and float64 timestamps. Alongside
+    the raw samples, per-bucket mean/min/max rollups are kept (by default
+    per minute and per hour), so long-range queries read a few rows rather
+    than weeks of samples. Each rollup is built from the next finer one,
+    so an hour's mean is the mean of its minutes' means.
+
+    Rows are written a block at a time; until then they live in memory,
+    so call flush() or close() before exiting. Rollup buckets still in
+    progress aren't written, but their rows are, so reopening the store
+    rebuilds them from the next finer series and carries on. Feed it from
+    a SensorPoller to record readings as they're polled.
+
+    >>> from cxmanage_api.history import HistoryStore
+    >>> from cxmanage_api.poller import SensorPoller
+    >>> store = HistoryStore('/var/lib/cxmanage/history/fabric0')
+    >>> poller = SensorPoller(fabric, interval=10, store=store)
+    >>> poller.start()
+    >>> store.query(0, 'Node Power', start=time.time() - 3600)
+    [(1386624000.0, 6.5), (1386624010.0, 6.25), ...]
+    >>> store.query(0, 'Node Power', resolution=3600, stat='max')
+    [(1386291600.0, 9.75), ...]
+
+    :param directory: Directory to keep the segments in. Use one per
+                      fabric.
+    :type directory: string
+    :param rollups: Rollup bucket widths, in seconds. Each must be a
+                    multiple of the previous one.
+    :type rollups: tuple
+    :param block_rows: Raw rows to buffer before writing a block. Rollups
+                       write proportionally smaller blocks (per-minute rows
+                       every block_rows minutes, per-hour rows at once).
+    :type block_rows: integer
+    :param segment_span: Seconds of raw samples per segment file. Rollup
+                         segments span proportionally more (a minute's
+                         rollup per second of raw span).
+    :type segment_span: float
+
+    """
+
+    def __init__(self, directory, rollups=(60, 3600), block_rows=60,
+                 segment_span=86400):
+        """Default constructor for the HistoryStore class."""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self._lock = Lock()
+        self._series = {0: _Series(directory, "raw", block_rows,
+                                   segment_span)}
+        self._rollups = {}
+        for width in rollups:
+            self._series[width] = _Series(
+                directory, "%is" % width, max(1, block_rows * 60 // width),
+                segment_span * width
+            )
+            self._rollups[width] = _Rollup(width)
+        self._resume()
+
+    @property
+    def resolutions(self):
+        """Available resolutions, in seconds (0 is the raw samples)."""
+        return sorted(self._series)
+
+    def append(self, timestamp, samples):
+        """Record one poll's readings.
+
+        :param timestamp: Time of the poll.
+        :type timestamp: float
+        :param samples: Values keyed by (node_id, sensor_name). Series
+                        without a reading can be left out.
+        :type samples: dictionary
+
+        """
+        with self._lock:
+            series = self._series[0]
+            row = series.add(timestamp, samples)
+            for width in sorted(self._rollups):
+                summary = self._rollups[width].add(timestamp, series.columns,
+                                                   row)
+                if not summary:
+                    break
+                timestamp, samples = summary
+                series = self._series[width]
+                row = series.add(timestamp, samples)
+
+    def query(self, node_id, sensor_name, start=None, end=None,
+              resolution=0, stat="mean"):
+        """Get the history of one sensor on one node.
+
+        :param node_id: Node ID.
+        :type node_id: integer
+        :param sensor_name: Sensor name.
+        :type sensor_name: string
+        :param start: Only samples at or after this time.
+        :type start: float
+        :param end: Only samples at or before this time.
+        :type end: float
+        :param resolution: 0 for raw samples, or a rollup width.
+        :type resolution: integer
+        :param stat: For rollups, "mean", "min" or "max".
+        :type stat: string
+
+        :returns: (timestamp, value) pairs, oldest first. Rollup rows are
+                  stamped with the start of their bucket.
+        :rtype: list
+
+        :raises ValueError: If there's no such resolution or stat.
+
+        """
+        if resolution not in self._series:
+            raise ValueError("No %s second resolution in %s"
+                             % (resolution, self.directory))
+        if resolution:
+            if stat not in STATS:
+                raise ValueError("Unknown rollup stat %s" % stat)
+            key = (node_id, sensor_name, stat)
+        else:
+            key = (node_id, sensor_name)
+        with self._lock:
+            return self._series[resolution].read(key, start, end)
+
+    def prune(self, before):
+        """Delete segments whose samples all predate a time.
+
+        :returns: Number of segment files deleted.
+        :rtype: integer
+
+        """
+        with self._lock:
+            return sum(x.prune(before) for x in self._series.itervalues())
+
+    def flush(self):
+        """Write buffered rows to disk."""
+        with self._lock:
+            for series in self._series.itervalues():
+                series.flush()
+
+    def close(self):
+        """Write buffered rows and close the segment files."""
+        with self._lock:
+            for series in self._series.itervalues():
+                series.close()
+
+    def _resume(self):
+        """Rebuild the rollup buckets that were in progress when the store
+        was last closed.
+
+        A rollup's bucket is written once a row for the next bucket comes
+        in, so the open bucket is the one holding the last row written to
+        the next finer series, and its rows are all on disk.
+        """
+        finer = self._series[0]
+        for width in sorted(self._rollups):
+            last = finer.last
+            if last is None:
+                break
+            rollup = self._rollups[width]
+            for timestamp, columns, row in finer.read_rows(last -
+                                                           last % width):
+                rollup.add(timestamp, columns, row)
+            finer = self._series[width]
+
+
+# End of file: ./history.py
@@ -33,7 +33,9 @@
 
 
 import os
+import shutil
 import subprocess
+from threading import Lock
 
 from cxmanage_api import temp_file
 from cxmanage_api.simg import create_simg, has_simg
@@ -75,6 +77,9 @@ class Image(object):
         self.skip_crc32 = skip_crc32
         self.version = version
 
+        self._simg_cache = {}
+        self._simg_lock = Lock()
+
         if (not os.path.exists(filename)):
             raise ValueError("File %s does not exist" % filename)
 
@@ -94,6 +99,12 @@ class Image(object):
     def render_to_simg(self, priority, daddr):
         """Creates a SIMG file.
 
+        .. note::
+            * The SIMG is only built once for each priority and daddr, so
+              one Image can be uploaded to many nodes cheaply. Each call
+              still returns its own copy, so concurrent uploads never
+              share (or overwrite) a TFTP file name.
+
         >>> img.render_to_simg(priority=1, daddr=0)
         >>> 'spi_highbank.bin'
 
@@ -108,28 +119,41 @@ class Image(object):
         :raises InvalidImageError: If the SIMG image is not valid.
 
         """
-        filename = self.filename
-        # Create new image if necessary
-        if (not self.simg):
-            contents = open(filename).read()
-            # Figure out daddr
-            if (self.daddr != None):
-                daddr = self.daddr
-            # Create simg
-            align = (self.type in ["CDB", "BOOT_LOG"])
-            simg = create_simg(contents, priority=priority, daddr=daddr,
-                    skip_crc32=self.skip_crc32, align=align,
-                    version=self.version)
-            filename = temp_file()
-            with open(filename, "w") as file_:
-                file_.write(simg)
-
-        # Make sure the simg was built correctly
-        if (not valid_simg(open(filename).read())):
-            raise InvalidImageError("%s is not a valid SIMG" %
-                    os.path.basename(self.filename))
-
-        return filename
+        # Figure out daddr
+        if (self.daddr != None):
+            daddr = self.daddr
+
+        with self._simg_lock:
+            if (priority, daddr) in self._simg_cache:
+                return self._copy(self._simg_cache[(priority, daddr)])
+
+            filename = self.filename
+            # Create new image if necessary
+            if (not self.simg):
+                contents = open(filename).read()
+                # Create simg
+                align = (self.type in ["CDB", "BOOT_LOG"])
+                simg = create_simg(contents, priority=priority, daddr=daddr,
+                        skip_crc32=self.skip_crc32, align=align,
+                        version=self.version)
+                filename = temp_file()
+                with open(filename, "w") as file_:
+                    file_.write(simg)
+
+            # Make sure the simg was built correctly
+            if (not valid_simg(open(filename).read())):
+                raise InvalidImageError("%s is not a valid SIMG" %
+                        os.path.basename(self.filename))
+
+            self._simg_cache[(priority, daddr)] = filename
+            return self._copy(filename)
+
+    @staticmethod
+    def _copy(filename):
+        """Copy a rendered SIMG to a new temporary file."""
+        copy = temp_file()
+        shutil.copyfile(filename, copy)
+        return copy
 
     def size(self):
         """Return the full size of this image (as an SIMG)
@@ -0,0 +1,304 @@
+"""Calxeda: ipmibatch.py"""
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import re
+import time
+import uuid
+import tempfile
+import subprocess
+from threading import Lock, local
+
+from pyipmi import InteractiveCommand
+from pyipmi.tools import IpmiTool
+
+from cxmanage_api.ipmishell import _quote
+
+
+class _Captured(Exception):
+    """Raised out of a BMC method once its first command is captured."""
+    pass
+
+
+class BatchingToolMixin(object):
+    """Lets a pyipmi tool answer commands from batched ipmitool output.
+
+    Mix it into an IpmiTool (see batching_tool_class). Outside of a batch,
+    the tool behaves exactly like its base class.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Default constructor for the BatchingToolMixin class."""
+        super(BatchingToolMixin, self).__init__(*args, **kwargs)
+        self._batch_lock = Lock()
+        self._batch_state = local()
+        self._prefetched = {}
+
+    def run(self, command):
+        """Run a command, using prefetched output if we have some."""
+        if isinstance(command, InteractiveCommand):
+            return super(BatchingToolMixin, self).run(command)
+
+        captured = getattr(self._batch_state, "captured", None)
+        if captured is not None:
+            captured.append(command)
+            raise _Captured()
+
+        out = self.take_prefetched(self._ipmi_args(command))
+        if out:
+            self._log("Using batched output for %s" %
+                      " ".join(str(x) for x in command.ipmitool_args))
+            self._log(out)
+            return command.parse_results(out, "")
+        return super(BatchingToolMixin, self).run(command)
+
+    def capture(self, method, *args, **kwargs):
+        """Call a BMC method, but only capture its first command.
+
+        :returns: The captured command, or None if the method didn't run any.
+        :rtype: pyipmi.Command
+
+        """
+        self._batch_state.captured = []
+        try:
+            method(*args, **kwargs)
+        except _Captured:
+            pass
+        finally:
+            captured, self._batch_state.captured = \
+                    self._batch_state.captured, None
+        return captured[0] if captured else None
+
+    def command_args(self, command):
+        """Split a command's ipmitool args into (connection, command) args."""
+        args = self._ipmi_args(command)
+        command_args = [str(x) for x in command.ipmitool_args]
+        return args[:len(args) - len(command_args)], command_args
+
+    def prefetch(self, args, output, ttl):
+        """Keep a command's output, to answer the next identical command."""
+        with self._batch_lock:
+            self._prefetched[tuple(args)] = (time.time() + ttl, output)
+
+    def has_prefetched(self, args):
+        """Returns True if there's fresh output for this command."""
+        with self._batch_lock:
+            expires, _ = self._prefetched.get(tuple(args), (0, None))
+        return expires > time.time()
+
+    def take_prefetched(self, args):
+        """Take a command's prefetched output, if it's there and fresh."""
+        with self._batch_lock:
+            expires, output = self._prefetched.pop(tuple(args), (0, None))
+        if expires > time.time():
+            return output
+        return None
+
+    def clear_prefetched(self, keys=None):
+        """Drop prefetched output for these commands, or for all of them."""
+        with self._batch_lock:
+            if keys is None:
+                self._prefetched = {}
+            for key in (keys or []):
+                self._prefetched.pop(tuple(key), None)
+
+
+def batching_tool_class(base=IpmiTool):
+    """Get a batching version of a pyipmi tool class.
+
+    :param base: The tool class to extend.
+    :type base: class
+
+    :returns: A subclass of BatchingToolMixin and base.
+    :rtype: class
+
+    """
+    return type("Batching%s" % base.__name__, (BatchingToolMixin, base), {})
+
+
+class IpmiBatch(object):
+    """Runs several BMC reads for one node in a single "ipmitool exec".
+
+    Each BMC method's command is captured instead of being run, all of them
+    are written to one exec file, and ipmitool runs them over one process
+    and one session. The output is split back up at "echo" markers, and
+    kept by the BMC's tool: when the BMC methods are called for real, their
+    commands are answered from it and parsed as usual.
+
+    Commands that already have fresh output (say, from an earlier batch)
+    aren't run again. A command that printed nothing (which is how failures
+    look in exec output, since errors go to stderr) isn't kept, so that call
+    runs on its own and reports its error the usual way. The same goes for
+    any later commands issued by a BMC method that runs more than one.
+
+    Used as a context manager, the batch's leftover output is dropped on
+    exit.
+
+    >>> from cxmanage_api.ipmibatch import IpmiBatch
+    >>> with IpmiBatch(node.bmc, ['get_info_basic', 'get_info_card']):
+    ...     info = node.bmc.get_info_basic()
+    ...     card = node.bmc.get_info_card()
+    ...
+
+    :param bmc: The BMC to batch commands for.
+    :type bmc: pyipmi.bmc.BMC
+    :param calls: BMC method names, or (name, args) tuples.
+    :type calls: list
+    :param ttl: Seconds to keep the output for.
+    :type ttl: float
+
+    """
+
+    def __init__(self, bmc, calls=None, ttl=60):
+        """Default constructor for the IpmiBatch class."""
+        self.bmc = bmc
+        self.calls = []
+        self.ttl = ttl
+        self._keys = []
+        for call in (calls or []):
+            if isinstance(call, basestring):
+                self.add(call)
+            else:
+                self.add(*call)
+
+    def add(self, method, *args, **kwargs):
+        """Add a BMC method call to the batch.
+
+        :param method: Name of the BMC method.
+        :type method: string
+
+        """
+        self.calls.append((method, args, kwargs))
+
+    def execute(self):
+        """Run the batch, keeping each command's output for later.
+
+        BMCs without a batching tool (e.g. test doubles) are left alone, and
+        their calls simply run one at a time later on.
+
+        :returns: The number of commands that got output.
+        :rtype: integer
+
+        """
+        tool = getattr(getattr(self.bmc, "handle", None), "_tool", None)
+        if not isinstance(tool, BatchingToolMixin) or not self.calls:
+            return 0
+
+        base_args = None
+        commands = []
+        for method, args, kwargs in self.calls:
+            command = tool.capture(getattr(self.bmc, method), *args,
+                                   **kwargs)
+            if command is not None:
+                base_args, command_args = tool.command_args(command)
+                if (not tool.has_prefetched(base_args + command_args) and
+                        command_args not in commands):
+                    commands.append(command_args)
+        if not commands:
+            return 0
+
+        outputs = self._exec(base_args, commands)
+        count = 0
+        for command_args, output in zip(commands, outputs):
+            if output:
+                tool.prefetch(base_args + command_args, output, self.ttl)
+                self._keys.append(base_args + command_args)
+                count += 1
+        return count
+
+    def answered(self, method, *args, **kwargs):
+        """Check whether a BMC method call can be answered from batched
+        output, i.e. without running ipmitool.
+
+        :param method: Name of the BMC method.
+        :type method: string
+
+        :returns: True if its command has fresh output waiting.
+        :rtype: boolean
+
+        """
+        tool = getattr(getattr(self.bmc, "handle", None), "_tool", None)
+        if not isinstance(tool, BatchingToolMixin):
+            return False
+        command = tool.capture(getattr(self.bmc, method), *args, **kwargs)
+        if command is None:
+            return False
+        base_args, command_args = tool.command_args(command)
+        return tool.has_prefetched(base_args + command_args)
+
+    def clear(self):
+        """Drop any of this batch's output that wasn't used."""
+        tool = getattr(getattr(self.bmc, "handle", None), "_tool", None)
+        if isinstance(tool, BatchingToolMixin):
+            tool.clear_prefetched(self._keys)
+        self._keys = []
+
+    def __enter__(self):
+        self.execute()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.clear()
+
+    @staticmethod
+    def _exec(base_args, commands):
+        """Run commands with "ipmitool exec", and split up the output.
+
+        :returns: The output of each command ("" if it printed nothing).
+        :rtype: list
+
+        """
+        marker = "cxmanage-batch-%s" % uuid.uuid4().hex
+        with tempfile.NamedTemporaryFile(suffix=".ipmi") as script:
+            for i, command_args in enumerate(commands):
+                script.write("echo %s %i\n" % (marker, i))
+                script.write(" ".join(_quote(x) for x in command_args) + "\n")
+            script.flush()
+            try:
+                process = subprocess.Popen(
+                    base_args + ["exec", script.name],
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+            except OSError:
+                # Each call will run (and fail) on its own instead
+                return [""] * len(commands)
+            out, _ = process.communicate()
+
+        outputs = [""] * len(commands)
+        parts = re.split(r"^%s (\d+)\n" % marker, out, flags=re.M)
+        for index, output in zip(parts[1::2], parts[2::2]):
+            outputs[int(index)] = output if output.strip() else ""
+        return outputs
+
+
+# End of file: ./ipmibatch.py
@@ -0,0 +1,381 @@
+"""Calxeda: ipmishell.py"""
+
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+
+import os
+import re
+import time
+import atexit
+import select
+import weakref
+import subprocess
+from threading import Lock, BoundedSemaphore
+
+from pyipmi import IpmiError
+from pyipmi.tools import IpmiTool
+
+
+PROMPT = "ipmitool> "
+
+# ipmitool's shell doesn't give us an exit status, so failures are spotted by
+# the way ipmitool words its error messages.
+ERROR_PREFIXES = ("Error", "Unable to", "Invalid", "Could not",
+                  "Insufficient privilege")
+
+# ...or by a failed request, e.g. "Get Device ID command failed: ..."
+ERROR_PATTERN = re.compile(r"\bfailed(:|$)")
+
+
+class IpmitoolShell(object):
+    """A long-lived "ipmitool ... shell" process for one ECME.
+
+    The RMCP+ session is set up once when the shell starts, and every command
+    after that reuses it. Output is framed by the shell's prompt: everything
+    ipmitool prints between sending a command and the next prompt belongs to
+    that command.
+
+    >>> from cxmanage_api.ipmishell import IpmitoolShell
+    >>> shell = IpmitoolShell(['ipmitool', '-H', '10.20.1.9', '-U', 'admin',
+    ...                        '-P', 'admin'])
+    >>> shell.run(['power', 'status'])
+    (True, 'Chassis Power is off')
+
+    :param args: ipmitool command line, minus the "shell" command.
+    :type args: list
+    :param timeout: Seconds to wait for each command's prompt.
+    :type timeout: float
+
+    :raises IpmiError: If the shell doesn't start.
+
+    """
+
+    def __init__(self, args, timeout=30):
+        """Default constructor for the IpmitoolShell class."""
+        self.args = list(args)
+        self.timeout = timeout
+        self.last_used = time.time()
+        try:
+            self.process = subprocess.Popen(
+                self.args + ["shell"], stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                close_fds=True
+            )
+        except OSError as err:
+            raise IpmiError("Failed to start ipmitool shell: %s" % err)
+        try:
+            self._read_until_prompt()
+        except IpmiError:
+            self.close()
+            raise
+
+    def is_alive(self):
+        """Returns True if the shell process is still running."""
+        return self.process.poll() is None
+
+    def run(self, command_args):
+        """Run one command in the shell.
+
+        :param command_args: ipmitool arguments for the command.
+        :type command_args: list
+
+        :returns: (success, output) -- success is False if ipmitool reported
+                  an error.
+        :rtype: tuple
+
+        :raises IpmiError: If the shell died or timed out. It's closed, and
+                           shouldn't be used again.
+
+        """
+        self.send(command_args)
+        return self.receive()
+
+    def send(self, command_args):
+        """Send a command to the shell, without waiting for its output.
+
+        :param command_args: ipmitool arguments for the command.
+        :type command_args: list
+
+        :raises IpmiError: If the command couldn't be written, so the shell
+                           never saw it. The shell is closed.
+
+        """
+        line = " ".join(_quote(x) for x in command_args)
+        try:
+            self.process.stdin.write(line + "\n")
+            self.process.stdin.flush()
+        except (IOError, OSError) as err:
+            self.close()
+            raise IpmiError("ipmitool shell died: %s" % err)
+
+    def receive(self):
+        """Read the output of the command last sent.
+
+        :returns: (success, output), as for run().
+        :rtype: tuple
+
+        :raises IpmiError: If the shell died or timed out. It's closed, and
+                           shouldn't be used again.
+
+        """
+        output = self._read_until_prompt().strip()
+        self.last_used = time.time()
+        return not is_error(output), output
+
+    def close(self):
+        """Stop the shell."""
+        if self.is_alive():
+            try:
+                self.process.stdin.write("exit\n")
+                self.process.stdin.close()
+            except (IOError, OSError):
+                pass
+            deadline = time.time() + 1
+            while self.is_alive() and time.time() < deadline:
+                time.sleep(0.01)
+            if self.is_alive():
+                self.process.kill()
+                self.process.wait()
+        self.process.stdout.close()
+
+    def _read_until_prompt(self):
+        """Read output until the shell prompts for the next command."""
+        fd = self.process.stdout.fileno()
+        deadline = time.time() + self.timeout
+        chunks = []
+        tail = ""
+        while not tail.endswith(PROMPT):
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([fd], [], [],
+                                                   remaining)[0]:
+                self.close()
+                raise IpmiError("ipmitool shell timed out")
+            data = os.read(fd, 4096)
+            if not data:
+                self.close()
+                raise IpmiError("ipmitool shell exited unexpectedly")
+            chunks.append(data)
+            tail = (tail + data)[-len(PROMPT):]
+        return "".join(chunks)[:-len(PROMPT)]
+
+
+class IpmitoolShellPool(object):
+    """A pool of ipmitool shells, keyed by ipmitool command line.
+
+    Each ECME (really, each distinct set of ipmitool connection arguments)
+    gets up to 'size' shells. Commands beyond that wait for a shell to come
+    free, so an ECME never sees more than 'size' sessions from us. Shells
+    idle for longer than idle_timeout are closed, and shells that die are
+    replaced on the next command.
+
+    >>> from cxmanage_api.ipmishell import IpmitoolShellPool
+    >>> pool = IpmitoolShellPool(size=2, idle_timeout=60)
+    >>> pool.execute(['ipmitool', '-H', '10.20.1.9', '-U', 'admin',
+    ...               '-P', 'admin'], ['power', 'status'])
+    (True, 'Chassis Power is off')
+
+    :param size: Max shells per ECME, busy or idle.
+    :type size: integer
+    :param idle_timeout: Seconds before an idle shell is closed.
+    :type idle_timeout: float
+    :param timeout: Seconds to wait for each command.
+    :type timeout: float
+
+    """
+
+    def __init__(self, size=2, idle_timeout=60, timeout=30):
+        """Default constructor for the IpmitoolShellPool class."""
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._lock = Lock()
+        self._idle = {}
+        self._slots = {}
+        self.spawned = 0
+        _POOLS.add(self)
+
+    def execute(self, args, command_args):
+        """Run a command on a pooled shell.
+
+        If the command can't be written to the shell, the shell is replaced
+        and the command is tried once more. Once it has been written it is
+        never sent again, since it may have run already: a shell that dies
+        or times out after that is an error.
+
+        :param args: ipmitool command line, minus the command itself.
+        :type args: list
+        :param command_args: ipmitool arguments for the command.
+        :type command_args: list
+
+        :returns: (success, output)
+        :rtype: tuple
+
+        :raises IpmiError: If no shell could run the command.
+
+        """
+        key = tuple(args)
+        with self._lock:
+            slots = self._slots.get(key)
+            if slots is None:
+                slots = self._slots[key] = BoundedSemaphore(self.size)
+        with slots:
+            for attempt in range(2):
+                shell = self._acquire(key)
+                try:
+                    shell.send(command_args)
+                except IpmiError:
+                    if attempt:
+                        raise
+                    continue
+                result = shell.receive()
+                self._release(key, shell)
+                return result
+
+    def close(self):
+        """Close all idle shells."""
+        with self._lock:
+            shells = [x for shells in self._idle.values() for x in shells]
+            self._idle = {}
+        for shell in shells:
+            shell.close()
+
+    def _acquire(self, key):
+        """Take an idle shell for this key, or start a new one."""
+        expired = []
+        shell = None
+        with self._lock:
+            now = time.time()
+            for other_key, shells in self._idle.items():
+                for other in shells[:]:
+                    if (now - other.last_used > self.idle_timeout or
+                            not other.is_alive()):
+                        shells.remove(other)
+                        expired.append(other)
+                if not shells:
+                    del self._idle[other_key]
+            if self._idle.get(key):
+                shell = self._idle[key].pop()
+        for other in expired:
+            other.close()
+
+        if shell is None:
+            shell = IpmitoolShell(key, timeout=self.timeout)
+            with self._lock:
+                self.spawned += 1
+        return shell
+
+    def _release(self, key, shell):
+        """Return a shell to the pool, or close it if the pool is full."""
+        with self._lock:
+            shells = self._idle.setdefault(key, [])
+            if len(shells) < self.size:
+                shells.append(shell)
+                return
+        shell.close()
+
+
+class PooledIpmiTool(IpmiTool):
+    """A pyipmi tool that sends commands through an IpmitoolShellPool.
+
+    Bind it to a pool with pooled_tool_class(), and pass the result to
+    pyipmi.make_bmc as tool_class. Interactive commands (e.g. SOL) still
+    get their own ipmitool process.
+
+    """
+
+    pool = None
+
+    def _execute(self, command, args):
+        """Execute an ipmitool command on a pooled shell"""
+        command_args = [str(x) for x in command.ipmitool_args]
+        base_args = args[:len(args) - len(command_args)]
+        success, output = self.pool.execute(base_args, command_args)
+        self._log(output)
+        if success:
+            return output, ""
+        command.handle_command_error("", output)
+        return "", output
+
+
+def pooled_tool_class(pool):
+    """Get a PooledIpmiTool class bound to this pool.
+
+    :param pool: The shell pool to use.
+    :type pool: IpmitoolShellPool
+
+    :returns: A subclass of PooledIpmiTool.
+    :rtype: class
+
+    """
+    return type("PooledIpmiTool", (PooledIpmiTool,), {"pool": pool})
+
+
+def is_error(output):
+    """Check whether ipmitool output reports an error.
+
+    Only the first line is checked, so that later output (e.g. sensor or SEL
+    entries) can't be mistaken for an error.
+
+    :param output: Output of one ipmitool command.
+    :type output: string
+
+    :returns: True if ipmitool reported an error.
+    :rtype: boolean
+
+    """
+    line = output.strip().split("\n")[0].strip()
+    return (line.startswith(ERROR_PREFIXES) or
+            ERROR_PATTERN.search(line) is not None)
+
+
+def _quote(arg):
+    """Quote an argument for the ipmitool shell's tokenizer."""
+    arg = str(arg)
+    if not arg or any(x.isspace() for x in arg):
+        return '"%s"' % arg
+    return arg
+
+
+_POOLS = weakref.WeakSet()
+
+
+def _close_pools():
+    """Close the shells of every pool at exit."""
+    for pool in list(_POOLS):
+        pool.close()
+
+atexit.register(_close_pools)
+
+
+# End of file: ./ipmishell.py
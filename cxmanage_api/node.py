@@ -34,23 +34,33 @@
 
 import os
 import re
+import copy
 import time
 import tempfile
 import socket
 import subprocess
 
+from contextlib import contextmanager
+from threading import Thread
 from distutils.version import LooseVersion
 from pyipmi import make_bmc, IpmiError
 from pyipmi.bmc import LanBMC as BMC
+from pyipmi.tools import IpmiTool
 from tftpy.TftpShared import TftpException
 
 from cxmanage_api import loggers
 from cxmanage_api import temp_file
 from cxmanage_api.tftp import InternalTftp, ExternalTftp
+from cxmanage_api.transport import DEFAULT_TRANSPORT_CACHE
+from cxmanage_api.wait import DEFAULT_WAIT_SCHEDULE
+from cxmanage_api.tasks import Task, DEFAULT_INFLIGHT_LIMITER
+from cxmanage_api.ipmishell import pooled_tool_class
+from cxmanage_api.ipmibatch import IpmiBatch, batching_tool_class
+from cxmanage_api.sdrcache import parse_sensor_readings
 from cxmanage_api.image import Image as IMAGE
 from cxmanage_api.ubootenv import UbootEnv as UBOOTENV
 from cxmanage_api.ip_retriever import IPRetriever as IPRETRIEVER
-from cxmanage_api.decorators import retry
+from cxmanage_api.decorators import retry, breaker, CircuitBreaker
 from cxmanage_api.credentials import Credentials
 from cxmanage_api.cx_exceptions import TimeoutError, NoSensorError, \
         SocmanVersionError, FirmwareConfigError, PriorityIncrementError, \
@@ -59,6 +69,10 @@ from cxmanage_api.cx_exceptions import TimeoutError, NoSensorError, \
         NodeMismatchError
 
 
+# Errors that count against a node's circuit breaker
+BREAKER_ERRORS = (IpmiError, TftpException, TimeoutError)
+
+
 # pylint: disable=R0902, R0904
 class Node(object):
     """A node is a single instance of an ECME.
@@ -81,12 +95,30 @@ class Node(object):
     :type image: `Image <image.html>`_
     :param ubootenv: UbootEnv  for this node. Default cxmanage_api.UbootEnv
     :type ubootenv: `UbootEnv <ubootenv.html>`_
+    :param transport_cache: Remembers which TFTP path works for this node.
+                            Default: transport.DEFAULT_TRANSPORT_CACHE
+    :type transport_cache: `TransportCache <transport.html>`_
+    :param wait_schedule: Polling schedule used when waiting on the node.
+                          Default: wait.DEFAULT_WAIT_SCHEDULE
+    :type wait_schedule: `WaitSchedule <wait.html>`_
+    :param ipmitool_pool: Send IPMI commands through long-lived ipmitool
+                          shells from this pool, instead of starting
+                          ipmitool for every command. Default: no pool.
+    :type ipmitool_pool: `IpmitoolShellPool <ipmishell.html>`_
+    :param inflight_limiter: Caps concurrent requests to this node's ECME.
+                             Default: tasks.DEFAULT_INFLIGHT_LIMITER
+    :type inflight_limiter: `InflightLimiter <tasks.html>`_
+    :param sdr_cache: Cache SDRs here, and only read the sensors asked for
+                      once they're cached. Default: no cache.
+    :type sdr_cache: `SdrCache <sdrcache.html>`_
 
     """
     # pylint: disable=R0913
     def __init__(self, ip_address, credentials=None, tftp=None,
                  ecme_tftp_port=5001, verbose=False, bmc=None, image=None,
-                 ubootenv=None, ipretriever=None):
+                 ubootenv=None, ipretriever=None, transport_cache=None,
+                 wait_schedule=None, ipmitool_pool=None,
+                 inflight_limiter=None, sdr_cache=None):
         """Default constructor for the Node class."""
         if (not tftp):
             tftp = InternalTftp.default()
@@ -100,6 +132,12 @@ class Node(object):
             ubootenv = UBOOTENV
         if (not ipretriever):
             ipretriever = IPRETRIEVER
+        if (transport_cache is None):
+            transport_cache = DEFAULT_TRANSPORT_CACHE
+        if (wait_schedule is None):
+            wait_schedule = DEFAULT_WAIT_SCHEDULE
+        if (inflight_limiter is None):
+            inflight_limiter = DEFAULT_INFLIGHT_LIMITER
 
         self.ip_address = ip_address
         self.credentials = Credentials(credentials)
@@ -107,16 +145,37 @@ class Node(object):
         self.ecme_tftp = ExternalTftp(ip_address, ecme_tftp_port)
         self.verbose = verbose
 
+        tool_class = IpmiTool
+        if (ipmitool_pool):
+            tool_class = pooled_tool_class(ipmitool_pool)
         self.bmc = make_bmc(
             bmc, hostname=ip_address, username=self.credentials.ecme_username,
-            password=self.credentials.ecme_password, verbose=verbose
+            password=self.credentials.ecme_password, verbose=verbose,
+            tool_class=batching_tool_class(tool_class)
         )
+        self.ipmitool_pool = ipmitool_pool
         self.image = image
         self.ubootenv = ubootenv
         self.ipretriever = ipretriever
+        self.transport_cache = transport_cache
+        self.wait_schedule = wait_schedule
+        self.inflight_limiter = inflight_limiter
+        self.sdr_cache = sdr_cache
+        self.wait_stats = {}
+        self.breaker = CircuitBreaker(name=ip_address)
+
+        # Seconds that cached fwinfo/info basic results stay valid
+        self.snapshot_ttl = 60
+        # Seconds mc_reset(wait=True) gives the ECME to stop answering
+        self.mc_reset_down_timeout = 30
+        self._fwinfo = None
+        self._info_basic = None
+        self._ubootenv = None
 
         self._node_id = None
         self._guid = None
+        self._hardware_version = None
+        self._tftp_probe = None
 
     def __eq__(self, other):
         return isinstance(other, Node) and self.ip_address == other.ip_address
@@ -181,6 +240,49 @@ class Node(object):
         """
         self._node_id = value
 
+    @guid.setter
+    def guid(self, value):
+        """ Sets the GUID for this node, e.g. from a cached topology.
+
+        :param value: The value we want to set.
+        :type value: string
+
+        """
+        self._guid = value
+
+    @property
+    def has_guid(self):
+        """Returns whether the GUID is known, i.e. whether reading
+        node.guid can be done without an IPMI call.
+
+        :rtype: boolean
+
+        """
+        return self._guid is not None
+
+    @property
+    def hardware_version(self):
+        """Returns the card type and revision of this node.
+
+        >>> node.hardware_version
+        'EnergyCard X04'
+
+        :returns: The hardware version, or "Unknown" if the ECME can't tell us.
+        :rtype: string
+
+        """
+        return self._get_hardware_version()
+
+    @hardware_version.setter
+    def hardware_version(self, value):
+        """ Sets the hardware version, e.g. from a cached topology.
+
+        :param value: The value we want to set.
+        :type value: string
+
+        """
+        self._hardware_version = value
+
     def refresh(self, new_node):
         """ Updates mutable properties for this node, based from another node
         object.
@@ -248,6 +350,7 @@ communication.
         """
         self.bmc.fabric_rm_macaddr(iface=iface, macaddr=macaddr)
 
+    @breaker(BREAKER_ERRORS)
     def get_power(self):
         """Returns the power status for this node.
 
@@ -264,7 +367,8 @@ communication.
         """
         return self.bmc.get_chassis_status().power_on
 
-    def set_power(self, mode, ignore_existing_state=False):
+    @breaker(BREAKER_ERRORS)
+    def set_power(self, mode, ignore_existing_state=False, wait=False):
         """Send an IPMI power command to this target.
 
         >>> # To turn the power 'off'
@@ -282,6 +386,10 @@ communication.
                                       to turn on or off the node if it is not
                                       turned on or off, respectively.
         :type ignore_existing_state: boolean
+        :param wait: Wait for the node to reach the requested power state.
+        :type wait: boolean
+
+        :raises TimeoutError: If the node doesn't reach the state in time.
 
         """
         if ignore_existing_state:
@@ -291,6 +399,17 @@ communication.
                 return
         self.bmc.set_chassis_power(mode=mode)
 
+        if wait:
+            # Everything except "off" and "soft" should leave the node on
+            expected = mode not in ["off", "soft"]
+            self.wait_stats["set_power"] = self.wait_schedule.wait_for(
+                lambda: self.get_power() == expected, timeout=120,
+                allowed_errors=(IpmiError,),
+                message="Node did not power %s in time" %
+                        ("on" if expected else "off")
+            )
+
+    @breaker(BREAKER_ERRORS)
     def get_power_policy(self):
         """Return power status reported by IPMI.
 
@@ -306,6 +425,7 @@ communication.
         """
         return self.bmc.get_chassis_status().power_restore_policy
 
+    @breaker(BREAKER_ERRORS)
     def set_power_policy(self, state):
         """Set default power state for Linux side.
 
@@ -321,6 +441,7 @@ communication.
         """
         self.bmc.set_chassis_policy(state)
 
+    @breaker(BREAKER_ERRORS)
     def mc_reset(self, wait=False):
         """Sends a Master Control reset command to the node.
 
@@ -331,27 +452,39 @@ communication.
 
         :raises Exception: If the BMC command contains errors.
         :raises IPMIError: If there is an IPMI error communicating with the BMC.
+        :raises TimeoutError: If the node never goes down, or doesn't come
+                              back up in time.
 
         """
         self.bmc.mc_reset("cold")
+        self.invalidate_snapshot()
 
         if wait:
             deadline = time.time() + 300.0
 
-            # Wait for it to go down...
-            time.sleep(60)
-
-            # Now wait to come back up!
-            while time.time() < deadline:
-                time.sleep(1)
+            def is_down():
+                """True once the ECME stops answering."""
                 try:
                     self.bmc.get_info_basic()
-                    break
+                    return False
                 except IpmiError:
-                    pass
-            else:
-                raise Exception("Reset timed out")
+                    return True
+
+            # Wait for it to go down... Until it does, a successful poll
+            # would only tell us the reset hasn't happened yet.
+            self.wait_stats["mc_reset_down"] = self.wait_schedule.wait_for(
+                is_down, timeout=self.mc_reset_down_timeout,
+                message="Reset timed out: node never went down"
+            )
+
+            # Now wait to come back up!
+            self.wait_stats["mc_reset_up"] = self.wait_schedule.wait_for(
+                lambda: not is_down(),
+                timeout=max(deadline - time.time(), 0),
+                message="Reset timed out"
+            )
 
+    @breaker(BREAKER_ERRORS)
     def get_sel(self):
         """Get the system event log for this node.
 
@@ -375,6 +508,7 @@ Initiated by power up | Asserted',
         """
         return self.bmc.sel_elist()
 
+    @breaker(BREAKER_ERRORS)
     def get_sensors(self, search=""):
         """Get a list of sensor objects that match search criteria.
 
@@ -418,8 +552,11 @@ Initiated by power up | Asserted',
         :rtype: dictionary of pyipmi objects
 
         """
-        sensors = [x for x in self.bmc.sdr_list()
-                   if search.lower() in x.sensor_name.lower()]
+        if (self.sdr_cache):
+            sensors = self._get_cached_sensors(search)
+        else:
+            sensors = [x for x in self.bmc.sdr_list()
+                       if search.lower() in x.sensor_name.lower()]
 
         if (len(sensors) == 0):
             if (search == ""):
@@ -563,9 +700,13 @@ Initiated by power up | Asserted',
         return dict((key, vars(value))
                     for key, value in self.get_sensors(search=search).items())
 
+    @breaker(BREAKER_ERRORS)
     def get_firmware_info(self):
         """Gets firmware info for each partition on the Node.
 
+        .. note::
+            * Results are cached for a short time. See snapshot().
+
         >>> node.get_firmware_info()
         [<pyipmi.fw.FWInfo object at 0x2019850>,
         <pyipmi.fw.FWInfo object at 0x2019b10>,
@@ -578,15 +719,64 @@ Initiated by power up | Asserted',
 communication.
 
         """
-        fwinfo = [x for x in self.bmc.get_firmware_info()
-                  if hasattr(x, "partition")]
+        return [copy.copy(x) for x in self._get_cached_fwinfo()]
+
+    def snapshot(self, refresh=False):
+        """Get cached firmware info and info basic results for this node.
+
+        Results are fetched on first use and kept for snapshot_ttl seconds,
+        or until something changes the partitions (firmware updates, config
+        resets, u-boot environment writes). Copies are returned, so callers
+        are free to modify them.
+
+        >>> node.snapshot()
+        {'fwinfo': [<pyipmi.fw.FWInfo object at 0x2019850>, ...],
+         'info_basic': <pyipmi.info.InfoBasicResult object at 0x2019b90>}
+
+        :param refresh: Fetch fresh results, even if the cache is still valid.
+        :type refresh: boolean
+
+        :return: Firmware info and info basic results.
+        :rtype: dictionary
+
+        :raises IpmiError: If errors in the command occur with BMC \
+communication.
+
+        """
+        if refresh:
+            self.invalidate_snapshot()
+
+        info_basic = copy.copy(self._get_cached_info_basic())
+        return {"info_basic": info_basic, "fwinfo": self.get_firmware_info()}
+
+    def prefetch(self, calls):
+        """Run several BMC reads in one ipmitool process and session.
 
-        # Clean up the fwinfo results
-        for entry in fwinfo:
-            if (entry.version == ""):
-                entry.version = "Unknown"
+        The output is kept for snapshot_ttl seconds, and answers the next
+        call of each BMC method. See `IpmiBatch <ipmibatch.html>`_.
 
-        return fwinfo
+        >>> node.prefetch(['get_info_basic', 'lan_print', 'sdr_list'])
+        3
+        >>> node.get_sensors()  # No new ipmitool process
+
+        :param calls: BMC method names, or (name, args) tuples.
+        :type calls: list
+
+        :returns: The number of commands that got output.
+        :rtype: integer
+
+        """
+        return IpmiBatch(self.bmc, calls, ttl=self.snapshot_ttl).execute()
+
+    def invalidate_snapshot(self):
+        """Drop cached firmware info, info basic and u-boot environment.
+
+        >>> node.invalidate_snapshot()
+
+        """
+        self._fwinfo = None
+        self._info_basic = None
+        self._ubootenv = None
 
     def get_firmware_info_dict(self):
         """Gets firmware info for each partition on the Node.
@@ -800,6 +990,7 @@ communication.
 
         if package.version:
             self.bmc.set_firmware_version(package.version)
+            self._info_basic = None
 
         # Post verify
         fwinfo = self.get_firmware_info()
@@ -936,6 +1127,7 @@ communication.
                 time.sleep(5)  # pausing between retries seems to help a little
         else:
             self.bmc.reset_firmware()
+        self.invalidate_snapshot()
 
         # Reset ubootenv
         try:
@@ -960,23 +1152,8 @@ communication.
         :type boot_args: list
 
         """
-        fwinfo = self.get_firmware_info()
-        first_part = self._get_partition(fwinfo, "UBOOTENV", "FIRST")
-        active_part = self._get_partition(fwinfo, "UBOOTENV", "ACTIVE")
-
-        # Download active ubootenv, modify, then upload to first partition
-        image = self._download_image(active_part)
-        ubootenv = self.ubootenv(open(image.filename).read())
-        ubootenv.set_boot_order(boot_args)
-        priority = max(int(x.priority, 16) for x in [first_part, active_part])
-
-        filename = temp_file()
-        with open(filename, "w") as file_:
-            file_.write(ubootenv.get_contents())
-
-        ubootenv_image = self.image(filename, image.type, False, image.daddr,
-                                    image.skip_crc32, image.version)
-        self._upload_image(ubootenv_image, first_part, priority)
+        with self.edit_ubootenv() as ubootenv:
+            ubootenv.set_boot_order(boot_args)
 
     def get_boot_order(self):
         """Returns the boot order for this node.
@@ -996,23 +1173,8 @@ communication.
         :type boot_args: string
 
         """
-        fwinfo = self.get_firmware_info()
-        first_part = self._get_partition(fwinfo, "UBOOTENV", "FIRST")
-        active_part = self._get_partition(fwinfo, "UBOOTENV", "ACTIVE")
-
-        # Download active ubootenv, modify, then upload to first partition
-        image = self._download_image(active_part)
-        ubootenv = self.ubootenv(open(image.filename).read())
-        ubootenv.set_pxe_interface(interface)
-        priority = max(int(x.priority, 16) for x in [first_part, active_part])
-
-        filename = temp_file()
-        with open(filename, "w") as file_:
-            file_.write(ubootenv.get_contents())
-
-        ubootenv_image = self.image(filename, image.type, False, image.daddr,
-                                    image.skip_crc32, image.version)
-        self._upload_image(ubootenv_image, first_part, priority)
+        with self.edit_ubootenv() as ubootenv:
+            ubootenv.set_pxe_interface(interface)
 
     def get_pxe_interface(self):
         """Returns the current pxe interface for this node.
@@ -1022,6 +1184,7 @@ communication.
         """
         return self.get_ubootenv().get_pxe_interface()
 
+    @breaker(BREAKER_ERRORS)
     def get_versions(self):
         """Get version info from this node.
 
@@ -1041,8 +1204,37 @@ communication.
         :raises Exception: If there are errors within the command response.
 
         """
-        result = self.bmc.get_info_basic()
-        fwinfo = self.get_firmware_info()
+        calls = self._snapshot_calls() + ["pmic_get_version"]
+        if self._hardware_version is None:
+            calls.append("get_info_card")
+        with IpmiBatch(self.bmc, calls, ttl=self.snapshot_ttl) as batch:
+            return self._get_versions(batch, calls)
+
+    def _get_versions(self, batch, calls):
+        """Get version info.
+
+        Sub-queries whose BMC read is already answered (by our own cache,
+        or by the batch's output) run inline. Only the ones the batch
+        didn't answer go through pipeline(), to run concurrently.
+        """
+        queries = [
+            ("get_info_basic", self._get_cached_info_basic),
+            ("get_firmware_info", self.get_firmware_info),
+            ("get_info_card", self._get_hardware_version),
+            ("pmic_get_version", self._get_pmic_version)
+        ]
+        results = [None] * len(queries)
+        pending = []
+        for i, (method, query) in enumerate(queries):
+            if method not in calls or batch.answered(method):
+                results[i] = query()
+            else:
+                pending.append(i)
+        for i, value in zip(pending, self.pipeline(
+                *[queries[i][1] for i in pending])):
+            results[i] = value
+        info_basic, fwinfo, hardware_version, pmic_version = results
+        result = copy.copy(info_basic)
 
         # components maps variables to firmware partition types
         components = [
@@ -1074,22 +1266,32 @@ communication.
             except NoPartitionError:
                 pass
 
+        result.hardware_version = hardware_version
+        if pmic_version is not None:
+            result.pmic_version = pmic_version
+
+        return result
+
+    def _get_hardware_version(self):
+        """Get the card type and revision, or "Unknown"."""
+        if self._hardware_version is not None:
+            return self._hardware_version
         try:
             card = self.bmc.get_info_card()
-            result.hardware_version = "%s X%02i" % (
-                card.type, int(card.revision)
-            )
+            self._hardware_version = "%s X%02i" % (card.type,
+                                                   int(card.revision))
+            return self._hardware_version
         except IpmiError:
             # Should raise an error, but we want to allow the command
             # to continue gracefully if the ECME is out of date.
-            result.hardware_version = "Unknown"
+            return "Unknown"
 
+    def _get_pmic_version(self):
+        """Get the PMIC version, or None if the ECME can't tell us."""
         try:
-            result.pmic_version = self.bmc.pmic_get_version()
+            return self.bmc.pmic_get_version()
         except IpmiError:
-            pass
-
-        return result
+            return None
 
     def get_versions_dict(self):
         """Get version info from this node.
@@ -1125,6 +1327,55 @@ communication.
         """
         return vars(self.get_versions())
 
+    def pipeline(self, *calls):
+        """Run independent queries on this node concurrently.
+
+        Each query holds one of the ECME's in-flight slots while it runs (see
+        inflight_limiter), so the whole thing takes about as long as the
+        slowest query, without flooding the ECME. Called from inside another
+        pipelined query, the queries just run one after another.
+
+        >>> sensors, fwinfo = node.pipeline(node.get_sensors_dict,
+        ...                                 node.get_firmware_info_dict)
+
+        :param calls: Methods to call, or (method, arg, ...) tuples.
+        :type calls: list
+
+        :returns: The result of each call, in order.
+        :rtype: list
+
+        :raises Exception: The first failed call's error, once every call
+                           has finished.
+
+        """
+        limiter, key = self.inflight_limiter, self.ip_address
+
+        def run(task):
+            """Run a task in one of the ECME's slots."""
+            with limiter.slot(key):
+                # pylint: disable=W0212
+                task._run()
+
+        tasks = [Task(*(call if isinstance(call, tuple) else (call,)))
+                 for call in calls]
+        if limiter.holds(key):
+            for task in tasks:
+                run(task)
+        else:
+            threads = [Thread(target=run, args=(task,)) for task in tasks[1:]]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            if tasks:
+                run(tasks[0])
+            for thread in threads:
+                thread.join()
+
+        for task in tasks:
+            if task.status == "Failed":
+                raise task.error
+        return [task.result for task in tasks]
+
     def ipmitool_command(self, ipmitool_args):
         """Send a raw ipmitool command to the node.
 
@@ -1154,6 +1405,20 @@ communication.
         if (self.verbose):
             print "Running %s" % " ".join(command)
 
+        if (self.ipmitool_pool):
+            # Leading options (e.g. -S <sdr cache>) belong to the shell's
+            # command line, not to the command
+            shell_args = command[:len(command) - len(ipmitool_args)]
+            while (ipmitool_args[:1] and ipmitool_args[0].startswith("-")):
+                shell_args += ipmitool_args[:2]
+                ipmitool_args = ipmitool_args[2:]
+            success, output = self.ipmitool_pool.execute(
+                shell_args, ipmitool_args
+            )
+            if not success:
+                raise IpmiError(output)
+            return output
+
         process = subprocess.Popen(command, stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE)
         stdout, stderr = process.communicate()
@@ -1161,22 +1426,119 @@ communication.
             raise IpmiError(stderr.strip())
         return (stdout + stderr).strip()
 
+    @breaker(BREAKER_ERRORS)
     def get_ubootenv(self):
         """Get the active u-boot environment.
 
+        .. note::
+            * The downloaded environment is cached until the next write. Each
+              call returns a new UbootEnv, so changes aren't shared.
+
         >>> node.get_ubootenv()
         <cxmanage_api.ubootenv.UbootEnv instance at 0x209da28>
 
         :return: U-Boot Environment object.
         :rtype: `UBootEnv <ubootenv.html>`_
 
+        """
+        _, contents = self._get_cached_ubootenv()
+        return self.ubootenv(contents)
+
+    def set_ubootenv(self, ubootenv):
+        """Write a u-boot environment to this node.
+
+        The environment is written to the first UBOOTENV partition, with a
+        priority that makes it the active one.
+
+        >>> ubootenv = node.get_ubootenv()
+        >>> ubootenv.set_boot_order(['pxe', 'disk'])
+        >>> node.set_ubootenv(ubootenv)
+
+        :param ubootenv: U-Boot Environment to write.
+        :type ubootenv: `UBootEnv <ubootenv.html>`_
+
+        """
+        self.upload_ubootenv_image(self.build_ubootenv_image(ubootenv))
+
+    def build_ubootenv_image(self, ubootenv):
+        """Build a UBOOTENV image for an environment, using the SIMG settings
+        of this node's active UBOOTENV partition.
+
+        >>> image = node.build_ubootenv_image(node.get_ubootenv())
+
+        :param ubootenv: U-Boot Environment to build an image of.
+        :type ubootenv: `UBootEnv <ubootenv.html>`_
+
+        :return: An image ready to pass to upload_ubootenv_image().
+        :rtype: `Image <image.html>`_
+
+        """
+        image, _ = self._get_cached_ubootenv()
+
+        filename = temp_file()
+        with open(filename, "w") as file_:
+            file_.write(ubootenv.get_contents())
+
+        return self.image(filename, image.type, False, image.daddr,
+                          image.skip_crc32, image.version)
+
+    def get_ubootenv_image_settings(self):
+        """Get the SIMG settings build_ubootenv_image() uses, taken from this
+        node's active UBOOTENV partition. Nodes with the same settings and
+        environment can share one image.
+
+        >>> node.get_ubootenv_image_settings()
+        ('UBOOTENV', 0, False, 0)
+
+        :return: (type, daddr, skip_crc32, version)
+        :rtype: tuple
+
+        """
+        image, _ = self._get_cached_ubootenv()
+        return (image.type, image.daddr, image.skip_crc32, image.version)
+
+    def upload_ubootenv_image(self, image):
+        """Write a UBOOTENV image to this node.
+
+        The image is written to the first UBOOTENV partition, with a priority
+        that makes it the active one. The same image can be uploaded to many
+        nodes; its SIMG is only rendered once per priority.
+
+        >>> node.upload_ubootenv_image(image)
+
+        :param image: Image from build_ubootenv_image().
+        :type image: `Image <image.html>`_
+
         """
         fwinfo = self.get_firmware_info()
-        partition = self._get_partition(fwinfo, "UBOOTENV", "ACTIVE")
-        image = self._download_image(partition)
-        return self.ubootenv(open(image.filename).read())
+        first_part = self._get_partition(fwinfo, "UBOOTENV", "FIRST")
+        active_part = self._get_partition(fwinfo, "UBOOTENV", "ACTIVE")
+        priority = max(int(x.priority, 16) for x in [first_part, active_part])
+
+        self._upload_image(image, first_part, priority)
+
+    @contextmanager
+    def edit_ubootenv(self):
+        """Edit the u-boot environment with a single download and upload.
+
+        The active environment is read (or taken from the cache), handed to
+        the caller, and written back when the block exits cleanly. If the
+        block raises, nothing is written.
+
+        >>> with node.edit_ubootenv() as ubootenv:
+        ...     ubootenv.set_boot_order(['pxe', 'disk'])
+        ...     ubootenv.set_pxe_interface('eth0')
 
-    @retry(3, allowed_errors=(IpmiError, TftpException, ParseError))
+        :return: U-Boot Environment to modify.
+        :rtype: `UBootEnv <ubootenv.html>`_
+
+        """
+        ubootenv = self.get_ubootenv()
+        yield ubootenv
+        self.set_ubootenv(ubootenv)
+
+    @retry(3, allowed_errors=(IpmiError, TftpException, ParseError),
+           delay=0.5, jitter=0.25, budget=30)
     def get_fabric_ipinfo(self, allow_errors=False):
         """Gets what ip information THIS node knows about the Fabric.
 
@@ -1232,7 +1594,8 @@ communication.
 
         return results
 
-    @retry(3, allowed_errors=(IpmiError, TftpException, ParseError))
+    @retry(3, allowed_errors=(IpmiError, TftpException, ParseError),
+           delay=0.5, jitter=0.25, budget=30)
     def get_fabric_macaddrs(self):
         """Gets what macaddr information THIS node knows about the Fabric.
 
@@ -1316,8 +1679,11 @@ communication.
         # Parse addresses from ipinfo file
         results = {}
         for line in contents.splitlines():
-            node_id = int(line.replace('Node ', '')[0])
-            ul_info = line.replace('Node %s:' % node_id, '').strip().split(',')
+            if not line.strip():
+                continue
+            node, ul_info = line.split(':', 1)
+            node_id = int(node.replace('Node', ''))
+            ul_info = ul_info.strip().split(',')
             node_data = {}
             for ul_ in ul_info:
                 data = tuple(ul_.split())
@@ -1625,6 +1991,43 @@ obtained.
             hexfile.seek(offset)
             return(hexfile.read(bytes_to_read))
 
+    def probe_tftp(self, refresh=False):
+        """Checks which TFTP paths work for this node, using a small ipinfo
+        transfer instead of a full firmware image.
+
+        The "ecme" path is the TFTP server hosted by the ECME itself, and the
+        "host" path is our own TFTP server. The result is cached for the
+        session, and the fastest working path is recorded in our transport
+        cache so later transfers try it first.
+
+        >>> node.probe_tftp()
+        {'ecme': None, 'host': 0.0421}
+
+        :param refresh: Probe again, even if we have a cached result.
+        :type refresh: boolean
+
+        :return: A map of path name to transfer latency in seconds, or None if
+                 the path failed.
+        :rtype: dictionary
+
+        """
+        if self._tftp_probe is None or refresh:
+            self._tftp_probe = {
+                "ecme": self._probe_ecme_tftp(),
+                "host": self._probe_host_tftp()
+            }
+
+            working = [(latency, path) for path, latency
+                       in self._tftp_probe.iteritems() if latency is not None]
+            if working:
+                latency, path = min(working)
+                self.transport_cache.record(self.ip_address, path, latency)
+            else:
+                self.transport_cache.invalidate(self.ip_address)
+
+        return dict(self._tftp_probe)
+
+    @breaker(BREAKER_ERRORS)
     def run_fabric_tftp_command(self, function_name, **kwargs):
         """Run a fabric TFTP command and return the contents of the file.
 
@@ -1637,11 +2040,14 @@ obtained.
         """
         filename = temp_file()
         basename = os.path.basename(filename)
-        try:
+
+        def ecme_transfer():
+            """Have the ECME serve the file from its own TFTP server."""
             getattr(self.bmc, function_name)(filename=basename, **kwargs)
             self.ecme_tftp.get_file(basename, filename)
 
-        except (IpmiError, TftpException):
+        def host_transfer():
+            """Have the ECME push the file to our TFTP server."""
             getattr(self.bmc, function_name)(
                 filename=basename,
                 tftp_addr=self.tftp_address,
@@ -1661,6 +2067,7 @@ obtained.
             if os.path.getsize(filename) == 0:
                 raise TftpException("Node failed to reach TFTP server")
 
+        self._tftp_transfer(ecme_transfer, host_transfer)
         return open(filename, "rb").read()
 
     @staticmethod
@@ -1723,25 +2130,32 @@ obtained.
         filename = image.render_to_simg(priority, daddr)
         basename = os.path.basename(filename)
 
-        for _ in xrange(2):
-            try:
-                self.bmc.register_firmware_write(
-                    basename,
-                    partition_id,
-                    image.type
-                )
-                self.ecme_tftp.put_file(filename, basename)
-                break
-            except (IpmiError, TftpException):
-                pass
-        else:
-            # Fall back and use TFTP server
+        def ecme_transfer():
+            """Push the image to the ECME's own TFTP server."""
+            for attempt in xrange(2):
+                try:
+                    self.bmc.register_firmware_write(
+                        basename,
+                        partition_id,
+                        image.type
+                    )
+                    self.ecme_tftp.put_file(filename, basename)
+                    return
+                except (IpmiError, TftpException):
+                    if attempt == 1:
+                        raise
+
+        def host_transfer():
+            """Have the ECME pull the image from our TFTP server."""
             self.tftp.put_file(filename, basename)
             result = self.bmc.update_firmware(basename, partition_id,
                     image.type, self.tftp_address)
             self._wait_for_transfer(result.tftp_handle_id)
 
+        self._tftp_transfer(ecme_transfer, host_transfer)
+
         # Verify crc and activate
+        self.invalidate_snapshot()
         self.bmc.check_firmware(partition_id)
         self.bmc.activate_firmware(partition_id)
 
@@ -1752,38 +2166,222 @@ obtained.
         partition_id = int(partition.partition)
         image_type = partition.type.split()[1][1:-1]
 
-        for _ in xrange(2):
-            try:
-                self.bmc.register_firmware_read(
-                    basename,
-                    partition_id,
-                    image_type
-                )
-                self.ecme_tftp.get_file(basename, filename)
-                break
-            except (IpmiError, TftpException):
-                pass
-        else:
-            # Fall back and use TFTP server
+        def ecme_transfer():
+            """Pull the image from the ECME's own TFTP server."""
+            for attempt in xrange(2):
+                try:
+                    self.bmc.register_firmware_read(
+                        basename,
+                        partition_id,
+                        image_type
+                    )
+                    self.ecme_tftp.get_file(basename, filename)
+                    return
+                except (IpmiError, TftpException):
+                    if attempt == 1:
+                        raise
+
+        def host_transfer():
+            """Have the ECME push the image to our TFTP server."""
             result = self.bmc.retrieve_firmware(basename, partition_id,
                     image_type, self.tftp_address)
             self._wait_for_transfer(result.tftp_handle_id)
             self.tftp.get_file(basename, filename)
 
+        self._tftp_transfer(ecme_transfer, host_transfer)
+
         return self.image(filename=filename, image_type=image_type,
                           daddr=int(partition.daddr, 16),
                           version=partition.version)
 
+    def _get_cached_fwinfo(self):
+        """Get fwinfo from the BMC, unless we have a recent enough copy."""
+        if (self._fwinfo is None or
+                time.time() - self._fwinfo[0] > self.snapshot_ttl):
+            fwinfo = [x for x in self.bmc.get_firmware_info()
+                      if hasattr(x, "partition")]
+
+            # Clean up the fwinfo results
+            for entry in fwinfo:
+                if (entry.version == ""):
+                    entry.version = "Unknown"
+
+            self._fwinfo = (time.time(), fwinfo)
+        return self._fwinfo[1]
+
+    def _get_cached_ubootenv(self):
+        """Get the active ubootenv image and its contents, downloading it
+        unless we have a recent enough copy.
+        """
+        if (self._ubootenv is None or
+                time.time() - self._ubootenv[0] > self.snapshot_ttl):
+            fwinfo = self.get_firmware_info()
+            partition = self._get_partition(fwinfo, "UBOOTENV", "ACTIVE")
+            image = self._download_image(partition)
+            contents = open(image.filename).read()
+            self._ubootenv = (time.time(), image, contents)
+        return self._ubootenv[1:]
+
+    def _snapshot_calls(self):
+        """BMC reads needed to bring the snapshot up to date."""
+        calls = []
+        now = time.time()
+        if (self._info_basic is None or
+                now - self._info_basic[0] > self.snapshot_ttl):
+            calls.append("get_info_basic")
+        if (self._fwinfo is None or
+                now - self._fwinfo[0] > self.snapshot_ttl):
+            calls.append("get_firmware_info")
+        return calls
+
+    def _sdr_cache_key(self):
+        """Key for this node's SDR cache entry. Boards can run the same
+        firmware with different sensors, so it's the hardware version (as in
+        get_versions()) plus the firmware version.
+        """
+        return "%s %s" % (self._get_hardware_version(),
+                          self._get_cached_info_basic().firmware_version)
+
+    def _get_cached_sensors(self, search):
+        """Get the sensors matching search, using our SDR cache.
+
+        On a cache miss, the whole SDR repository is read and dumped for
+        next time. On a hit, only the matching sensors are read. If that
+        fails, the entry is dropped and we read everything instead.
+        """
+        key = self._sdr_cache_key()
+        records = self.sdr_cache.get(key)
+        if (records is not None):
+            records = [x for x in records
+                       if search.lower() in x.sensor_name.lower()]
+            try:
+                if (records):
+                    self._read_sensors(key, records)
+                return records
+            except (IpmiError, OSError):
+                self.sdr_cache.invalidate(key)
+
+        sensors = self.bmc.sdr_list()
+        filename = self.sdr_cache.temp_dump_path(key)
+        try:
+            self.ipmitool_command(["sdr", "dump", filename])
+            self.sdr_cache.commit_dump(key, filename)
+            self.sdr_cache.record(key, sensors)
+        except (IpmiError, OSError):
+            # No dump, no cache; we still have our readings
+            if (os.path.exists(filename)):
+                os.remove(filename)
+        return [x for x in sensors if search.lower() in x.sensor_name.lower()]
+
+    def _read_sensors(self, key, sensors):
+        """Fill in current readings for cached SDRs, reading just these
+        sensors. Units are carried over from the cached readings.
+        """
+        output = self.ipmitool_command(
+            ["-S", self.sdr_cache.dump_path(key), "sensor", "reading"] +
+            [x.sensor_name for x in sensors]
+        )
+        readings = parse_sensor_readings(output)
+        for sensor in sensors:
+            if (not sensor.sensor_name in readings):
+                raise IpmiError("No reading for sensor \"%s\""
+                                % sensor.sensor_name)
+            value = readings[sensor.sensor_name]
+            if (value is None):
+                sensor.sensor_reading = "No Reading"
+                continue
+            units = []
+            parts = getattr(sensor, "sensor_reading", "").split(" ", 1)
+            try:
+                float(parts[0])
+                units = parts[1:]
+            except ValueError:
+                pass
+            sensor.sensor_reading = " ".join([value] + units)
+
+    def _get_cached_info_basic(self):
+        """Get info basic from the BMC, unless we have a recent enough copy."""
+        if (self._info_basic is None or
+                time.time() - self._info_basic[0] > self.snapshot_ttl):
+            self._info_basic = (time.time(), self.bmc.get_info_basic())
+        return self._info_basic[1]
+
+    def _tftp_transfer(self, ecme_transfer, host_transfer):
+        """Run a TFTP transfer, trying the path that last worked first.
+
+        The ECME path is tried first unless our transport cache says the host
+        path works for this node. If the first path fails, its cache entry is
+        dropped and the other path is tried; whichever succeeds is recorded.
+        """
+        paths = [("ecme", ecme_transfer), ("host", host_transfer)]
+        if self.transport_cache.get(self.ip_address) == "host":
+            paths.reverse()
+
+        for i, (path, transfer) in enumerate(paths):
+            start = time.time()
+            try:
+                transfer()
+            except (IpmiError, TftpException, TimeoutError, TransferFailure):
+                self.transport_cache.invalidate(self.ip_address)
+                if i == len(paths) - 1:
+                    raise
+                continue
+            self.transport_cache.record(
+                self.ip_address, path, time.time() - start
+            )
+            return path
+
+    def _probe_ecme_tftp(self):
+        """Time a small transfer from the ECME-hosted TFTP server."""
+        filename = temp_file()
+        basename = os.path.basename(filename)
+        start = time.time()
+        try:
+            self.bmc.fabric_config_get_ip_info(filename=basename)
+            self.ecme_tftp.get_file(basename, filename)
+            if os.path.getsize(filename) > 0:
+                return time.time() - start
+        except (IpmiError, TftpException, IOError, OSError):
+            pass
+        return None
+
+    def _probe_host_tftp(self):
+        """Time a small transfer from the ECME to our TFTP server."""
+        filename = temp_file()
+        basename = os.path.basename(filename)
+        start = time.time()
+        try:
+            self.bmc.fabric_config_get_ip_info(
+                filename=basename, tftp_addr=self.tftp_address
+            )
+        except IpmiError:
+            return None
+
+        deadline = start + 10
+        while (time.time() < deadline):
+            try:
+                self.tftp.get_file(src=basename, dest=filename)
+                if (os.path.getsize(filename) > 0):
+                    return time.time() - start
+            except (TftpException, IOError):
+                pass
+            time.sleep(0.1)
+        return None
+
     def _wait_for_transfer(self, handle):
         """Wait for a firmware transfer to finish."""
-        deadline = time.time() + 180
-        result = self.bmc.get_firmware_status(handle)
-
-        while (result.status == "In progress"):
-            if (time.time() >= deadline):
-                raise TimeoutError("Transfer timed out after 3 minutes")
-            time.sleep(1)
+        def transfer_finished():
+            """Returns the transfer status once it's no longer in progress."""
             result = self.bmc.get_firmware_status(handle)
+            if (result.status != "In progress"):
+                return result
+
+        stats = self.wait_schedule.wait_for(
+            transfer_finished, timeout=180,
+            message="Transfer timed out after 3 minutes"
+        )
+        self.wait_stats["transfer"] = stats
+        result = stats.result
 
         if (result.status != "Complete"):
             raise TransferFailure("Node reported TFTP transfer failure")
@@ -1855,9 +2453,10 @@ obtained.
                         "that's in use"
                     )
 
-        # Try a TFTP download. Would try an upload too, but nowhere to put it.
-        partition = self._get_partition(fwinfo, "SOC_ELF", "FIRST")
-        self._download_image(partition)
+        # Make sure at least one TFTP path works before we commit to anything
+        probe = self.probe_tftp()
+        if all(latency is None for latency in probe.values()):
+            raise TftpException("Node failed to reach TFTP server")
 
     @staticmethod
     def _get_next_priority(fwinfo, package):
@@ -0,0 +1,345 @@
+"""Calxeda: poller.py"""
+
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import re
+import math
+import time
+from array import array
+from threading import Lock, Thread, Event
+
+
+def parse_reading(reading):
+    """Parse a sensor reading string into a number and its units.
+
+    >>> parse_reading('1.200 (+/- 0) Amps')
+    (1.2, 'Amps')
+
+    :param reading: Reading, as pyipmi reports it.
+    :type reading: string
+
+    :returns: (value, units). The value is None if there's no number.
+    :rtype: tuple
+
+    """
+    match = re.match(r"\s*([-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*"
+                     r"(?:\(\+/-\s*[\d.]+\)\s*)?(.*)$", reading or "")
+    if not match:
+        return None, ""
+    try:
+        return float(match.group(1)), match.group(2).strip()
+    except ValueError:
+        return None, ""
+
+
+def nearest_rank(values, percent):
+    """Get a percentile of sorted values, by the nearest-rank method.
+
+    >>> nearest_rank([1, 2, 3, 4], 50)
+    2
+
+    :param values: Values, sorted in ascending order.
+    :type values: list
+    :param percent: Percentile, 0-100.
+    :type percent: float
+
+    :returns: The smallest value that at least percent% of values are less
+              than or equal to, or None if there are no values.
+    :rtype: float
+
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[min(max(rank - 1, 0), len(values) - 1)]
+
+
+class RingBuffer(object):
+    """A fixed-size series of (timestamp, value) samples.
+
+    Samples live in preallocated arrays, 12 bytes per slot, so memory use
+    doesn't grow once the buffer is created. Once full, the oldest samples
+    are overwritten.
+
+    :param size: Number of samples to keep.
+    :type size: integer
+
+    """
+
+    def __init__(self, size):
+        """Default constructor for the RingBuffer class."""
+        self.size = size
+        self.count = 0
+        self._next = 0
+        self._times = array("d", [0.0]) * size
+        self._values = array("f", [0.0]) * size
+
+    def append(self, timestamp, value):
+        """Add a sample, dropping the oldest one if we're full."""
+        self._times[self._next] = timestamp
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def latest(self):
+        """Get the newest (timestamp, value), or None if empty."""
+        if not self.count:
+            return None
+        index = (self._next - 1) % self.size
+        return self._times[index], self._values[index]
+
+    def samples(self, since=None):
+        """Get (timestamp, value) samples, oldest first.
+
+        :param since: Only samples taken at or after this time.
+        :type since: float
+
+        """
+        start = (self._next - self.count) % self.size
+        result = []
+        for i in xrange(self.count):
+            index = (start + i) % self.size
+            if since is None or self._times[index] >= since:
+                result.append((self._times[index], self._values[index]))
+        return result
+
+
+class SensorPoller(object):
+    """Samples sensors across a fabric in the background.
+
+    Every interval, the selected sensors are read from every node (through
+    the fabric, so its task queue, deadline etc. apply). Readings are parsed
+    into numbers once, and kept in a ring buffer per node and sensor, so
+    queries never go back to the hardware.
+
+    Memory is bounded: each series takes 12 bytes per sample, so thousands
+    of nodes with 20 sensors each and size=60 stay in the tens of
+    megabytes.
+
+    >>> from cxmanage_api.poller import SensorPoller
+    >>> poller = SensorPoller(fabric, sensors=['Temp', 'Power'],
+    ...                       interval=10, size=60)
+    >>> poller.start()
+    >>> poller.summary('Node Power', window=300)
+    {'count': 240, 'max': 9.8, 'mean': 6.1, 'min': 4.2}
+    >>> poller.percentile('Node Power', 95, window=300)
+    9.5
+    >>> poller.stop()
+
+    :param fabric: Fabric to poll.
+    :type fabric: `Fabric <fabric.html>`_
+    :param sensors: Sensor name substrings to poll. Default: all sensors.
+    :type sensors: list
+    :param interval: Seconds between polls.
+    :type interval: float
+    :param size: Samples to keep per node and sensor.
+    :type size: integer
+    :param store: Also record every poll here, for history beyond the
+                  ring buffers. Anything with append(timestamp, samples)
+                  and flush() will do (e.g. an EnergyMeter).
+    :type store: `HistoryStore <history.html>`_
+
+    """
+
+    def __init__(self, fabric, sensors=None, interval=10, size=60,
+                 store=None):
+        """Default constructor for the SensorPoller class."""
+        self.fabric = fabric
+        self.sensors = sensors or [""]
+        self.interval = interval
+        self.size = size
+        self.store = store
+        self.units = {}
+        self.errors = {}
+        self.polls = 0
+
+        self._lock = Lock()
+        self._series = {}
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling in a background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling, waiting for the current poll to finish."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self.store:
+            self.store.flush()
+
+    def poll(self):
+        """Read the sensors once, and record the readings.
+
+        Nodes that fail are left out of this sample, with their error kept
+        in self.errors.
+
+        :returns: Number of readings recorded.
+        :rtype: integer
+
+        """
+        timestamp = time.time()
+        tasks = [self.fabric.get_sensors(search, async=True)
+                 for search in self.sensors]
+
+        recorded = 0
+        errors = {}
+        samples = {}
+        for node_tasks in tasks:
+            for node_id, task in node_tasks.iteritems():
+                task.join()
+                if task.status != "Completed":
+                    errors[node_id] = task.error
+                    continue
+                for name, sensor in task.result.iteritems():
+                    value, units = parse_reading(sensor.sensor_reading)
+                    if value is not None:
+                        self._record(node_id, name, timestamp, value, units)
+                        samples[(node_id, name)] = value
+                        recorded += 1
+
+        if self.store:
+            self.store.append(timestamp, samples)
+
+        with self._lock:
+            self.errors = errors
+            self.polls += 1
+        return recorded
+
+    def latest(self, node_id, sensor_name):
+        """Get the newest reading of a sensor on one node.
+
+        :returns: (timestamp, value), or None if we have no samples.
+        :rtype: tuple
+
+        """
+        with self._lock:
+            series = self._series.get((node_id, sensor_name))
+            return series.latest() if series else None
+
+    def series(self, node_id, sensor_name, window=None):
+        """Get the samples of a sensor on one node, oldest first.
+
+        :param window: Only samples from the last this many seconds.
+        :type window: float
+
+        :returns: List of (timestamp, value).
+        :rtype: list
+
+        """
+        since = time.time() - window if window is not None else None
+        with self._lock:
+            series = self._series.get((node_id, sensor_name))
+            return series.samples(since) if series else []
+
+    def values(self, sensor_name, window=None, node_ids=None):
+        """Get the sampled values of a sensor across nodes.
+
+        :param window: Only samples from the last this many seconds.
+        :type window: float
+        :param node_ids: Only these nodes. Default: all nodes.
+        :type node_ids: list
+
+        :returns: Values, in no particular order.
+        :rtype: list
+
+        """
+        since = time.time() - window if window is not None else None
+        with self._lock:
+            return [value for (node_id, name), series
+                    in self._series.iteritems()
+                    if name == sensor_name and
+                    (node_ids is None or node_id in node_ids)
+                    for _, value in series.samples(since)]
+
+    def summary(self, sensor_name, window=None, node_ids=None):
+        """Get min, max and mean of a sensor across nodes.
+
+        :returns: Dictionary with count, min, max and mean (None if there
+                  are no samples).
+        :rtype: dictionary
+
+        """
+        values = self.values(sensor_name, window, node_ids)
+        if not values:
+            return {"count": 0, "min": None, "max": None, "mean": None}
+        return {"count": len(values), "min": min(values),
+                "max": max(values), "mean": sum(values) / len(values)}
+
+    def percentile(self, sensor_name, percent, window=None, node_ids=None):
+        """Get a percentile of a sensor across nodes.
+
+        :param percent: Percentile, 0-100.
+        :type percent: float
+
+        :returns: The value, or None if there are no samples.
+        :rtype: float
+
+        """
+        return nearest_rank(
+            sorted(self.values(sensor_name, window, node_ids)), percent
+        )
+
+    def _record(self, node_id, sensor_name, timestamp, value, units):
+        """Add a sample to a series, creating the series if needed."""
+        with self._lock:
+            series = self._series.get((node_id, sensor_name))
+            if series is None:
+                series = RingBuffer(self.size)
+                self._series[(node_id, sensor_name)] = series
+            series.append(timestamp, value)
+            if units:
+                self.units[sensor_name] = units
+
+    def _run(self):
+        """Poll until stopped."""
+        while not self._stopped.is_set():
+            start = time.time()
+            try:
+                self.poll()
+            # pylint: disable=W0703
+            except Exception as err:
+                with self._lock:
+                    self.errors = {None: err}
+            self._stopped.wait(max(self.interval - (time.time() - start), 0))
+
+
+# End of file: ./poller.py
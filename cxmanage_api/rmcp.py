@@ -0,0 +1,247 @@
+"""Calxeda: rmcp.py"""
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import time
+import errno
+import select
+import socket
+import struct
+
+
+RMCP_PORT = 623
+
+# RMCP header: version 1.0, reserved, sequence 0xFF (no ack), class ASF
+RMCP_HEADER = struct.pack("!BBBB", 0x06, 0x00, 0xFF, 0x06)
+ASF_IANA = 0x000011BE
+ASF_PRESENCE_PING = 0x80
+ASF_PRESENCE_PONG = 0x40
+
+
+def build_ping(tag=0):
+    """Build an ASF presence ping packet.
+
+    >>> from cxmanage_api.rmcp import build_ping
+    >>> build_ping(tag=7).encode("hex")
+    '0600ff06000011be80070000'
+
+    :param tag: Message tag, echoed back in the pong.
+    :type tag: integer
+
+    :returns: The raw packet.
+    :rtype: string
+
+    """
+    return RMCP_HEADER + struct.pack("!IBBBB", ASF_IANA, ASF_PRESENCE_PING,
+                                     tag & 0xFF, 0x00, 0x00)
+
+
+def build_pong(tag=0):
+    """Build an ASF presence pong packet, as an ECME would send it.
+
+    :param tag: Message tag from the ping.
+    :type tag: integer
+
+    :returns: The raw packet.
+    :rtype: string
+
+    """
+    # Data: IANA, OEM, supported entities (IPMI), interactions, reserved
+    data = struct.pack("!IIBB6x", ASF_IANA, 0, 0x81, 0x00)
+    return RMCP_HEADER + struct.pack("!IBBBB", ASF_IANA, ASF_PRESENCE_PONG,
+                                     tag & 0xFF, 0x00, len(data)) + data
+
+
+def parse_message(data):
+    """Parse an RMCP/ASF packet.
+
+    :param data: The raw packet.
+    :type data: string
+
+    :returns: (message type, tag), or None if this isn't an ASF message.
+    :rtype: tuple
+
+    """
+    if len(data) < 12 or data[:4] != RMCP_HEADER:
+        return None
+    iana, message_type, tag = struct.unpack("!IBB", data[4:10])
+    if iana != ASF_IANA:
+        return None
+    return (message_type, tag)
+
+
+class RmcpPinger(object):
+    """Checks which ECMEs are alive, using ASF presence pings over UDP.
+
+    Pings to every host go out from a single socket, and pongs are collected
+    as they arrive, so hundreds of ECMEs can be checked in well under a
+    second. Hosts that don't answer are pinged again up to 'retries' times.
+
+    >>> from cxmanage_api.rmcp import RmcpPinger
+    >>> pinger = RmcpPinger(timeout=0.5)
+    >>> pinger.sweep(['10.20.1.9', '10.20.1.10'])
+    {'10.20.1.9': 0.0012, '10.20.1.10': None}
+
+    :param port: UDP port to ping.
+    :type port: integer
+    :param timeout: Seconds to wait for pongs after each round of pings.
+    :type timeout: float
+    :param retries: Extra rounds of pings for hosts that didn't answer.
+    :type retries: integer
+    :param window: Max number of pings in flight at once.
+    :type window: integer
+
+    """
+
+    def __init__(self, port=RMCP_PORT, timeout=0.5, retries=1, window=512):
+        """Default constructor for the RmcpPinger class."""
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.window = window
+
+    def sweep(self, hosts):
+        """Ping hosts and report which ones answered.
+
+        :param hosts: IP addresses to ping.
+        :type hosts: iterable
+
+        :returns: Map of IP address to round trip time in seconds, or None if
+                  the host never answered.
+        :rtype: dictionary
+
+        """
+        results = {}
+        batch = []
+        for host in hosts:
+            batch.append(host)
+            if len(batch) >= self.window:
+                results.update(self._sweep_batch(batch))
+                batch = []
+        if batch:
+            results.update(self._sweep_batch(batch))
+        return results
+
+    def iter_alive(self, hosts):
+        """Ping hosts lazily, a window at a time, yielding the live ones.
+
+        :param hosts: IP addresses to ping. May be a generator.
+        :type hosts: iterable
+
+        :returns: Generator of (IP address, round trip time) tuples.
+        :rtype: generator
+
+        """
+        batch = []
+        for host in hosts:
+            batch.append(host)
+            if len(batch) >= self.window:
+                for result in self._alive(self._sweep_batch(batch)):
+                    yield result
+                batch = []
+        if batch:
+            for result in self._alive(self._sweep_batch(batch)):
+                yield result
+
+    @staticmethod
+    def _alive(results):
+        """Get (host, latency) for hosts that answered, in sorted order."""
+        return sorted((host, latency) for host, latency in results.iteritems()
+                      if latency is not None)
+
+    def _sweep_batch(self, hosts):
+        """Ping one window's worth of hosts."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(0)
+        try:
+            results = dict((host, None) for host in hosts)
+            addresses = {}
+            for host in hosts:
+                try:
+                    address = socket.gethostbyname(host)
+                    addresses.setdefault(address, []).append(host)
+                except socket.error:
+                    pass
+
+            for attempt in xrange(self.retries + 1):
+                pending = [address for address, names in addresses.iteritems()
+                           if results[names[0]] is None]
+                if not pending:
+                    break
+
+                sent = {}
+                for address in pending:
+                    try:
+                        sock.sendto(build_ping(attempt), (address, self.port))
+                        sent[address] = time.time()
+                    except socket.error:
+                        pass
+
+                self._collect(sock, sent, addresses, results)
+            return results
+        finally:
+            sock.close()
+
+    def _collect(self, sock, sent, addresses, results):
+        """Read pongs until everyone answered or we time out."""
+        deadline = time.time() + self.timeout
+        waiting = set(sent)
+        while waiting:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            readable = select.select([sock], [], [], remaining)[0]
+            if not readable:
+                break
+
+            while True:
+                try:
+                    data, (address, _) = sock.recvfrom(512)
+                except socket.error as err:
+                    if err.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                        break
+                    # e.g. ICMP port unreachable from an earlier ping
+                    continue
+
+                message = parse_message(data)
+                if (address in waiting and message and
+                        message[0] == ASF_PRESENCE_PONG):
+                    latency = time.time() - sent[address]
+                    for host in addresses[address]:
+                        results[host] = latency
+                    waiting.discard(address)
+
+
+DEFAULT_PINGER = RmcpPinger()
+
+
+# End of file: ./rmcp.py
@@ -0,0 +1,757 @@
+"""Calxeda: rmcpplus.py"""
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import os
+import hmac
+import time
+import random
+import socket
+import struct
+import hashlib
+import weakref
+import atexit
+from Queue import Queue, Empty
+from threading import Lock, Thread
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+from pyipmi import IpmiError
+from pyipmi.bmc import LanBMC, BMCGuid, BMCInfo
+from pyipmi.chassis import ChassisStatus
+
+from cxmanage_api.rmcp import RMCP_PORT
+
+
+# RMCP header: version 1.0, reserved, sequence 0xFF (no ack), class IPMI
+RMCP_IPMI_HEADER = struct.pack("!BBBB", 0x06, 0x00, 0xFF, 0x07)
+AUTH_TYPE_RMCPP = 0x06
+
+PAYLOAD_IPMI = 0x00
+PAYLOAD_OPEN_SESSION_REQUEST = 0x10
+PAYLOAD_OPEN_SESSION_RESPONSE = 0x11
+PAYLOAD_RAKP1 = 0x12
+PAYLOAD_RAKP2 = 0x13
+PAYLOAD_RAKP3 = 0x14
+PAYLOAD_RAKP4 = 0x15
+PAYLOAD_ENCRYPTED = 0x80
+PAYLOAD_AUTHENTICATED = 0x40
+
+# Cipher suite ID -> (authentication, integrity, confidentiality) algorithms
+# 1: RAKP-HMAC-SHA1, 1: HMAC-SHA1-96, 1: AES-CBC-128
+CIPHER_SUITES = {
+    1: (1, 0, 0),
+    2: (1, 1, 0),
+    3: (1, 1, 1)
+}
+
+# Administrator, looked up by name only
+ROLE_ADMINISTRATOR = 0x14
+
+NETFN_CHASSIS = 0x00
+NETFN_APP = 0x06
+
+BMC_ADDRESS = 0x20
+CONSOLE_ADDRESS = 0x81
+
+CHASSIS_CONTROL = {"off": 0, "on": 1, "cycle": 2, "reset": 3, "diag": 4,
+                   "soft": 5}
+POWER_POLICIES = ["always-off", "previous", "always-on"]
+
+
+def checksum(data):
+    """Two's complement checksum used by IPMI messages."""
+    return (-sum(bytearray(data))) & 0xFF
+
+
+def build_ipmi_message(netfn, cmd, sequence, data="", response=False):
+    """Build an IPMI LAN message.
+
+    :param netfn: Network function. For responses, the request's.
+    :type netfn: integer
+    :param cmd: Command number.
+    :type cmd: integer
+    :param sequence: Requester's sequence number (0-63).
+    :type sequence: integer
+    :param data: Request data, or completion code plus response data.
+    :type data: string
+    :param response: Build a response (BMC to console) instead.
+    :type response: boolean
+
+    :returns: The raw message.
+    :rtype: string
+
+    """
+    if response:
+        header = struct.pack("BB", CONSOLE_ADDRESS, (netfn | 1) << 2)
+        body = struct.pack("BBB", BMC_ADDRESS, sequence << 2, cmd) + data
+    else:
+        header = struct.pack("BB", BMC_ADDRESS, netfn << 2)
+        body = struct.pack("BBB", CONSOLE_ADDRESS, sequence << 2, cmd) + data
+    return header + chr(checksum(header)) + body + chr(checksum(body))
+
+
+def parse_ipmi_message(data):
+    """Parse an IPMI LAN message.
+
+    :returns: (netfn, cmd, sequence, data), or None if it's malformed.
+    :rtype: tuple
+
+    """
+    if (len(data) < 7 or checksum(data[:3]) != 0 or
+            checksum(data[3:]) != 0):
+        return None
+    return (ord(data[1]) >> 2, ord(data[5]), ord(data[4]) >> 2, data[6:-1])
+
+
+def build_session_packet(payload_type, session_id, sequence, payload,
+                         integrity_key=None):
+    """Build an IPMI v2.0 (RMCP+) packet.
+
+    If an integrity key is given, the packet is signed with HMAC-SHA1-96.
+
+    :returns: The raw packet, RMCP header included.
+    :rtype: string
+
+    """
+    if integrity_key:
+        payload_type |= PAYLOAD_AUTHENTICATED
+    packet = struct.pack("<BBIIH", AUTH_TYPE_RMCPP, payload_type, session_id,
+                         sequence, len(payload)) + payload
+    if integrity_key:
+        pad = (4 - (len(packet) + 2) % 4) % 4
+        packet += "\xff" * pad + struct.pack("BB", pad, 0x07)
+        packet += hmac.new(integrity_key, packet, hashlib.sha1).digest()[:12]
+    return RMCP_IPMI_HEADER + packet
+
+
+def parse_session_packet(data, integrity_key=None):
+    """Parse an IPMI v2.0 (RMCP+) packet.
+
+    :returns: (payload type, session ID, sequence, payload), or None if the
+              packet is malformed or fails its integrity check.
+    :rtype: tuple
+
+    """
+    if len(data) < 16 or data[:4] != RMCP_IPMI_HEADER:
+        return None
+    auth_type, payload_type, session_id, sequence, length = struct.unpack(
+        "<BBIIH", data[4:16]
+    )
+    if auth_type != AUTH_TYPE_RMCPP or len(data) < 16 + length:
+        return None
+
+    if payload_type & PAYLOAD_AUTHENTICATED:
+        if not integrity_key or len(data) < 16 + length + 14:
+            return None
+        expected = hmac.new(integrity_key, data[4:-12], hashlib.sha1)
+        if expected.digest()[:12] != data[-12:]:
+            return None
+    elif integrity_key:
+        return None
+
+    return payload_type, session_id, sequence, data[16:16 + length]
+
+
+def encrypt_payload(key, data):
+    """Encrypt a payload with AES-CBC-128.
+
+    :raises IpmiError: If no AES implementation (pycrypto) is installed.
+
+    """
+    if AES is None:
+        raise IpmiError("AES-CBC-128 needs pycrypto")
+    pad = (16 - (len(data) + 1) % 16) % 16
+    data += "".join(chr(x) for x in range(1, pad + 1)) + chr(pad)
+    iv = os.urandom(16)
+    return iv + AES.new(key, AES.MODE_CBC, iv).encrypt(data)
+
+
+def decrypt_payload(key, payload):
+    """Decrypt an AES-CBC-128 payload.
+
+    :returns: The payload, or None if it's malformed.
+    :rtype: string
+
+    """
+    if AES is None or len(payload) < 32 or len(payload) % 16:
+        return None
+    data = AES.new(key, AES.MODE_CBC, payload[:16]).decrypt(payload[16:])
+    pad = ord(data[-1])
+    if pad >= 16:
+        return None
+    return data[:-pad - 1]
+
+
+def console_session_id(data):
+    """Get the console's session ID for a packet sent to the console.
+
+    Session setup responses carry it in the payload, everything after that
+    in the session header. Integrity isn't checked here; that's up to the
+    session the packet is routed to.
+
+    """
+    if len(data) < 16 or data[:4] != RMCP_IPMI_HEADER:
+        return None
+    payload_type, session_id = struct.unpack("<BI", data[5:10])
+    if (payload_type & 0x3F) in [PAYLOAD_OPEN_SESSION_RESPONSE,
+                                 PAYLOAD_RAKP2, PAYLOAD_RAKP4]:
+        if len(data) < 24:
+            return None
+        return struct.unpack("<I", data[20:24])[0]
+    return session_id
+
+
+class SessionKeys(object):
+    """The keys derived from a RAKP-HMAC-SHA1 exchange.
+
+    :param password: User's password.
+    :type password: string
+    :param username: User's name.
+    :type username: string
+    :param console_random: Remote console random number (Rm).
+    :type console_random: string
+    :param bmc_random: Managed system random number (Rc).
+    :type bmc_random: string
+    :param role: Requested role.
+    :type role: integer
+
+    """
+
+    def __init__(self, password, username, console_random, bmc_random,
+                 role=ROLE_ADMINISTRATOR):
+        """Default constructor for the SessionKeys class."""
+        self.kuid = password[:20].ljust(20, "\0")
+        self.username = username
+        self.console_random = console_random
+        self.bmc_random = bmc_random
+        self.role = role
+        self.name = struct.pack("BB", role, len(username)) + username
+
+        self.sik = self._hmac(self.kuid, console_random + bmc_random +
+                              self.name)
+        self.k1 = self._hmac(self.sik, "\x01" * 20)
+        self.k2 = self._hmac(self.sik, "\x02" * 20)
+
+    def rakp2(self, console_id, bmc_id, bmc_guid):
+        """Key exchange auth code the BMC sends in RAKP message 2."""
+        return self._hmac(self.kuid, struct.pack("<II", console_id, bmc_id) +
+                          self.console_random + self.bmc_random + bmc_guid +
+                          self.name)
+
+    def rakp3(self, console_id):
+        """Key exchange auth code the console sends in RAKP message 3."""
+        return self._hmac(self.kuid, self.bmc_random +
+                          struct.pack("<I", console_id) + self.name)
+
+    def rakp4(self, bmc_id, bmc_guid):
+        """Integrity check value the BMC sends in RAKP message 4."""
+        return self._hmac(self.sik, self.console_random +
+                          struct.pack("<I", bmc_id) + bmc_guid)[:12]
+
+    @staticmethod
+    def _hmac(key, data):
+        """HMAC-SHA1"""
+        return hmac.new(key, data, hashlib.sha1).digest()
+
+
+class RmcpPlusTransport(object):
+    """One UDP socket shared by many RMCP+ sessions.
+
+    Incoming packets are routed to sessions by the console's session ID, so
+    a single socket (and a single receiver thread) serves every ECME we talk
+    to, instead of one ipmitool process each.
+
+    """
+
+    def __init__(self):
+        """Default constructor for the RmcpPlusTransport class."""
+        self._lock = Lock()
+        self._queues = {}
+        self._sock = None
+
+    def register(self):
+        """Allocate a console session ID, and a queue for its packets.
+
+        :returns: (session ID, queue)
+        :rtype: tuple
+
+        """
+        with self._lock:
+            if self._sock is None:
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._sock.bind(("", 0))
+                thread = Thread(target=self._run, args=(self._sock,))
+                thread.daemon = True
+                thread.start()
+
+            while True:
+                session_id = random.randint(1, 0xFFFFFFFF)
+                if session_id not in self._queues:
+                    break
+            queue = Queue()
+            self._queues[session_id] = queue
+            return session_id, queue
+
+    def unregister(self, session_id):
+        """Stop routing packets for this console session ID."""
+        with self._lock:
+            self._queues.pop(session_id, None)
+
+    def send(self, address, packet):
+        """Send a packet to (host, port)."""
+        try:
+            self._sock.sendto(packet, address)
+        except socket.error as err:
+            raise IpmiError("Failed to send to %s: %s" % (address[0], err))
+
+    def _run(self, sock):
+        """Route incoming packets to their sessions."""
+        while True:
+            try:
+                data, _ = sock.recvfrom(65536)
+            except socket.error:
+                continue
+            session_id = console_session_id(data)
+            with self._lock:
+                queue = self._queues.get(session_id)
+            if queue is not None:
+                queue.put(data)
+
+
+class RmcpPlusSession(object):
+    """An IPMI v2.0 (RMCP+, "lanplus") session with one BMC.
+
+    The session is opened on the first request, and again after any
+    request times out.
+
+    >>> from cxmanage_api.rmcpplus import RmcpPlusSession
+    >>> session = RmcpPlusSession('10.20.1.9', 'admin', 'admin')
+    >>> session.request(0x06, 0x37).encode('hex')
+    '80a9cf997620e311d5c776db821cea20'
+
+    :param hostname: BMC address.
+    :type hostname: string
+    :param username: User name.
+    :type username: string
+    :param password: Password.
+    :type password: string
+    :param port: BMC UDP port.
+    :type port: integer
+    :param cipher_suite: 1, 2 or 3. Default: 3 if pycrypto is installed,
+                         otherwise 2 (no confidentiality).
+    :type cipher_suite: integer
+    :param timeout: Seconds to wait for each response.
+    :type timeout: float
+    :param retries: Times to resend a request that got no response.
+    :type retries: integer
+    :param transport: Socket to share with other sessions.
+    :type transport: RmcpPlusTransport
+
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, hostname, username, password, port=RMCP_PORT,
+                 cipher_suite=None, timeout=1.0, retries=3, transport=None):
+        """Default constructor for the RmcpPlusSession class."""
+        if cipher_suite is None:
+            cipher_suite = 3 if AES else 2
+        if cipher_suite not in CIPHER_SUITES:
+            raise IpmiError("Unsupported cipher suite %s" % cipher_suite)
+        if not transport:
+            transport = DEFAULT_TRANSPORT
+
+        self.hostname = hostname
+        self.username = username or ""
+        self.password = password or ""
+        self.port = port
+        self.cipher_suite = cipher_suite
+        self.timeout = timeout
+        self.retries = retries
+        self.transport = transport
+
+        self._lock = Lock()
+        self._address = None
+        self._console_id = None
+        self._queue = None
+        self._bmc_id = None
+        self._keys = None
+        self._sequence = 0
+        self._rq_sequence = 0
+        _SESSIONS.add(self)
+
+    @property
+    def is_open(self):
+        """True if the session is established."""
+        return self._keys is not None
+
+    def request(self, netfn, cmd, data=""):
+        """Send an IPMI request and wait for the response.
+
+        :param netfn: Network function.
+        :type netfn: integer
+        :param cmd: Command number.
+        :type cmd: integer
+        :param data: Request data.
+        :type data: string
+
+        :returns: Response data, completion code stripped.
+        :rtype: string
+
+        :raises IpmiError: If the BMC doesn't answer, or answers with an
+                           error completion code.
+
+        """
+        with self._lock:
+            if not self.is_open:
+                self._open()
+            return self._request(netfn, cmd, data)
+
+    def close(self):
+        """Close the session, if it's open."""
+        with self._lock:
+            if self.is_open:
+                retries, self.retries = self.retries, 0
+                try:
+                    self._request(NETFN_APP, 0x3C,
+                                  struct.pack("<I", self._bmc_id))
+                except IpmiError:
+                    pass
+                finally:
+                    self.retries = retries
+            self._reset()
+
+    def abandon(self):
+        """Forget the session without closing it, e.g. after a BMC reset."""
+        with self._lock:
+            self._reset()
+
+    def _request(self, netfn, cmd, data):
+        """Send a request within the open session."""
+        self._rq_sequence = (self._rq_sequence + 1) & 0x3F
+        message = build_ipmi_message(netfn, cmd, self._rq_sequence, data)
+        rq_sequence = self._rq_sequence
+
+        def match(packet):
+            """Is this the response to our request?"""
+            parsed = parse_session_packet(packet, self._integrity_key)
+            if not parsed or parsed[0] & 0x3F != PAYLOAD_IPMI:
+                return None
+            payload = parsed[3]
+            if parsed[0] & PAYLOAD_ENCRYPTED:
+                payload = decrypt_payload(self._keys.k2[:16], payload)
+            response = payload and parse_ipmi_message(payload)
+            if (response and response[0] == netfn | 1 and
+                    response[1] == cmd and response[2] == rq_sequence):
+                return response[3]
+
+        try:
+            response = self._exchange(self._session_packet, message,
+                                      match)
+        except IpmiError:
+            self._reset()
+            raise
+
+        if not response:
+            raise IpmiError("Empty response from %s" % self.hostname)
+        completion_code = ord(response[0])
+        if completion_code != 0:
+            raise IpmiError(
+                "Command 0x%02x:0x%02x failed on %s: completion code "
+                "0x%02x" % (netfn, cmd, self.hostname, completion_code)
+            )
+        return response[1:]
+
+    @property
+    def _integrity_key(self):
+        """Key for HMAC-SHA1-96 integrity, if this suite uses it."""
+        if self._keys and CIPHER_SUITES[self.cipher_suite][1]:
+            return self._keys.k1
+        return None
+
+    def _session_packet(self, message):
+        """Wrap an IPMI message in a session packet."""
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF or 1
+        payload_type = PAYLOAD_IPMI
+        if CIPHER_SUITES[self.cipher_suite][2]:
+            payload_type |= PAYLOAD_ENCRYPTED
+            message = encrypt_payload(self._keys.k2[:16], message)
+        return build_session_packet(payload_type, self._bmc_id,
+                                    self._sequence, message,
+                                    self._integrity_key)
+
+    def _open(self):
+        """Open a session: open session request, then RAKP 1-4."""
+        self._reset()
+        try:
+            self._address = (socket.gethostbyname(self.hostname), self.port)
+        except socket.error as err:
+            raise IpmiError("Failed to resolve %s: %s" % (self.hostname, err))
+        self._console_id, self._queue = self.transport.register()
+        try:
+            self._handshake()
+        except IpmiError:
+            self._reset()
+            raise
+
+    def _handshake(self):
+        """Run the RMCP+ session setup handshake."""
+        tag = random.randint(0, 0xFF)
+        auth, integrity, confidentiality = CIPHER_SUITES[self.cipher_suite]
+
+        # Open session request/response
+        payload = struct.pack("<BBHI", tag, 0, 0, self._console_id)
+        for algorithm_type, algorithm in enumerate(
+                [auth, integrity, confidentiality]):
+            payload += struct.pack("<BHBB3x", algorithm_type, 0, 8, algorithm)
+        response = self._setup_exchange(
+            PAYLOAD_OPEN_SESSION_REQUEST, payload,
+            PAYLOAD_OPEN_SESSION_RESPONSE, tag, 12
+        )
+        self._bmc_id = struct.unpack("<I", response[8:12])[0]
+
+        # RAKP messages 1 and 2
+        console_random = os.urandom(16)
+        payload = (struct.pack("<B3xI", tag, self._bmc_id) + console_random +
+                   struct.pack("<BxxB", ROLE_ADMINISTRATOR,
+                               len(self.username)) + self.username)
+        response = self._setup_exchange(PAYLOAD_RAKP1, payload,
+                                        PAYLOAD_RAKP2, tag, 60)
+        bmc_random, bmc_guid = response[8:24], response[24:40]
+        keys = SessionKeys(self.password, self.username, console_random,
+                           bmc_random)
+        if response[40:60] != keys.rakp2(self._console_id, self._bmc_id,
+                                         bmc_guid):
+            raise IpmiError("Authentication failed on %s" % self.hostname)
+
+        # RAKP messages 3 and 4
+        payload = (struct.pack("<BBxxI", tag, 0, self._bmc_id) +
+                   keys.rakp3(self._console_id))
+        response = self._setup_exchange(PAYLOAD_RAKP3, payload,
+                                        PAYLOAD_RAKP4, tag, 20)
+        if response[8:20] != keys.rakp4(self._bmc_id, bmc_guid):
+            raise IpmiError("Session integrity check failed on %s"
+                            % self.hostname)
+
+        self._keys = keys
+        self._sequence = 0
+
+    def _setup_exchange(self, payload_type, payload, response_type, tag,
+                        length):
+        """Send a session setup message and check the response status."""
+        def match(packet):
+            """Is this the response we're waiting for?"""
+            parsed = parse_session_packet(packet)
+            if (parsed and parsed[0] == response_type and
+                    len(parsed[3]) >= 2 and ord(parsed[3][0]) == tag):
+                return parsed[3]
+
+        def build(payload):
+            """Setup messages go outside of any session."""
+            return build_session_packet(payload_type, 0, 0, payload)
+
+        response = self._exchange(build, payload, match)
+        status = ord(response[1])
+        if status != 0:
+            raise IpmiError("Session setup failed on %s: status 0x%02x"
+                            % (self.hostname, status))
+        if len(response) < length:
+            raise IpmiError("Short session setup response from %s"
+                            % self.hostname)
+        return response
+
+    def _exchange(self, build, payload, match):
+        """Send a packet until we get a matching response, or run out of
+        retries. Each attempt is built fresh, so it gets a new sequence.
+        """
+        for _ in range(self.retries + 1):
+            self.transport.send(self._address, build(payload))
+            deadline = time.time() + self.timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    packet = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+                result = match(packet)
+                if result is not None:
+                    return result
+        raise IpmiError("Timed out waiting for %s" % self.hostname)
+
+    def _reset(self):
+        """Forget the session."""
+        if self._console_id is not None:
+            self.transport.unregister(self._console_id)
+        self._console_id = None
+        self._queue = None
+        self._bmc_id = None
+        self._keys = None
+
+
+class NativeBMC(LanBMC):
+    """A LanBMC that speaks RMCP+ itself for the most common commands.
+
+    GUID, device ID, chassis status/power/policy and MC reset go over a
+    native RMCP+ session. Everything else still goes through ipmitool,
+    like LanBMC. That includes the Calxeda OEM commands behind
+    get_versions() (get_info_basic, get_firmware_info): their request and
+    response layouts are only defined by ipmitool's cxoem plugin, so this
+    is a first step rather than a full replacement. Plug it into a node
+    with Node(..., bmc=NativeBMC).
+
+    >>> from cxmanage_api.node import Node
+    >>> from cxmanage_api.rmcpplus import NativeBMC
+    >>> node = Node('10.20.1.9', bmc=NativeBMC)
+    >>> node.get_power()
+    False
+
+    :param hostname: BMC address.
+    :type hostname: string
+    :param username: User name.
+    :type username: string
+    :param password: Password.
+    :type password: string
+    :param port: BMC UDP port.
+    :type port: integer
+    :param cipher_suite: RMCP+ cipher suite. See RmcpPlusSession.
+    :type cipher_suite: integer
+    :param transport: Socket to share with other sessions.
+    :type transport: RmcpPlusTransport
+
+    """
+
+    # pylint: disable=R0913
+    def __init__(self, hostname, username=None, password=None,
+                 port=RMCP_PORT, cipher_suite=None, transport=None,
+                 **kwargs):
+        """Default constructor for the NativeBMC class."""
+        super(NativeBMC, self).__init__(hostname, username=username,
+                                        password=password, port=port,
+                                        **kwargs)
+        self.session = RmcpPlusSession(
+            hostname, username, password, port=port,
+            cipher_suite=cipher_suite, transport=transport
+        )
+
+    def info(self):
+        """Get the BMC's device ID."""
+        data = self.session.request(NETFN_APP, 0x01)
+        if len(data) < 11:
+            raise IpmiError("Short Get Device ID response")
+        data = bytearray(data)
+        result = BMCInfo()
+        result.device_id = str(data[0])
+        result.device_revision = str(data[1] & 0x0F)
+        result.firmware_revision = "%i.%02x" % (data[2] & 0x7F, data[3])
+        result.ipmi_version = "%i.%i" % (data[4] & 0x0F, data[4] >> 4)
+        result.manufacturer_id = str(data[6] | data[7] << 8 |
+                                     (data[8] & 0x0F) << 16)
+        result.product_id = str(data[9] | data[10] << 8)
+        result.device_available = not data[2] & 0x80
+        return result
+
+    def guid(self):
+        """Get the BMC's GUID, formatted the way ipmitool does it."""
+        data = self.session.request(NETFN_APP, 0x37)
+        if len(data) < 16:
+            raise IpmiError("Short Get System GUID response")
+        fields = struct.unpack("<IHHBB6B", data[:16])
+        result = BMCGuid()
+        result.system_guid = "%08x-%04x-%04x-%02x%02x-%s" % (
+            fields[:5] + ("".join("%02x" % x for x in fields[5:]),)
+        )
+        return result
+
+    def get_chassis_status(self):
+        """Get the chassis power state and policy."""
+        data = bytearray(self.session.request(NETFN_CHASSIS, 0x01))
+        if len(data) < 3:
+            raise IpmiError("Short Chassis Status response")
+        result = ChassisStatus()
+        result.power_on = bool(data[0] & 0x01)
+        result.power_overload = bool(data[0] & 0x02)
+        result.power_interlock = bool(data[0] & 0x04)
+        result.power_fault = bool(data[0] & 0x08)
+        result.power_control_fault = bool(data[0] & 0x10)
+        policy = (data[0] >> 5) & 0x03
+        if policy < len(POWER_POLICIES):
+            result.power_restore_policy = POWER_POLICIES[policy]
+        else:
+            result.power_restore_policy = "unknown"
+        return result
+
+    def set_chassis_power(self, mode):
+        """Power the chassis on/off/cycle/reset/soft."""
+        if mode not in CHASSIS_CONTROL:
+            raise IpmiError("Invalid power mode: %s" % mode)
+        self.session.request(NETFN_CHASSIS, 0x02, chr(CHASSIS_CONTROL[mode]))
+
+    def set_chassis_policy(self, state):
+        """Set the power restore policy."""
+        if state not in POWER_POLICIES:
+            raise IpmiError("Invalid power policy: %s" % state)
+        self.session.request(NETFN_CHASSIS, 0x06,
+                             chr(POWER_POLICIES.index(state)))
+
+    def mc_reset(self, mode):
+        """Reset the BMC. The session doesn't survive, so it's dropped."""
+        if mode not in ["cold", "warm"]:
+            raise IpmiError("Invalid reset mode: %s" % mode)
+        try:
+            self.session.request(NETFN_APP, 0x02 if mode == "cold" else 0x03)
+        finally:
+            self.session.abandon()
+
+    def close(self):
+        """Close the RMCP+ session."""
+        self.session.close()
+
+
+DEFAULT_TRANSPORT = RmcpPlusTransport()
+
+_SESSIONS = weakref.WeakSet()
+
+
+def _close_sessions():
+    """Close every open session at exit, so BMCs don't wait them out."""
+    for session in list(_SESSIONS):
+        session.close()
+
+atexit.register(_close_sessions)
+
+
+# End of file: ./rmcpplus.py
@@ -0,0 +1,206 @@
+"""Calxeda: sdrcache.py"""
+
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import os
+import re
+import json
+import uuid
+import atexit
+import shutil
+import tempfile
+from threading import Lock
+
+from pyipmi.sdr import AnalogSdr
+
+from cxmanage_api import atomic_write
+
+
+class SdrCache(object):
+    """Keeps the static part of nodes' sensor data records (SDRs).
+
+    Names, thresholds, hysteresis and units don't change unless the board or
+    its firmware does, so records are keyed by hardware and firmware version.
+    Each entry holds the parsed records, plus a raw "ipmitool sdr dump" of
+    the SDR repository: with that, ipmitool can read chosen sensors
+    ("ipmitool -S <dump> sensor reading ...") with one Get Sensor Reading
+    each, instead of pulling the whole repository again.
+
+    >>> from cxmanage_api.sdrcache import SdrCache
+    >>> cache = SdrCache(directory='sdr_cache')
+    >>> cache.get('EnergyCard X04 ECX-1000-v2.1.5')
+    [<pyipmi.sdr.AnalogSdr object at 0x1e63890>, ...]
+
+    :param directory: Directory to persist entries to. Default: keep the
+                      records in memory, and the dumps in a temporary
+                      directory that's removed at exit.
+    :type directory: string
+
+    """
+
+    def __init__(self, directory=None):
+        """Default constructor for the SdrCache class."""
+        self.directory = directory
+
+        self._lock = Lock()
+        self._entries = {}
+        self._temp_dir = None
+
+    def get(self, key):
+        """Get the cached records for a hardware and firmware version.
+
+        Only entries that have a dump are returned.
+
+        :param key: Hardware and firmware version.
+        :type key: string
+
+        :returns: The records (without current readings), or None.
+        :rtype: list
+
+        """
+        with self._lock:
+            records = self._entries.get(key)
+        if records is None and self.directory:
+            records = self._load(key)
+        if records is None or not os.path.exists(self.dump_path(key)):
+            return None
+        return [_make_sdr(x) for x in records]
+
+    def record(self, key, sensors):
+        """Record the SDRs for a hardware and firmware version.
+
+        Call this once the dump is in place at dump_path(key).
+
+        :param key: Hardware and firmware version.
+        :type key: string
+        :param sensors: SDRs, as returned by pyipmi's sdr_list.
+        :type sensors: list
+
+        """
+        records = [dict((k, v) for k, v in vars(x).iteritems()
+                        if isinstance(v, basestring)) for x in sensors]
+        with self._lock:
+            self._entries[key] = records
+        if self.directory:
+            atomic_write(self._path(key, ".json"), json.dumps(records))
+
+    def dump_path(self, key):
+        """Get the path of the SDR dump for a hardware and firmware version.
+
+        :param key: Hardware and firmware version.
+        :type key: string
+
+        :returns: Path to the dump. It may not exist yet.
+        :rtype: string
+
+        """
+        return self._path(key, ".sdr")
+
+    def temp_dump_path(self, key):
+        """Get a unique path to dump to, before moving it into place."""
+        return "%s.%s.tmp" % (self.dump_path(key), uuid.uuid4().hex)
+
+    def commit_dump(self, key, filename):
+        """Move a finished dump into place. The move is atomic."""
+        os.rename(filename, self.dump_path(key))
+
+    def invalidate(self, key):
+        """Forget the entry for a hardware and firmware version.
+
+        :param key: Hardware and firmware version.
+        :type key: string
+
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+        for suffix in [".json", ".sdr"]:
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Forget all entries kept in memory."""
+        with self._lock:
+            self._entries = {}
+
+    def _path(self, key, suffix):
+        """Get the file for a key."""
+        with self._lock:
+            directory = self.directory
+            if not directory:
+                if not self._temp_dir:
+                    self._temp_dir = tempfile.mkdtemp(prefix="cxmanage_sdr-")
+                    atexit.register(shutil.rmtree, self._temp_dir, True)
+                directory = self._temp_dir
+            elif not os.path.exists(directory):
+                os.makedirs(directory)
+        return os.path.join(directory, re.sub(r"[^\w.-]", "_", key) + suffix)
+
+    def _load(self, key):
+        """Load an entry from our directory, if it's there and sane."""
+        try:
+            records = json.load(open(self._path(key, ".json")))
+            records = [dict((str(k), str(v)) for k, v in x.iteritems())
+                       for x in records]
+        except (IOError, ValueError, AttributeError):
+            return None
+        with self._lock:
+            self._entries[key] = records
+        return records
+
+
+def _make_sdr(record):
+    """Build an SDR object from a cached record."""
+    sdr = AnalogSdr()
+    for name, value in record.iteritems():
+        setattr(sdr, name, value)
+    return sdr
+
+
+def parse_sensor_readings(output):
+    """Parse the output of "ipmitool sensor reading".
+
+    :returns: Map of sensor name to reading (None if there is none).
+    :rtype: dictionary
+
+    """
+    readings = {}
+    for line in output.splitlines():
+        name, delim, value = line.partition("|")
+        if delim:
+            readings[name.strip()] = value.strip() or None
+    return readings
+
+
+# End of file: ./sdrcache.py
@@ -33,8 +33,9 @@
 
 
 from collections import deque
-from threading import Thread, Lock, Event
-from time import sleep
+from contextlib import contextmanager
+from threading import Thread, Lock, Event, BoundedSemaphore, local
+from time import sleep, time
 
 
 class Task(object):
@@ -57,9 +58,18 @@ class Task(object):
         self._kwargs = kwargs
         self._finished = Event()
 
-    def join(self):
-        """Wait for this task to finish."""
-        self._finished.wait()
+    def join(self, timeout=None):
+        """Wait for this task to finish.
+
+        :param timeout: Seconds to wait. Default: wait forever.
+        :type timeout: float
+
+        :returns: Whether or not the task has finished.
+        :rtype: boolean
+
+        """
+        self._finished.wait(timeout)
+        return self._finished.is_set()
 
     def is_alive(self):
         """Return true if this task hasn't been finished.
@@ -84,6 +94,29 @@ class Task(object):
         self._finished.set()
 
 
+def failed_task(error):
+    """Get a finished task that failed with the given error, e.g. for work
+    that was never started.
+
+    >>> task = failed_task(TimeoutError('Node 2 did not answer'))
+    >>> task.status
+    'Failed'
+
+    :param error: The error to report.
+    :type error: Exception
+
+    :returns: The failed task.
+    :rtype: Task
+
+    """
+    task = Task(None)
+    task.error = error
+    task.status = "Failed"
+    # pylint: disable=W0212
+    task._finished.set()
+    return task
+
+
 class TaskQueue(object):
     """A task queue, consisting of a queue and a number of workers.
 
@@ -178,6 +211,206 @@ class TaskWorker(Thread):
             # pylint: disable=W0212
             self._task_queue._remove_worker()
 
+
+class HedgePolicy(object):
+    """Hedges slow calls by issuing a duplicate and taking the first answer.
+
+    The policy keeps a window of recent latencies per method, since a fast
+    query and a slow one don't share a useful percentile. Once a method has
+    enough samples, any call to it that runs longer than the given
+    percentile gets a second, identical call started alongside it. Only use
+    this for idempotent reads.
+
+    >>> from cxmanage_api.tasks import HedgePolicy
+    >>> policy = HedgePolicy(percentile=95)
+    >>> policy.call(node.get_power)
+    False
+
+    :param percentile: Latency percentile after which to hedge.
+    :type percentile: float
+    :param min_samples: Samples needed before hedging starts.
+    :type min_samples: integer
+    :param window: Number of recent latencies to keep per method.
+    :type window: integer
+    :param min_delay: Never hedge sooner than this many seconds.
+    :type min_delay: float
+
+    """
+
+    def __init__(self, percentile=95, min_samples=20, window=256,
+                 min_delay=0.05):
+        """Default constructor for the HedgePolicy class."""
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self.hedges = 0
+
+        self._lock = Lock()
+        self._latencies = {}
+
+    def record(self, latency, key=None):
+        """Record the latency of a successful call.
+
+        :param latency: Call latency in seconds.
+        :type latency: float
+        :param key: Method name the latency belongs to.
+        :type key: string
+
+        """
+        with self._lock:
+            if key not in self._latencies:
+                self._latencies[key] = deque(maxlen=self.window)
+            self._latencies[key].append(latency)
+
+    def delay(self, key=None):
+        """Get how long to wait before hedging a call.
+
+        :param key: Method name.
+        :type key: string
+
+        :returns: Delay in seconds, or None if we don't have enough samples.
+        :rtype: float
+
+        """
+        with self._lock:
+            latencies = self._latencies.get(key, ())
+            if len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+
+        index = int(len(latencies) * self.percentile / 100.0)
+        return max(latencies[min(index, len(latencies) - 1)], self.min_delay)
+
+    def call(self, method, *args, **kwargs):
+        """Call a method, hedging it if it runs long. Latencies are kept
+        under the method's name.
+
+        :param method: Method to call.
+        :type method: function
+
+        :returns: The result of whichever call succeeded first.
+
+        :raises Exception: The first call's error, if every call fails.
+
+        """
+        return self.call_as(getattr(method, "__name__", None), method,
+                            *args, **kwargs)
+
+    def call_as(self, key, method, *args, **kwargs):
+        """Call a method, hedging it if it runs long, with its latencies
+        kept under the given key.
+
+        >>> policy.call_as('get_power', node.get_power)
+        False
+
+        :param key: Name to keep latencies under (e.g. the method name).
+        :type key: string
+        :param method: Method to call.
+        :type method: function
+
+        :returns: The result of whichever call succeeded first.
+
+        :raises Exception: The first call's error, if every call fails.
+
+        """
+        finished = Event()
+        tasks = []
+        starts = {}
+
+        def start():
+            """Start another copy of the call in its own thread."""
+            task = Task(method, *args, **kwargs)
+            starts[task] = time()
+            tasks.append(task)
+            thread = Thread(target=run, args=(task,))
+            thread.daemon = True
+            thread.start()
+
+        def run(task):
+            """Run a task and wake up the caller."""
+            # pylint: disable=W0212
+            task._run()
+            finished.set()
+
+        start()
+        delay = self.delay(key)
+        if delay is not None and not tasks[0].join(delay):
+            with self._lock:
+                self.hedges += 1
+            start()
+
+        while True:
+            finished.wait()
+            finished.clear()
+            done = [task for task in tasks if not task.is_alive()]
+            for task in done:
+                if task.status == "Completed":
+                    self.record(time() - starts[task], key)
+                    return task.result
+            if len(done) == len(tasks):
+                raise tasks[0].error
+
+
+class InflightLimiter(object):
+    """Caps the number of requests in flight to each ECME at once.
+
+    Slots are per key (an ECME's IP address). A thread that already holds a
+    slot for a key gets any nested slots for it for free, so composite
+    queries can't deadlock on their own sub-queries.
+
+    >>> from cxmanage_api.tasks import InflightLimiter
+    >>> limiter = InflightLimiter(limit=4)
+    >>> with limiter.slot('10.20.1.9'):
+    ...     node.get_power()
+    ...
+    False
+
+    :param limit: Max requests in flight per key.
+    :type limit: integer
+
+    """
+
+    def __init__(self, limit=4):
+        """Default constructor for the InflightLimiter class."""
+        self.limit = limit
+
+        self._lock = Lock()
+        self._semaphores = {}
+        self._held = local()
+
+    def holds(self, key):
+        """Returns True if the current thread holds a slot for this key."""
+        return key in getattr(self._held, "keys", set())
+
+    @contextmanager
+    def slot(self, key):
+        """Hold one of this key's slots, waiting for one if needed.
+
+        :param key: Usually the ECME's IP address.
+        :type key: string
+
+        """
+        if self.holds(key):
+            yield
+            return
+
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = BoundedSemaphore(self.limit)
+            semaphore = self._semaphores[key]
+
+        with semaphore:
+            if not hasattr(self._held, "keys"):
+                self._held.keys = set()
+            self._held.keys.add(key)
+            try:
+                yield
+            finally:
+                self._held.keys.discard(key)
+
+
 DEFAULT_TASK_QUEUE = TaskQueue()
+DEFAULT_INFLIGHT_LIMITER = InflightLimiter()
 
 # End of file: ./tasks.py
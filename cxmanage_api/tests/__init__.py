@@ -37,3 +37,5 @@ from cxmanage_api.tests.dummy_node import DummyNode, DummyFailNode
 from cxmanage_api.tests.dummy_image import DummyImage
 from cxmanage_api.tests.dummy_ubootenv import DummyUbootEnv
 from cxmanage_api.tests.dummy_ip_retriever import DummyIPRetriever
+from cxmanage_api.tests.dummy_rmcp import DummyRmcpResponder
+from cxmanage_api.tests.dummy_rmcpplus import DummyRmcpPlusBMC
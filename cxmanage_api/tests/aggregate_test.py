@@ -0,0 +1,166 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+
+"""Calxeda: aggregate_test.py"""
+
+import math
+import unittest
+
+from cxmanage_api.aggregate import SensorMatrix
+from cxmanage_api.tests import DummyNode, TestSensor
+
+
+def _results(readings):
+    """Build get_sensors() style results from {node: {name: reading}}."""
+    return dict(
+        (node, dict((name, TestSensor(name, reading))
+                    for name, reading in sensors.iteritems()))
+        for node, sensors in readings.iteritems()
+    )
+
+
+class SensorMatrixTest(unittest.TestCase):
+    """ Tests involving the sensor aggregation layer """
+
+    def setUp(self):
+        readings = dict(
+            (i, {"Node Power": "%i.000 (+/- 0) Watts" % (i + 1),
+                 "Board Temp": "%i degrees C" % (40 + i)})
+            for i in range(10)
+        )
+        readings[9]["Node Power"] = "100.000 (+/- 0) Watts"
+        readings[3]["Board Temp"] = "No Reading"
+        readings[4]["Board Temp"] = "50 degrees F"
+        del readings[5]["Board Temp"]
+        self.matrix = SensorMatrix(_results(readings))
+
+    def test_columns(self):
+        """ Test parsing readings into columns """
+        self.assertEqual(self.matrix.nodes, range(10))
+        self.assertEqual(sorted(self.matrix.sensors),
+                         ["Board Temp", "Node Power"])
+        self.assertEqual(self.matrix.units,
+                         {"Node Power": "Watts", "Board Temp": None})
+        self.assertEqual(list(self.matrix.columns["Node Power"]),
+                         [1, 2, 3, 4, 5, 6, 7, 8, 9, 100])
+        self.assertTrue(math.isnan(self.matrix.columns["Board Temp"][3]))
+        self.assertTrue(math.isnan(self.matrix.columns["Board Temp"][5]))
+
+        self.assertEqual(self.matrix.reading(0, "Board Temp"), 40.0)
+        self.assertEqual(self.matrix.reading(3, "Board Temp"), "No Reading")
+        self.assertEqual(self.matrix.reading(5, "Board Temp"), None)
+        readings = self.matrix.readings("Board Temp")
+        self.assertEqual(len(readings), 9)
+        self.assertIn((3, "No Reading", ""), readings)
+        self.assertIn((4, 50.0, "degrees F"), readings)
+
+        self.assertTrue(self.matrix.is_uniform("Node Power"))
+        self.assertFalse(self.matrix.is_uniform("Board Temp"))
+
+    def test_statistics(self):
+        """ Test summarizing a sensor """
+        stats = self.matrix.statistics("Node Power")
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 100]
+        mean = sum(values) / 10.0
+        stddev = math.sqrt(sum((x - mean) ** 2 for x in values) / 10.0)
+        self.assertEqual(stats["count"], 10)
+        self.assertEqual(stats["min"], 1.0)
+        self.assertEqual(stats["max"], 100.0)
+        self.assertAlmostEqual(stats["mean"], mean)
+        self.assertAlmostEqual(stats["stddev"], stddev)
+        self.assertEqual(stats["percentiles"], {50: 5.0, 90: 9.0, 99: 100.0})
+        self.assertEqual(stats["outliers"], [])
+
+        stats = self.matrix.statistics("Node Power", threshold=2.0)
+        self.assertEqual(stats["outliers"], [9])
+
+        stats = self.matrix.statistics("Node Power", nodes=[])
+        self.assertEqual(stats["count"], 0)
+        self.assertEqual(stats["mean"], None)
+
+    def test_example(self):
+        """ Test the example in SensorMatrix's docstring """
+        matrix = SensorMatrix(_results(dict(
+            (i, {"Node Power": "%s (+/- 0) Watts" % x})
+            for i, x in enumerate(["4.200", "4.600", "5.800", "9.800"])
+        )))
+        self.assertEqual(matrix.statistics("Node Power"), {
+            "count": 4, "min": 4.2, "max": 9.8, "mean": 6.1,
+            "stddev": 2.215851980616036,
+            "percentiles": {50: 4.6, 90: 9.8, 99: 9.8}, "outliers": []
+        })
+        self.assertEqual(matrix.rollup_by_slot("Node Power").items(),
+                [(0, matrix.statistics("Node Power"))])
+
+    def test_rollup(self):
+        """ Test summarizing a sensor per group of nodes """
+        rollup = self.matrix.rollup("Node Power", lambda node: node // 4)
+        self.assertEqual(rollup.keys(), [0, 1, 2])
+        self.assertEqual([x["count"] for x in rollup.values()], [4, 4, 2])
+        self.assertEqual([x["max"] for x in rollup.values()], [4, 8, 100])
+        self.assertEqual(rollup[1]["mean"], 6.5)
+        for group, nodes in [(0, [3, 0, 1, 2]), (2, [8, 9])]:
+            self.assertEqual(rollup[group],
+                    self.matrix.statistics("Node Power", nodes=nodes))
+        self.assertEqual(self.matrix.rollup_by_slot("Node Power"), rollup)
+
+        rollup = self.matrix.rollup("Node Power", lambda node: node // 5,
+                threshold=1.0)
+        self.assertEqual(rollup[1]["outliers"], [9])
+
+    def test_output(self):
+        """ Test JSON and CSV style output """
+        labels = dict((i, "node%i" % i) for i in range(10))
+        output = self.matrix.as_dict(labels)
+        self.assertEqual(output["Node Power"]["units"], "Watts")
+        self.assertEqual(output["Node Power"]["readings"]["node9"], 100.0)
+        self.assertEqual(output["Node Power"]["statistics"]["max"], 100.0)
+        self.assertEqual(output["Board Temp"]["readings"]["node3"],
+                         "No Reading")
+        self.assertEqual(output["Board Temp"]["statistics"], None)
+
+        rows = self.matrix.rows(labels)
+        self.assertEqual(len(rows), 19)
+        self.assertIn(("node9", "Node Power", 100.0, "Watts"), rows)
+        self.assertIn(("node3", "Board Temp", "No Reading", ""), rows)
+
+    def test_dummy_nodes(self):
+        """ Test aggregating readings from nodes """
+        nodes = [DummyNode(x) for x in DummyNode.ip_addresses]
+        results = dict((node, node.get_sensors()) for node in nodes)
+        matrix = SensorMatrix(results, nodes)
+        self.assertEqual(matrix.nodes, nodes)
+        for name in ["Node Power", "Board Temp"]:
+            stats = matrix.statistics(name)
+            self.assertEqual(stats["count"], len(nodes))
+            self.assertTrue(stats["min"] <= stats["mean"] <= stats["max"])
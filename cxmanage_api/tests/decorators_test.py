@@ -0,0 +1,135 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: decorators_test.py"""
+
+import time
+import unittest
+
+from cxmanage_api.decorators import retry, breaker, CircuitBreaker
+from cxmanage_api.cx_exceptions import CircuitOpenError
+
+
+class RetryTest(unittest.TestCase):
+    """ Tests for the retry decorator """
+
+    def test_retry(self):
+        """ Test that errors are retried, then raised """
+        calls = []
+
+        @retry(2, allowed_errors=ValueError)
+        def failing():
+            """ Always fail """
+            calls.append(time.time())
+            raise ValueError()
+
+        self.assertRaises(ValueError, failing)
+        self.assertEqual(len(calls), 3)
+
+    def test_backoff(self):
+        """ Test that retries back off """
+        calls = []
+
+        @retry(3, allowed_errors=ValueError, delay=0.05, backoff=2)
+        def failing():
+            """ Always fail """
+            calls.append(time.time())
+            raise ValueError()
+
+        self.assertRaises(ValueError, failing)
+        gaps = [b - a for a, b in zip(calls, calls[1:])]
+        self.assertEqual(len(gaps), 3)
+        for gap, expected in zip(gaps, [0.05, 0.1, 0.2]):
+            self.assertGreaterEqual(gap, expected)
+
+    def test_budget(self):
+        """ Test that retries stop when the budget runs out """
+        calls = []
+
+        @retry(10, allowed_errors=ValueError, delay=0.1, backoff=1,
+               budget=0.25)
+        def failing():
+            """ Always fail """
+            calls.append(time.time())
+            raise ValueError()
+
+        self.assertRaises(ValueError, failing)
+        self.assertLess(len(calls), 5)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """ Tests for the circuit breaker """
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=3, cooldown=0.2)
+        self.calls = 0
+
+    @breaker(ValueError)
+    def failing(self):
+        """ Always fail """
+        self.calls += 1
+        raise ValueError()
+
+    @breaker(ValueError)
+    def working(self):
+        """ Always succeed """
+        self.calls += 1
+        return self.calls
+
+    @breaker(ValueError)
+    def nested(self):
+        """ Call another guarded method """
+        return self.failing()
+
+    def test_open(self):
+        """ Test that the breaker opens and fails fast """
+        for _ in xrange(3):
+            self.assertRaises(ValueError, self.failing)
+        self.assertTrue(self.breaker.is_open)
+
+        self.assertRaises(CircuitOpenError, self.working)
+        self.assertEqual(self.calls, 3)
+
+    def test_half_open(self):
+        """ Test that a trial call after the cooldown closes the breaker """
+        for _ in xrange(3):
+            self.assertRaises(ValueError, self.failing)
+        time.sleep(0.25)
+
+        self.assertEqual(self.working(), 4)
+        self.assertFalse(self.breaker.is_open)
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_nested(self):
+        """ Test that nested guarded calls only count once """
+        self.assertRaises(ValueError, self.nested)
+        self.assertEqual(self.breaker.failures, 1)
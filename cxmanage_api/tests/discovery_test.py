@@ -0,0 +1,106 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: discovery_test.py"""
+
+import unittest
+
+from cxmanage_api.rmcp import RmcpPinger
+from cxmanage_api.discovery import Discovery, iter_cidr, iter_ip_range, \
+        iter_hosts
+from cxmanage_api.tests import DummyNode, DummyRmcpResponder
+
+
+class DiscoveryTest(unittest.TestCase):
+    """ Tests involving ECME discovery """
+
+    def setUp(self):
+        self.responders = [DummyRmcpResponder("127.0.0.1")]
+        port = self.responders[0].port
+        self.responders.append(DummyRmcpResponder("127.0.0.3", port))
+        self.pinger = RmcpPinger(port=port, timeout=0.2)
+
+    def tearDown(self):
+        for responder in self.responders:
+            responder.stop()
+
+    def test_iter_ip_range(self):
+        """ Test expanding IP ranges """
+        self.assertEqual(list(iter_ip_range("10.0.0.254", "10.0.1.1")),
+                ["10.0.0.254", "10.0.0.255", "10.0.1.0", "10.0.1.1"])
+        self.assertRaises(ValueError, iter_ip_range, "10.0.0.2", "10.0.0.1")
+        self.assertRaises(ValueError, iter_ip_range, "10.0.0.1", "foo")
+        self.assertRaises(ValueError, iter_ip_range, "192.168.1.1", "5")
+
+    def test_iter_cidr(self):
+        """ Test expanding CIDR blocks """
+        self.assertEqual(list(iter_cidr("10.0.0.5/30")),
+                ["10.0.0.5", "10.0.0.6"])
+        self.assertEqual(list(iter_cidr("10.0.0.5/32")), ["10.0.0.5"])
+        self.assertEqual(len(list(iter_cidr("10.0.0.0/22"))), 1022)
+        self.assertRaises(ValueError, iter_cidr, "10.0.0.0/33")
+        self.assertRaises(ValueError, iter_cidr, "10.0.0.0")
+
+    def test_iter_hosts(self):
+        """ Test expanding generic host entries """
+        self.assertEqual(list(iter_hosts("10.0.0.1-10.0.0.2")),
+                ["10.0.0.1", "10.0.0.2"])
+        self.assertEqual(list(iter_hosts("10.0.0.0/31")),
+                ["10.0.0.0", "10.0.0.1"])
+        self.assertEqual(list(iter_hosts("my-host")), ["my-host"])
+
+    def test_iter_alive(self):
+        """ Test sweeping overlapping entries for live addresses """
+        discovery = Discovery(pinger=self.pinger, node=DummyNode)
+        alive = discovery.iter_alive(["127.0.0.0/29", "127.0.0.1-127.0.0.3"])
+        self.assertEqual([host for host, _ in alive],
+                ["127.0.0.1", "127.0.0.3"])
+        self.assertEqual([x.pings for x in self.responders], [1, 1])
+
+    def test_discover(self):
+        """ Test that discovered nodes are confirmed and deduped by GUID """
+        def make_node(ip_address, **kwargs):
+            """ Make a node that shares its GUID with every other node """
+            node = DummyNode(ip_address, **kwargs)
+            node.bmc.unique_guid = "SAMEGUID"
+            return node
+
+        discovery = Discovery(pinger=self.pinger, node=DummyNode)
+        nodes = discovery.discover(["127.0.0.0/29"])
+        self.assertEqual([x.ip_address for x in nodes],
+                ["127.0.0.1", "127.0.0.3"])
+
+        discovery = Discovery(pinger=self.pinger, node=make_node)
+        nodes = discovery.discover(["127.0.0.0/29"])
+        self.assertEqual([x.ip_address for x in nodes], ["127.0.0.1"])
+        nodes = discovery.discover(["127.0.0.0/29"], confirm=False)
+        self.assertEqual(len(nodes), 2)
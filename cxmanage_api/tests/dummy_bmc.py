@@ -408,7 +408,7 @@ class DummyBMC(Dummy):
         work_dir = tempfile.mkdtemp(prefix="cxmanage_test-")
         # Create uplink info file
         ulinfo = open("%s/%s" % (work_dir, filename), "w")
-        for i in range(1, len(self.ip_addresses)):
+        for i in range(len(self.ip_addresses)):
             ulinfo.write("Node %i: eth0 0, eth1 0, mgmt 0\n" % i)
         ulinfo.close()
 
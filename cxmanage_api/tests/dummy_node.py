@@ -67,6 +67,13 @@ class DummyNode(Dummy):
         """Returns the node GUID"""
         return self.bmc.unique_guid
 
+    @guid.setter
+    def guid(self, value):
+        """Sets the node GUID"""
+        self.bmc.unique_guid = value
+
+    has_guid = True
+
     @property
     def chassis_id(self):
         """Returns the chasis ID."""
@@ -92,7 +99,8 @@ class DummyNode(Dummy):
                 TestSensor("Node Power", power_value),
                 TestSensor("Board Temp", temp_value)
         ]
-        return [s for s in sensors if name.lower() in s.sensor_name.lower()]
+        return dict((s.sensor_name, s) for s in sensors
+                    if name.lower() in s.sensor_name.lower())
 
     def get_boot_order(self):
         """Simulate get_boot_order(). """
@@ -124,8 +132,24 @@ class DummyNode(Dummy):
     def get_ubootenv(self):
         """Simulate get_ubootenv(). """
         ubootenv = UbootEnv()
-        ubootenv.variables["bootcmd0"] = "run bootcmd_default"
-        ubootenv.variables["bootcmd_default"] = "run bootcmd_sata"
+        ubootenv.variables["bootcmd0"] = "run init_scsi && run bootcmd_scsi"
+        ubootenv.variables["init_scsi"] = "scsi init"
+        ubootenv.variables["bootcmd_scsi"] = "run bootcmd_sata"
+        ubootenv.variables["init_pxe"] = "dhcp"
+        ubootenv.variables["bootcmd_pxe"] = "pxe boot"
+        ubootenv.variables["devnum"] = "0"
+        return ubootenv
+
+    @staticmethod
+    def get_ubootenv_image_settings():
+        """Simulate get_ubootenv_image_settings(). """
+        return ("UBOOTENV", 0, False, 0)
+
+    @staticmethod
+    def build_ubootenv_image(ubootenv):
+        """Simulate build_ubootenv_image(). The environment itself stands in
+        for the image, so tests can inspect what would be uploaded.
+        """
         return ubootenv
 
     @staticmethod
@@ -150,7 +174,7 @@ class DummyNode(Dummy):
     def get_fabric_uplink_info(self):
         """Simulate get_fabric_uplink_info(). """
         results = {}
-        for nid in range(1, len(self.ip_addresses)):
+        for nid in range(len(self.ip_addresses)):
             results[nid] = {'eth0': 0, 'eth1': 0, 'mgmt': 0}
         return results
 
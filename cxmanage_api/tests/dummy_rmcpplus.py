@@ -0,0 +1,235 @@
+# pylint: disable=too-many-instance-attributes
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+""" Local stand-in for an ECME's RMCP+ (IPMI v2.0) server """
+
+import os
+import random
+import socket
+import struct
+import threading
+
+from cxmanage_api.rmcpplus import CIPHER_SUITES, SessionKeys, \
+        build_session_packet, parse_session_packet, build_ipmi_message, \
+        parse_ipmi_message, encrypt_payload, decrypt_payload, \
+        PAYLOAD_OPEN_SESSION_REQUEST, PAYLOAD_OPEN_SESSION_RESPONSE, \
+        PAYLOAD_RAKP1, PAYLOAD_RAKP2, PAYLOAD_RAKP3, PAYLOAD_RAKP4, \
+        PAYLOAD_IPMI, PAYLOAD_ENCRYPTED
+
+
+GUID = "99cfa980-2076-11e3-d5c7-76db821cea20"
+GUID_BYTES = struct.pack("<IHHBB", 0x99cfa980, 0x2076, 0x11e3, 0xd5, 0xc7) + \
+        "76db821cea20".decode("hex")
+
+DEVICE_ID = "\x20\x01\x01\x02\x02\x9f\x96\x0c\x00\x01\x00"
+
+
+class DummyRmcpPlusBMC(object):
+    """ Answers RMCP+ session setup and a few standard IPMI commands on a
+    local UDP port, like an ECME.
+
+    Pass port=0 to pick a free port, then read it back from .port. Set
+    .drop to ignore that many of the next packets.
+
+    """
+
+    def __init__(self, username="admin", password="admin",
+                 address="127.0.0.1", port=0):
+        self.username = username
+        self.password = password
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((address, port))
+        self.sock.settimeout(0.1)
+        self.address, self.port = self.sock.getsockname()
+
+        self.power_on = False
+        self.policy = 0
+        self.resets = 0
+        self.drop = 0
+        self.sessions = {}
+        self.opened = 0
+        self.requests = []
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop answering and close the socket """
+        self._stopped.set()
+        self._thread.join()
+        self.sock.close()
+
+    def _run(self):
+        """ Answer packets until stopped """
+        while not self._stopped.is_set():
+            try:
+                data, sender = self.sock.recvfrom(65536)
+            except socket.error:
+                continue
+            if self.drop:
+                self.drop -= 1
+                continue
+            response = self._handle(data)
+            if response:
+                self.sock.sendto(response, sender)
+
+    def _handle(self, data):
+        """ Build the response to a packet, if there is one """
+        if len(data) < 16:
+            return None
+        session_id = struct.unpack("<I", data[6:10])[0]
+        if session_id == 0:
+            parsed = parse_session_packet(data)
+            if parsed:
+                return self._setup(parsed[0], parsed[3])
+            return None
+        session = self.sessions.get(session_id)
+        if session and "open" in session:
+            return self._command(session_id, session, data)
+        return None
+
+    def _setup(self, payload_type, payload):
+        """ Session setup: open session request and RAKP 1/3 """
+        tag = ord(payload[0])
+        if payload_type == PAYLOAD_OPEN_SESSION_REQUEST:
+            console_id = struct.unpack("<I", payload[4:8])[0]
+            algorithms = (ord(payload[12]), ord(payload[20]),
+                          ord(payload[28]))
+            if algorithms not in CIPHER_SUITES.values():
+                return self._status(PAYLOAD_OPEN_SESSION_RESPONSE, tag, 0x11)
+            bmc_id = random.randint(1, 0xFFFFFFFF)
+            self.sessions[bmc_id] = {"console_id": console_id,
+                                     "algorithms": algorithms}
+            return build_session_packet(
+                PAYLOAD_OPEN_SESSION_RESPONSE, 0, 0,
+                struct.pack("<BBBxII", tag, 0, 4, console_id, bmc_id) +
+                payload[8:32]
+            )
+
+        bmc_id = struct.unpack("<I", payload[4:8])[0]
+        session = self.sessions.get(bmc_id)
+        if payload_type == PAYLOAD_RAKP1:
+            if not session:
+                return self._status(PAYLOAD_RAKP2, tag, 0x02)
+            username = payload[28:28 + ord(payload[27])]
+            if username != self.username:
+                return self._status(PAYLOAD_RAKP2, tag, 0x0D)
+            keys = SessionKeys(self.password, username, payload[8:24],
+                               os.urandom(16), ord(payload[24]))
+            session["keys"] = keys
+            return build_session_packet(
+                PAYLOAD_RAKP2, 0, 0,
+                struct.pack("<BBxxI", tag, 0, session["console_id"]) +
+                keys.bmc_random + GUID_BYTES +
+                keys.rakp2(session["console_id"], bmc_id, GUID_BYTES)
+            )
+        elif payload_type == PAYLOAD_RAKP3:
+            if not session or "keys" not in session:
+                return self._status(PAYLOAD_RAKP4, tag, 0x02)
+            keys = session["keys"]
+            if payload[8:28] != keys.rakp3(session["console_id"]):
+                return self._status(PAYLOAD_RAKP4, tag, 0x0F)
+            session["open"] = True
+            session["sequence"] = 0
+            self.opened += 1
+            return build_session_packet(
+                PAYLOAD_RAKP4, 0, 0,
+                struct.pack("<BBxxI", tag, 0, session["console_id"]) +
+                keys.rakp4(bmc_id, GUID_BYTES)
+            )
+        return None
+
+    @staticmethod
+    def _status(payload_type, tag, status):
+        """ A session setup response carrying just an error status """
+        return build_session_packet(payload_type, 0, 0,
+                                    struct.pack("<BBxxI", tag, status, 0))
+
+    def _command(self, bmc_id, session, data):
+        """ Answer an IPMI request inside a session """
+        keys = session["keys"]
+        _, integrity, confidentiality = session["algorithms"]
+        integrity_key = keys.k1 if integrity else None
+        parsed = parse_session_packet(data, integrity_key)
+        if not parsed or parsed[0] & 0x3F != PAYLOAD_IPMI:
+            return None
+        payload = parsed[3]
+        if confidentiality:
+            payload = decrypt_payload(keys.k2[:16], payload)
+        request = payload and parse_ipmi_message(payload)
+        if not request:
+            return None
+
+        netfn, cmd, sequence, request_data = request
+        self.requests.append((netfn, cmd))
+        response = build_ipmi_message(
+            netfn, cmd, sequence, self._execute(bmc_id, netfn, cmd,
+                                                request_data),
+            response=True
+        )
+        payload_type = PAYLOAD_IPMI
+        if confidentiality:
+            payload_type |= PAYLOAD_ENCRYPTED
+            response = encrypt_payload(keys.k2[:16], response)
+        session["sequence"] += 1
+        return build_session_packet(payload_type, session["console_id"],
+                                    session["sequence"], response,
+                                    integrity_key)
+
+    def _execute(self, bmc_id, netfn, cmd, data):
+        """ Run a command; returns completion code plus response data """
+        if (netfn, cmd) == (0x06, 0x01):
+            return "\x00" + DEVICE_ID
+        elif (netfn, cmd) == (0x06, 0x37):
+            return "\x00" + GUID_BYTES
+        elif (netfn, cmd) in [(0x06, 0x02), (0x06, 0x03)]:
+            self.resets += 1
+            self.sessions.clear()
+            return "\x00"
+        elif (netfn, cmd) == (0x06, 0x3C):
+            self.sessions.pop(struct.unpack("<I", data[:4])[0], None)
+            return "\x00"
+        elif (netfn, cmd) == (0x00, 0x01):
+            return "\x00" + chr(self.power_on | self.policy << 5) + \
+                    "\x00\x00"
+        elif (netfn, cmd) == (0x00, 0x02):
+            if ord(data[0]) in [0, 5]:
+                self.power_on = False
+            elif ord(data[0]) == 1:
+                self.power_on = True
+            return "\x00"
+        elif (netfn, cmd) == (0x00, 0x06):
+            self.policy = ord(data[0])
+            return "\x00\x07"
+        return "\xc1"
@@ -0,0 +1,118 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+
+"""Calxeda: energy_test.py"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cxmanage_api.energy import EnergyMeter, JOULES_PER_KWH
+from cxmanage_api.fabric import Fabric
+from cxmanage_api.tests import DummyNode
+
+
+class EnergyMeterTest(unittest.TestCase):
+    """ Tests involving fabric energy accounting """
+
+    def setUp(self):
+        self.fabric = Fabric(DummyNode.ip_addresses[0], node=DummyNode)
+        self.nodes = [DummyNode(i) for i in DummyNode.ip_addresses]
+        self.fabric._nodes = dict((i, self.nodes[i])
+                for i in xrange(len(self.nodes)))
+        self.directory = tempfile.mkdtemp(prefix="cxmanage_test-")
+        self.filename = os.path.join(self.directory, "energy.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_integrate(self):
+        """ Test integrating readings, with gaps """
+        meter = EnergyMeter(self.fabric, max_gap=60)
+        for timestamp, watts in [(0, 10), (10, 20), (20, 20), (15, 99),
+                                 (200, 30), (210, 30)]:
+            meter.add(0, timestamp, watts)
+        joules = 150 + 200 + 300
+        self.assertAlmostEqual(meter.by_node()[0], joules / JOULES_PER_KWH)
+        self.assertEqual(meter.unaccounted(), {0: 180})
+        self.assertAlmostEqual(meter.by_node(estimate=True)[0],
+                               joules * (1 + 180 / 30.0) / JOULES_PER_KWH)
+
+    def test_aggregate(self):
+        """ Test totals per slot and for the fabric """
+        meter = EnergyMeter(self.fabric)
+        for node_id in range(6):
+            meter.append(0, {(node_id, "Node Power"): 3600.0,
+                             (node_id, "Board Temp"): 40.0})
+            meter.append(10, {(node_id, "Node Power"): 3600.0})
+        self.assertEqual(meter.by_slot(), {0: 0.04, 1: 0.02})
+        self.assertAlmostEqual(meter.total(), 0.06)
+
+        meter.slot_of = lambda node_id: node_id % 2
+        self.assertEqual(meter.by_slot(), {0: 0.03, 1: 0.03})
+
+        meter.reset()
+        self.assertEqual(meter.total(), 0)
+        meter.append(20, {(0, "Node Power"): 3600.0})
+        self.assertAlmostEqual(meter.total(), 0.01)
+
+    def test_checkpoint(self):
+        """ Test that totals survive a restart """
+        meter = EnergyMeter(self.fabric, filename=self.filename)
+        meter.add(0, 0, 100)
+        meter.add(0, 10, 100)
+        meter.add(1, 0, 50)
+        meter.add(1, 100, 50)
+        meter.stop()
+
+        meter = EnergyMeter(self.fabric, filename=self.filename)
+        self.assertAlmostEqual(meter.by_node()[0], 1000 / JOULES_PER_KWH)
+        self.assertEqual(meter.unaccounted(), {0: 0, 1: 100})
+        meter.add(0, 20, 100)
+        self.assertAlmostEqual(meter.by_node()[0], 2000 / JOULES_PER_KWH)
+
+        with open(self.filename, "w") as checkpoint:
+            checkpoint.write("garbage")
+        meter = EnergyMeter(self.fabric, filename=self.filename)
+        self.assertEqual(meter.by_node(), {})
+
+    def test_poll(self):
+        """ Test metering a fabric """
+        meter = EnergyMeter(self.fabric, filename=self.filename,
+                            save_interval=0)
+        for _ in range(3):
+            self.assertEqual(meter.poll(), len(self.nodes))
+        self.assertEqual(sorted(meter.by_node()), range(len(self.nodes)))
+        self.assertTrue(meter.total() > 0)
+        self.assertTrue(os.path.exists(self.filename))
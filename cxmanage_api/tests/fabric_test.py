@@ -33,15 +33,24 @@
 
 """Calxeda: fabric_test.py """
 
+import time
 import random
 import unittest
-from mock import call
+from threading import Event
+from mock import Mock, call
+from pyipmi import IpmiError
 
 from cxmanage_api.fabric import Fabric
+from cxmanage_api.tasks import HedgePolicy, TaskQueue
+from cxmanage_api.rmcp import RmcpPinger
+from cxmanage_api.wait import WaitSchedule
+from cxmanage_api.topology import TopologyCache
 from cxmanage_api.tftp import InternalTftp, ExternalTftp
 from cxmanage_api.firmware_package import FirmwarePackage
-from cxmanage_api.cx_exceptions import CommandFailedError
-from cxmanage_api.tests import DummyNode, DummyFailNode
+from cxmanage_api.cx_exceptions import CommandFailedError, \
+        DeadlineExceededError, TimeoutError
+from cxmanage_api.tests import DummyNode, DummyFailNode, \
+        DummyRmcpResponder
 
 
 class FabricTest(unittest.TestCase):
@@ -77,12 +86,55 @@ class FabricTest(unittest.TestCase):
         for node in self.nodes[1:]:
             self.assertEqual(node.method_calls, [])
 
+    def test_get_mac_addresses_retry(self):
+        """ Test that a failed fabric-wide MAC query is retried on another
+        node rather than asking every node """
+        self.nodes[0].get_fabric_macaddrs.side_effect = IpmiError
+        result = self.fabric.get_mac_addresses()
+        self.assertEqual(sorted(result.keys()), range(len(self.nodes)))
+        self.assertEqual(self.fabric.query_paths["get_mac_addresses"],
+                "fabric")
+        self.assertEqual(self.nodes[1].method_calls,
+                [call.get_fabric_macaddrs()])
+        for node in self.nodes[2:]:
+            self.assertEqual(node.method_calls, [])
+
     def test_get_uplink_info(self):
-        """ Test get_uplink_info command """
+        """ Test that get_uplink_info asks only the primary node """
+        result = self.fabric.get_uplink_info()
+        self.assertEqual(sorted(result.keys()), range(len(self.nodes)))
+        self.assertEqual(self.fabric.query_paths["get_uplink_info"], "fabric")
+        self.assertEqual(self.nodes[0].method_calls,
+                [call.get_fabric_uplink_info()])
+        for node in self.nodes[1:]:
+            self.assertEqual(node.method_calls, [])
+
+    def test_get_uplink_info_fanout(self):
+        """ Test that get_uplink_info falls back to asking each node """
+        for node in self.nodes[:2]:
+            node.get_fabric_uplink_info.side_effect = lambda: {0: {}}
         self.fabric.get_uplink_info()
+        self.assertEqual(self.fabric.query_paths["get_uplink_info"], "fanout")
+        for node in self.nodes[2:]:
+            self.assertEqual(node.method_calls, [call.get_uplink_info()])
+
+        for node in self.nodes:
+            node.reset_mock()
+        tasks = self.fabric.get_uplink_info(async=True)
+        for task in tasks.values():
+            task.join()
+        self.assertEqual(self.fabric.query_paths["get_uplink_info"], "fanout")
         for node in self.nodes:
             self.assertEqual(node.method_calls, [call.get_uplink_info()])
 
+        # Malformed fabric-wide output also falls back
+        for error in [ValueError, IndexError]:
+            for node in self.nodes[:2]:
+                node.get_fabric_uplink_info.side_effect = error
+            self.fabric.get_uplink_info()
+            self.assertEqual(self.fabric.query_paths["get_uplink_info"],
+                    "fanout")
+
     def test_get_uplink_speed(self):
         """ Test get_uplink_speed command """
         self.fabric.get_uplink_speed()
@@ -143,12 +195,72 @@ class FabricTest(unittest.TestCase):
 
     def test_set_boot_order(self):
         """ Test set_boot_order command """
-        boot_args = "disk0,pxe,retry"
+        boot_args = ["disk0", "pxe", "retry"]
         self.fabric.set_boot_order(boot_args)
-        for node in self.nodes:
-            self.assertEqual(
-                node.method_calls, [call.set_boot_order(boot_args)]
-            )
+        self._check_ubootenv_edit(groups=1)
+
+        # The shared image carries the new boot order
+        image = self.nodes[0].upload_ubootenv_image.call_args[0][0]
+        self.assertEqual(image.get_boot_order(), boot_args)
+
+    def test_set_boot_order_groups(self):
+        """ Test that set_boot_order edits each distinct ubootenv once """
+        ubootenv = self.nodes[0].get_ubootenv()
+        ubootenv.variables["ethprime"] = "xgmac1"
+        self.nodes[0].get_ubootenv.side_effect = lambda: ubootenv
+        self.nodes[0].get_ubootenv.reset_mock()
+
+        self.fabric.set_boot_order(["pxe", "disk"])
+        self._check_ubootenv_edit(groups=2)
+
+    def test_set_boot_order_settings(self):
+        """ Test that nodes with different image settings don't share an
+        image """
+        self.nodes[1].get_ubootenv_image_settings = lambda: (
+            "UBOOTENV", 0x1000, False, 0
+        )
+        self.fabric.set_boot_order(["pxe", "disk"])
+        self._check_ubootenv_edit(groups=2)
+
+    def test_set_boot_order_errors(self):
+        """ Test that set_boot_order failures are reported per node """
+        self.nodes[2].get_ubootenv.side_effect = IpmiError("fail")
+        try:
+            self.fabric.set_boot_order(["pxe", "disk"])
+            self.fail("Expected CommandFailedError")
+        except CommandFailedError as err:
+            self.assertEqual(sorted(err.results), [0, 1, 3])
+            self.assertEqual(err.errors.keys(), [2])
+        self.assertEqual(self.nodes[2].upload_ubootenv_image.call_count, 0)
+        self.assertEqual(self.nodes[0].upload_ubootenv_image.call_count, 1)
+
+        # A bad edit fails every node, each with its own error
+        try:
+            self.fabric.set_boot_order(["floppy"])
+            self.fail("Expected CommandFailedError")
+        except CommandFailedError as err:
+            self.assertEqual(sorted(err.errors), [0, 1, 2, 3])
+
+    def test_set_boot_order_async(self):
+        """ Test that async set_boot_order returns before downloading """
+        started = Event()
+        release = Event()
+        ubootenv = self.nodes[0].get_ubootenv()
+
+        def get_ubootenv():
+            """ Block until released """
+            started.set()
+            release.wait()
+            return ubootenv
+
+        self.nodes[0].get_ubootenv.side_effect = get_ubootenv
+        tasks = self.fabric.set_boot_order(["pxe", "disk"], async=True)
+        self.assertTrue(started.wait(5))
+        self.assertTrue(tasks[0].is_alive())
+        release.set()
+        for task in tasks.values():
+            task.join()
+            self.assertEqual(task.status, "Completed")
 
     def test_get_boot_order(self):
         """ Test get_boot_order command """
@@ -158,11 +270,11 @@ class FabricTest(unittest.TestCase):
 
     def test_set_pxe_interface(self):
         """ Test set_pxe_interface command """
-        self.fabric.set_pxe_interface("eth0")
-        for node in self.nodes:
-            self.assertEqual(
-                node.method_calls, [call.set_pxe_interface("eth0")]
-            )
+        self.fabric.set_pxe_interface("eth1")
+        self._check_ubootenv_edit(groups=1)
+
+        image = self.nodes[0].upload_ubootenv_image.call_args[0][0]
+        self.assertEqual(image.get_pxe_interface(), "eth1")
 
     def test_get_pxe_interface(self):
         """ Test get_pxe_interface command """
@@ -441,4 +553,227 @@ class FabricTest(unittest.TestCase):
                 call.get_chassis_status()
             ])
 
+    def test_deadline(self):
+        """ Test that a fabric deadline returns partial results """
+        self.nodes[2].get_power.side_effect = lambda: time.sleep(1)
+        self.fabric.deadline = 0.2
 
+        try:
+            self.fabric.get_power()
+            self.fail("Expected DeadlineExceededError")
+        except DeadlineExceededError as err:
+            self.assertEqual(err.stragglers, [2])
+            self.assertEqual(sorted(err.results.keys()), [0, 1, 3])
+
+        # Writes aren't cut short
+        self.nodes[2].set_power.side_effect = lambda *args: time.sleep(0.4)
+        self.fabric.set_power("on")
+        self.assertEqual(self.nodes[2].set_power.call_count, 1)
+
+    def test_hedge_policy(self):
+        """ Test that read-only commands go through the hedge policy """
+        self.fabric.hedge_policy = HedgePolicy()
+        self.fabric.get_power()
+        for node in self.nodes:
+            self.assertEqual(node.method_calls, [call.get_power()])
+        self.assertEqual(self.fabric.hedge_policy._latencies.keys(),
+                ["get_power"])
+        self.assertEqual(len(self.fabric.hedge_policy._latencies["get_power"]),
+                len(self.nodes))
+
+    def test_refresh(self):
+        """ Test that refresh reuses unchanged nodes and finds new ones """
+        ipinfo = dict(enumerate(DummyNode.ip_addresses))
+        failures = []
+        created = []
+
+        def get_fabric_ipinfo():
+            """ Return the current ipinfo, or fail if asked to """
+            if failures:
+                raise failures.pop()
+            return dict(ipinfo)
+
+        def make_node(**kwargs):
+            """ Make a node that reports our ipinfo """
+            node = DummyNode(**kwargs)
+            node.get_fabric_ipinfo.side_effect = get_fabric_ipinfo
+            created.append(node)
+            return node
+
+        fabric = Fabric(DummyNode.ip_addresses[0], node=make_node,
+                wait_schedule=WaitSchedule(initial=0.01, maximum=0.05),
+                topology_cache=TopologyCache())
+        fabric.refresh()
+        old_nodes = dict(fabric.nodes)
+        self.assertEqual(len(old_nodes), 4)
+        self.assertEqual(len(created), 5)
+
+        # Unchanged nodes are reused; only the root node is created
+        del created[:]
+        fabric.refresh()
+        self.assertEqual(fabric.nodes, old_nodes)
+        self.assertEqual(len(created), 1)
+
+        # A new node at a new address replaces the old one
+        ipinfo[2] = "192.168.100.9"
+        failures.append(IpmiError())
+        fabric.refresh(wait=True, timeout=5)
+        self.assertEqual(fabric.nodes[2].ip_address, "192.168.100.9")
+        self.assertFalse(fabric.nodes[2] is old_nodes[2])
+        self.assertTrue(fabric.nodes[1] is old_nodes[1])
+
+        # If we never get enough nodes back, give up with the last error
+        del ipinfo[3]
+        failures.append(IpmiError())
+        self.assertRaises(IpmiError, fabric.refresh, wait=True, timeout=0.3)
+        del ipinfo[2]
+        self.assertRaises(TimeoutError, fabric.refresh, wait=True,
+                timeout=0.3)
+
+    def test_node_indexes(self):
+        """ Test looking up nodes by GUID, IP address and MAC address """
+        for node_id, node in self.fabric.nodes.iteritems():
+            self.assertTrue(self.fabric.node_by_guid(node.guid) is node)
+            self.assertTrue(self.fabric.node_by_ip(node.ip_address) is node)
+            self.assertTrue(self.fabric.node_by_mac(
+                    "00:00:00:00:%02X:01" % node_id) is node)
+        self.assertEqual(self.fabric.node_by_ip("10.0.0.1"), None)
+        self.assertEqual(self.fabric.node_by_mac("00:00:00:00:00:09"), None)
+        self.assertEqual(self.nodes[0].get_fabric_macaddrs.call_count, 1)
+        self.assertEqual(self.fabric.nodes_in_slot(0),
+                dict(enumerate(self.nodes)))
+        self.assertEqual(self.fabric.nodes_in_slot(1), {})
+
+        # Replace a node: only its entries change
+        new_node = DummyNode("192.168.100.9")
+        old_node = self.nodes[2]
+        self.fabric._nodes = dict(self.fabric._nodes)
+        self.fabric._nodes[2] = new_node
+        self.assertEqual(self.fabric.node_by_ip(old_node.ip_address), None)
+        self.assertEqual(self.fabric.node_by_guid(old_node.guid), None)
+        self.assertTrue(self.fabric.node_by_ip("192.168.100.9") is new_node)
+        self.assertTrue(self.fabric.node_by_mac("00:00:00:00:02:01")
+                is new_node)
+        self.assertTrue(self.fabric.node_by_mac("00:00:00:00:01:01")
+                is self.nodes[1])
+        self.assertEqual(self.nodes[0].get_fabric_macaddrs.call_count, 2)
+        self.assertTrue(self.fabric.nodes_in_slot(0)[2] is new_node)
+
+    def test_guid_index(self):
+        """ Test that GUIDs nodes don't know are read on demand, in
+        parallel """
+        for node in self.nodes[1:]:
+            node.has_guid = False
+        self.fabric.task_queue = Mock(wraps=TaskQueue())
+
+        self.assertTrue(self.fabric.node_by_ip(self.nodes[1].ip_address)
+                is self.nodes[1])
+        self.assertTrue(self.fabric.node_by_guid(self.nodes[0].guid)
+                is self.nodes[0])
+        self.assertEqual(self.fabric.task_queue.put.call_count, 0)
+
+        self.assertTrue(self.fabric.node_by_guid(self.nodes[2].guid)
+                is self.nodes[2])
+        self.assertEqual(self.fabric.task_queue.put.call_count,
+                len(self.nodes) - 1)
+        self.assertEqual(self.fabric.node_by_guid("unknown"), None)
+
+    def test_topology_cache(self):
+        """ Test that new fabrics load a known topology from the cache """
+        guids = dict((x, "GUID-%s" % x) for x in DummyNode.ip_addresses)
+        created = []
+
+        def make_node(**kwargs):
+            """ Make a node with a fixed GUID per address """
+            node = DummyNode(**kwargs)
+            node.guid = guids[node.ip_address]
+            node.get_fabric_ipinfo.side_effect = lambda: dict(
+                    enumerate(DummyNode.ip_addresses))
+            created.append(node)
+            return node
+
+        # No cache unless we ask for one
+        self.assertEqual(Fabric(DummyNode.ip_addresses[0]).topology_cache,
+                None)
+
+        cache = TopologyCache()
+        fabric = Fabric(DummyNode.ip_addresses[0], node=make_node,
+                topology_cache=cache)
+        self.assertEqual(len(fabric.nodes), 4)
+        self.assertEqual(created[0].get_fabric_ipinfo.call_count, 1)
+        fabric.get_mac_addresses()
+        fabric.get_versions()
+
+        # Second fabric: no ipinfo, same nodes, MACs and hardware versions
+        del created[:]
+        fabric = Fabric(DummyNode.ip_addresses[0], node=make_node,
+                topology_cache=cache)
+        self.assertEqual(len(fabric.nodes), 4)
+        for node_id, node in fabric.nodes.iteritems():
+            self.assertEqual(node.node_id, node_id)
+            self.assertEqual(node.ip_address, DummyNode.ip_addresses[node_id])
+            self.assertEqual(node.guid, guids[node.ip_address])
+            self.assertEqual(node.hardware_version, "TestBoard X00")
+            self.assertTrue(fabric.node_by_mac(
+                    "00:00:00:00:%02X:01" % node_id) is node)
+        self.assertEqual(sum(x.get_fabric_ipinfo.call_count
+                for x in created), 0)
+        self.assertEqual(sum(x.get_fabric_macaddrs.call_count
+                for x in created), 0)
+
+        # Primary node was replaced: fall back to ipinfo
+        guids[DummyNode.ip_addresses[0]] = "NEWGUID"
+        del created[:]
+        fabric = Fabric(DummyNode.ip_addresses[0], node=make_node,
+                topology_cache=cache)
+        self.assertEqual(len(fabric.nodes), 4)
+        self.assertEqual(sum(x.get_fabric_ipinfo.call_count
+                for x in created), 1)
+        self.assertEqual(cache.guid(DummyNode.ip_addresses[0]), "NEWGUID")
+
+    def test_skip_unreachable(self):
+        """ Test that nodes that miss an RMCP ping are skipped and flagged """
+        responder = DummyRmcpResponder()
+        try:
+            self.fabric.pinger = RmcpPinger(port=responder.port, timeout=0.2)
+            for node in self.nodes:
+                node.ip_address = "127.0.0.1"
+            self.nodes[2].ip_address = "127.0.0.2"
+
+            ping = self.fabric.ping()
+            self.assertEqual([ping[i] is None for i in range(4)],
+                    [False, False, True, False])
+
+            self.fabric.skip_unreachable = True
+            try:
+                self.fabric.get_power()
+                self.fail("Expected CommandFailedError")
+            except CommandFailedError as err:
+                self.assertEqual(sorted(err.results.keys()), [0, 1, 3])
+                self.assertEqual(err.errors.keys(), [2])
+            self.assertEqual(self.nodes[2].method_calls, [])
+            self.assertEqual(self.nodes[0].method_calls, [call.get_power()])
+
+            # Async callers get a failed task for the skipped node
+            tasks = self.fabric.get_power(async=True)
+            self.assertEqual(sorted(tasks), [0, 1, 2, 3])
+            self.assertTrue(tasks[2].join(0))
+            self.assertEqual(tasks[2].status, "Failed")
+            self.assertTrue(isinstance(tasks[2].error, TimeoutError))
+        finally:
+            responder.stop()
+
+    def _check_ubootenv_edit(self, groups):
+        """ Check that a ubootenv edit downloaded from every node, built one
+        image per group of identical environments, and uploaded everywhere.
+        """
+        builds = 0
+        for node in self.nodes:
+            self.assertEqual(node.get_ubootenv.call_count, 1)
+            self.assertEqual(node.upload_ubootenv_image.call_count, 1)
+            builds += node.build_ubootenv_image.call_count
+        self.assertEqual(builds, groups)
+
+        images = set(id(node.upload_ubootenv_image.call_args[0][0])
+                for node in self.nodes)
+        self.assertEqual(len(images), groups)
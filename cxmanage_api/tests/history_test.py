@@ -0,0 +1,219 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+
+"""Calxeda: history_test.py"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+
+from cxmanage_api.fabric import Fabric
+from cxmanage_api.history import HistoryStore, Segment
+from cxmanage_api.poller import SensorPoller
+from cxmanage_api.tests import DummyNode
+
+
+class SegmentTest(unittest.TestCase):
+    """ Tests involving sensor history segment files """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="cxmanage_test-")
+        self.path = os.path.join(self.directory, "raw.0000.seg")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read(self):
+        """ Test reading series back, by time range """
+        segment = Segment(self.path, [(0, "Power"), (1, "Power")])
+        segment.append_block(array("d", [10, 20, 30]), [
+            array("f", [1.5, 2.5, 3.5]), array("f", [4, float("nan"), 6])
+        ])
+        segment.append_block(array("d", [40]),
+                             [array("f", [7.5]), array("f", [8])])
+        self.assertEqual((segment.first, segment.last), (10, 40))
+        self.assertEqual(segment.read((0, "Power")),
+                         [(10, 1.5), (20, 2.5), (30, 3.5), (40, 7.5)])
+        self.assertEqual(segment.read((1, "Power")),
+                         [(10, 4), (30, 6), (40, 8)])
+        self.assertEqual(segment.read((0, "Power"), start=20, end=30),
+                         [(20, 2.5), (30, 3.5)])
+        self.assertEqual(segment.read((0, "Power"), start=35), [(40, 7.5)])
+        self.assertEqual(segment.read((2, "Power")), [])
+        self.assertEqual(
+            [(t, list(row)) for t, row in segment.read_rows(start=30)],
+            [(30, [3.5, 6]), (40, [7.5, 8])]
+        )
+        segment.close()
+
+    def test_reopen(self):
+        """ Test that segments persist, and partial blocks are dropped """
+        segment = Segment(self.path, [(0, "Power")])
+        segment.append_block(array("d", [10, 20]), [array("f", [1, 2])])
+        size = segment.size
+        segment.close()
+
+        with open(self.path, "ab") as segment_file:
+            segment_file.write("\x05\x00\x00\x00\x00\x00\x00\x00garbage")
+
+        segment = Segment(self.path)
+        self.assertEqual(segment.columns, [(0, "Power")])
+        self.assertEqual(segment.read((0, "Power")), [(10, 1), (20, 2)])
+        self.assertEqual(os.path.getsize(self.path), size)
+        segment.append_block(array("d", [30]), [array("f", [3])])
+        self.assertEqual(segment.read((0, "Power"), start=25), [(30, 3)])
+        segment.close()
+
+        with open(self.path, "wb") as segment_file:
+            segment_file.write("not a segment")
+        self.assertRaises(ValueError, Segment, self.path)
+
+
+class HistoryStoreTest(unittest.TestCase):
+    """ Tests involving the sensor history store """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="cxmanage_test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append(self):
+        """ Test recording, persisting and querying samples """
+        store = HistoryStore(self.directory, block_rows=4)
+        for i in range(10):
+            store.append(1000 + 10 * i, {(0, "Power"): i, (1, "Power"): -i})
+        expected = [(1000 + 10 * i, i) for i in range(10)]
+        self.assertEqual(store.query(0, "Power"), expected)
+        self.assertEqual(store.query(1, "Power", start=1080),
+                         [(1080, -8), (1090, -9)])
+        store.close()
+
+        store = HistoryStore(self.directory, block_rows=4)
+        self.assertEqual(store.query(0, "Power"), expected)
+        store.append(1100, {(0, "Power"): 10})
+        self.assertEqual(store.query(0, "Power", start=1090),
+                         [(1090, 9), (1100, 10)])
+        self.assertRaises(ValueError, store.query, 0, "Power",
+                          resolution=5)
+        self.assertRaises(ValueError, store.query, 0, "Power",
+                          resolution=60, stat="median")
+        store.close()
+
+    def test_new_series(self):
+        """ Test that new series start a new segment """
+        store = HistoryStore(self.directory, rollups=(), block_rows=2)
+        store.append(10, {(0, "Power"): 1})
+        store.append(20, {(0, "Power"): 2, (0, "Temp"): 40})
+        store.append(30, {(0, "Temp"): 41})
+        self.assertEqual(store.query(0, "Power"), [(10, 1), (20, 2)])
+        self.assertEqual(store.query(0, "Temp"), [(20, 40), (30, 41)])
+        store.close()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ["raw.0000.seg", "raw.0001.seg"])
+
+    def test_rollups(self):
+        """ Test per-minute and per-hour rollups """
+        store = HistoryStore(self.directory, block_rows=4)
+        for i in range(0, 7330, 10):
+            store.append(i, {(0, "Power"): i % 60})
+        self.assertEqual(store.resolutions, [0, 60, 3600])
+
+        minutes = store.query(0, "Power", resolution=60)
+        self.assertEqual(len(minutes), 122)
+        self.assertEqual(minutes[0], (0, 25))
+        self.assertEqual(store.query(0, "Power", resolution=60,
+                                     stat="max", start=60, end=120),
+                         [(60, 50), (120, 50)])
+        self.assertEqual(store.query(0, "Power", resolution=3600,
+                                     stat="min"), [(0, 0), (3600, 0)])
+        store.close()
+
+    def test_rollups_reopen(self):
+        """ Test that rollup buckets in progress survive a close """
+        store = HistoryStore(self.directory, block_rows=4)
+        for i in range(0, 3630, 10):
+            store.append(i, {(0, "Power"): i % 60, (1, "Power"): i})
+        store.close()
+
+        store = HistoryStore(self.directory, block_rows=4)
+        for i in range(3630, 7330, 10):
+            store.append(i, {(0, "Power"): i % 60, (1, "Power"): i})
+
+        other = os.path.join(self.directory, "other")
+        expected = HistoryStore(other, block_rows=4)
+        for i in range(0, 7330, 10):
+            expected.append(i, {(0, "Power"): i % 60, (1, "Power"): i})
+
+        for node_id in [0, 1]:
+            for resolution in [60, 3600]:
+                for stat in ["mean", "min", "max"]:
+                    self.assertEqual(
+                        store.query(node_id, "Power", resolution=resolution,
+                                    stat=stat),
+                        expected.query(node_id, "Power",
+                                       resolution=resolution, stat=stat)
+                    )
+        store.close()
+        expected.close()
+
+    def test_prune(self):
+        """ Test deleting old segments """
+        store = HistoryStore(self.directory, rollups=(), block_rows=2,
+                             segment_span=100)
+        for i in range(0, 300, 10):
+            store.append(i, {(0, "Power"): i})
+        self.assertEqual(store.prune(150), 1)
+        self.assertEqual(store.query(0, "Power")[0], (100, 100))
+        store.close()
+
+    def test_poller(self):
+        """ Test recording from a sensor poller """
+        fabric = Fabric(DummyNode.ip_addresses[0], node=DummyNode)
+        nodes = [DummyNode(i) for i in DummyNode.ip_addresses]
+        fabric._nodes = dict((i, nodes[i]) for i in xrange(len(nodes)))
+        store = HistoryStore(self.directory)
+        poller = SensorPoller(fabric, sensors=["Power"], store=store)
+        for _ in range(3):
+            poller.poll()
+        poller.stop()
+
+        for node_id in fabric.nodes:
+            history = store.query(node_id, "Node Power")
+            self.assertEqual(len(history), 3)
+            self.assertAlmostEqual(history[-1][1],
+                                   poller.latest(node_id, "Node Power")[1],
+                                   places=5)
+        store.close()
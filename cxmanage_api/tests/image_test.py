@@ -36,6 +36,7 @@ import os
 import shutil
 import tempfile
 import unittest
+from mock import patch
 
 from cxmanage_api.simg import get_simg_header
 from cxmanage_api.tftp import InternalTftp
@@ -75,6 +76,24 @@ class ImageTest(unittest.TestCase):
         self.assertEqual(header.daddr, daddr)
         self.assertEqual(simg[header.imgoff:], contents)
 
+        # Rendering again reuses the SIMG, but in a file of its own
+        with patch("cxmanage_api.image.create_simg") as create:
+            other = image.render_to_simg(priority, daddr)
+            self.assertEqual(create.call_count, 0)
+        self.assertNotEqual(other, filename)
+        self.assertEqual(open(other).read(), simg)
+        header = get_simg_header(
+            open(image.render_to_simg(priority + 1, daddr)).read()
+        )
+        self.assertEqual(header.priority, priority + 1)
+
+        # An image with its own daddr ignores the argument, cache included
+        image = TestImage(random_file(imglen), "RAW", daddr=daddr)
+        image.render_to_simg(priority, 0)
+        with patch("cxmanage_api.image.create_simg") as create:
+            image.render_to_simg(priority, 1)
+            self.assertEqual(create.call_count, 0)
+
     @staticmethod
     def test_multiple_uploads():
         """ Test to make sure FDs are being closed """
@@ -0,0 +1,162 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: ipmibatch_test.py"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+from pyipmi import make_bmc, IpmiError
+from pyipmi.bmc import LanBMC
+
+from cxmanage_api.node import Node
+from cxmanage_api.ipmibatch import IpmiBatch, batching_tool_class
+from cxmanage_api.tests import DummyBMC
+
+
+# A stand-in for ipmitool that logs how it was run, and understands exec
+FAKE_IPMITOOL = r'''
+import os, sys, shlex
+with open(os.environ["FAKE_IPMITOOL_LOG"], "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\n")
+def run(words):
+    if words == ["chassis", "status"]:
+        print "System Power         : on"
+        print "Power Restore Policy : always-off"
+    elif words == ["bmc", "guid"]:
+        print "System GUID  : 99cfa980-2076-11e3-d5c7-76db821cea20"
+    elif words[:1] == ["echo"]:
+        print " ".join(words[1:])
+    else:
+        sys.stderr.write("Invalid command: %s\n" % " ".join(words))
+        return 1
+    return 0
+args = sys.argv[1:]
+while args and args[0].startswith("-"):
+    args = args[2:]
+if args[:1] == ["exec"]:
+    status = 0
+    for line in open(args[1]):
+        if line.strip():
+            status = run(shlex.split(line))
+    sys.exit(status)
+sys.exit(run(args))
+'''
+
+
+class IpmiBatchTest(unittest.TestCase):
+    """ Tests involving batched ipmitool execution """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="cxmanage_ipmibatch_test-")
+        self.log = os.path.join(self.work_dir, "log")
+        ipmitool = os.path.join(self.work_dir, "ipmitool")
+        with open(ipmitool, "w") as script:
+            script.write("#!%s\n%s" % (sys.executable, FAKE_IPMITOOL))
+        os.chmod(ipmitool, 0755)
+
+        self.old_environ = dict(os.environ)
+        os.environ["IPMITOOL_PATH"] = ipmitool
+        os.environ["FAKE_IPMITOOL_LOG"] = self.log
+
+        self.bmc = make_bmc(LanBMC, hostname="10.0.0.1", username="admin",
+                password="admin", verbose=False,
+                tool_class=batching_tool_class())
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.old_environ)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def runs(self):
+        """ The commands ipmitool was run with, minus connection args """
+        if not os.path.exists(self.log):
+            return []
+        return [" ".join(x.split()[10:]) for x in open(self.log)]
+
+    def test_batch(self):
+        """ Test that batched reads cost one ipmitool process """
+        guid = "99cfa980-2076-11e3-d5c7-76db821cea20"
+        with IpmiBatch(self.bmc, ["get_chassis_status", "guid",
+                                  "get_info_card"]) as batch:
+            self.assertEqual(len(self.runs()), 1)
+            self.assertTrue(self.runs()[0].startswith("exec "))
+
+            # Fresh output isn't fetched again
+            self.assertEqual(IpmiBatch(self.bmc, ["guid"]).execute(), 0)
+            self.assertEqual(len(self.runs()), 1)
+
+            self.assertTrue(batch.answered("get_chassis_status"))
+            self.assertFalse(batch.answered("get_info_card"))
+            self.assertTrue(self.bmc.get_chassis_status().power_on)
+            self.assertFalse(batch.answered("get_chassis_status"))
+            self.assertEqual(self.bmc.guid().system_guid, guid)
+            self.assertEqual(len(self.runs()), 1)
+
+            # A failed command runs again on its own, to report its error
+            self.assertRaises(IpmiError, self.bmc.get_info_card)
+            self.assertEqual(self.runs()[1:], ["cxoem info card"])
+
+            # Output is only used once
+            self.bmc.get_chassis_status()
+            self.assertEqual(self.runs()[2:], ["chassis status"])
+
+            # Running the batch again fetches what was used up
+            self.assertEqual(batch.execute(), 2)
+            self.assertEqual(len(self.runs()), 4)
+
+        # Leftovers are dropped on exit
+        self.bmc.guid()
+        self.assertEqual(self.runs()[4:], ["bmc guid"])
+
+    def test_ttl(self):
+        """ Test that stale output isn't used """
+        IpmiBatch(self.bmc, ["get_chassis_status"], ttl=0.1).execute()
+        time.sleep(0.2)
+        self.bmc.get_chassis_status()
+        self.assertEqual(self.runs()[1:], ["chassis status"])
+
+    def test_node_prefetch(self):
+        """ Test that nodes batch reads through their BMC """
+        node = Node("10.0.0.1")
+        self.assertEqual(node.prefetch(["get_chassis_status", "guid"]), 2)
+        self.assertTrue(node.get_power())
+        self.assertEqual(len(self.runs()), 1)
+
+        # BMCs without a batching tool just run their calls later
+        node = Node("10.0.0.1", bmc=DummyBMC)
+        self.assertEqual(node.prefetch(["get_chassis_status"]), 0)
+        self.assertFalse(IpmiBatch(node.bmc).answered("get_chassis_status"))
@@ -0,0 +1,222 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: ipmishell_test.py"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+from mock import Mock
+
+from pyipmi import make_bmc, IpmiError
+from pyipmi.bmc import LanBMC
+
+from cxmanage_api.node import Node
+from cxmanage_api.ipmishell import IpmitoolShellPool, pooled_tool_class, \
+        is_error
+
+
+# A stand-in for "ipmitool ... shell"
+FAKE_SHELL = r'''
+import sys, time
+def prompt():
+    sys.stdout.write("ipmitool> ")
+    sys.stdout.flush()
+prompt()
+while True:
+    line = sys.stdin.readline()
+    words = line.split()
+    if not line or words == ["exit"]:
+        break
+    if words == ["power", "status"]:
+        sys.stdout.write("Chassis Power is off\n")
+    elif words == ["chassis", "status"]:
+        sys.stdout.write("System Power         : off\n")
+        sys.stdout.write("Power Restore Policy : always-off\n")
+    elif words[:1] == ["sleep"]:
+        time.sleep(float(words[1]))
+    else:
+        sys.stderr.write("Invalid command: %s\n" % " ".join(words))
+    sys.stdout.flush()
+    prompt()
+'''
+
+
+class IpmitoolShellPoolTest(unittest.TestCase):
+    """ Tests involving the pool of ipmitool shells """
+
+    def setUp(self):
+        self.pool = IpmitoolShellPool(size=1, idle_timeout=60, timeout=5)
+        self.args = [sys.executable, "-c", FAKE_SHELL, "-H", "10.0.0.1"]
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_execute(self):
+        """ Test that commands share one shell """
+        for _ in range(3):
+            self.assertEqual(
+                self.pool.execute(self.args, ["power", "status"]),
+                (True, "Chassis Power is off")
+            )
+        self.assertEqual(self.pool.spawned, 1)
+
+        success, output = self.pool.execute(self.args, ["bogus"])
+        self.assertFalse(success)
+        self.assertEqual(output, "Invalid command: bogus")
+
+        # Different connection arguments get their own shell
+        self.pool.execute(self.args[:-1] + ["10.0.0.2"], ["power", "status"])
+        self.assertEqual(self.pool.spawned, 2)
+
+    def test_size(self):
+        """ Test that concurrent commands wait for a shell instead of
+        starting more than 'size' of them """
+        results = []
+
+        def run():
+            """ Run a slow command """
+            results.append(self.pool.execute(self.args, ["sleep", "0.2"]))
+
+        threads = [Thread(target=run) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [(True, "")] * 3)
+        self.assertEqual(self.pool.spawned, 1)
+
+    def test_respawn(self):
+        """ Test that dead and idle shells are replaced """
+        self.pool.execute(self.args, ["power", "status"])
+        shell = self.pool._idle[tuple(self.args)][0]
+        shell.process.kill()
+        shell.process.wait()
+        self.assertEqual(self.pool.execute(self.args, ["power", "status"]),
+                (True, "Chassis Power is off"))
+        self.assertEqual(self.pool.spawned, 2)
+
+        self.pool.idle_timeout = 0.1
+        time.sleep(0.2)
+        self.pool.execute(self.args, ["power", "status"])
+        self.assertEqual(self.pool.spawned, 3)
+
+        # A command that couldn't be written is sent to a new shell
+        shell = self.pool._idle[tuple(self.args)][0]
+        stdin = shell.process.stdin
+        shell.process.stdin = Mock()
+        shell.process.stdin.write.side_effect = IOError(32, "Broken pipe")
+        stdin.close()
+        self.assertEqual(self.pool.execute(self.args, ["power", "status"]),
+                (True, "Chassis Power is off"))
+        self.assertEqual(self.pool.spawned, 4)
+
+    def test_timeout(self):
+        """ Test that a hung shell is abandoned, and the command isn't sent
+        again """
+        self.pool.timeout = 0.2
+        self.assertRaises(IpmiError, self.pool.execute, self.args,
+                ["sleep", "1"])
+        self.assertEqual(self.pool.spawned, 1)
+
+    def test_pooled_tool(self):
+        """ Test sending pyipmi commands through the pool """
+        work_dir = tempfile.mkdtemp(prefix="cxmanage_ipmishell_test-")
+        old_path = os.environ.get("IPMITOOL_PATH")
+        try:
+            ipmitool = os.path.join(work_dir, "ipmitool")
+            with open(ipmitool, "w") as script:
+                script.write("#!%s\n%s" % (sys.executable, FAKE_SHELL))
+            os.chmod(ipmitool, 0755)
+            os.environ["IPMITOOL_PATH"] = ipmitool
+
+            bmc = make_bmc(LanBMC, hostname="10.0.0.1", username="admin",
+                    password="admin", verbose=False,
+                    tool_class=pooled_tool_class(self.pool))
+            for _ in range(2):
+                self.assertFalse(bmc.get_chassis_status().power_on)
+
+            node = Node("10.0.0.1", ipmitool_pool=self.pool)
+            self.assertEqual(node.ipmitool_command(["power", "status"]),
+                    "Chassis Power is off")
+            self.assertRaises(IpmiError, node.ipmitool_command, ["bogus"])
+            # One shell for pyipmi, one for raw commands (pyipmi orders the
+            # connection arguments differently)
+            self.assertEqual(self.pool.spawned, 2)
+        finally:
+            if old_path is None:
+                del os.environ["IPMITOOL_PATH"]
+            else:
+                os.environ["IPMITOOL_PATH"] = old_path
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class IsErrorTest(unittest.TestCase):
+    """ Tests of spotting errors in ipmitool output """
+
+    def test_errors(self):
+        """ Test that ipmitool's error messages are recognized """
+        for output in [
+            "Error: Unable to establish IPMI v2 / RMCP+ session",
+            "Unable to get Chassis Power Status",
+            "Invalid command: bogus",
+            "Invalid chassis command: bogus",
+            "Could not open device at /dev/ipmi0 or /dev/ipmi/0 or "
+                "/dev/ipmidev/0: No such file or directory",
+            "Insufficient privilege level",
+            "Get Device ID command failed: 0xc1 Invalid command",
+            "Close Session command failed: Invalid Session ID in request",
+            "Set Chassis Power Control to Cycle failed: Command not "
+                "supported in present state",
+            "Set Session Privilege Level to ADMINISTRATOR failed",
+            "\nError: Unable to establish LAN session\nmore output",
+        ]:
+            self.assertTrue(is_error(output), output)
+
+    def test_success(self):
+        """ Test that normal output isn't mistaken for an error """
+        for output in [
+            "",
+            "Chassis Power is off",
+            "Chassis Power Control: Up/On",
+            "System Power         : off\nPower Restore Policy : always-off",
+            "SEL has no entries",
+            "   1 | 01/01/2014 | 00:00:00 | Power Supply #0x51 | "
+                "Failure detected | Asserted",
+            "Device ID                 : 0\nFirmware Revision         : "
+                "1.0\nError: later lines are not checked",
+        ]:
+            self.assertFalse(is_error(output), output)
@@ -32,17 +32,47 @@
 
 """Unit tests for the Node class."""
 
+import os
+import sys
 import shutil
 import tempfile
 import unittest
-from mock import call
+from threading import Event
+from mock import Mock, call, patch
+
+from pyipmi import IpmiError
 
 from cxmanage_api.tests import DummyBMC, DummyUbootEnv, DummyIPRetriever
 from cxmanage_api.tests import TestImage, random_file
 from cxmanage_api.node import Node
+from cxmanage_api.ipmibatch import IpmiBatch
+from cxmanage_api.transport import TransportCache
+from cxmanage_api.wait import WaitSchedule
+from cxmanage_api.tasks import InflightLimiter
+from cxmanage_api.sdrcache import SdrCache
+from cxmanage_api.cx_exceptions import CircuitOpenError, NoSensorError, \
+        TimeoutError
 from cxmanage_api.firmware_package import FirmwarePackage
 
 
+# A stand-in for ipmitool's "sdr dump" and "sensor reading" commands
+FAKE_SDR_IPMITOOL = r'''
+import os, sys
+with open(os.environ["FAKE_IPMITOOL_LOG"], "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\n")
+args = sys.argv[7:]
+if os.environ.get("FAKE_IPMITOOL_FAIL"):
+    sys.exit(1)
+elif args[:2] == ["sdr", "dump"]:
+    open(args[2], "w").write("SDR")
+elif args[2:4] == ["sensor", "reading"] and os.path.exists(args[1]):
+    for name in args[4:]:
+        print "%s | 40.5" % name
+else:
+    sys.exit(1)
+'''
+
+
 class NodeTest(unittest.TestCase):
     """ Tests involving cxmanage Nodes """
 
@@ -51,7 +81,8 @@ class NodeTest(unittest.TestCase):
             Node(
                 ip_address=ip, tftp=DummyBMC.tftp, bmc=DummyBMC,
                 image=TestImage, ubootenv=DummyUbootEnv,
-                ipretriever=DummyIPRetriever, verbose=True
+                ipretriever=DummyIPRetriever, verbose=True,
+                transport_cache=TransportCache()
             ) for ip in DummyBMC.ip_addresses
         ]
 
@@ -87,6 +118,52 @@ class NodeTest(unittest.TestCase):
                 [call.set_chassis_power(mode=x) for x in modes]
             )
 
+    def test_set_power_wait(self):
+        """ Test node.set_power method with wait=True """
+        for node in self.nodes:
+            node.set_power("off", wait=True)
+            self.assertEqual(node.wait_stats["set_power"].attempts, 1)
+
+    def test_mc_reset(self):
+        """ Test node.mc_reset method """
+        for node in self.nodes:
+            node.wait_schedule = WaitSchedule(initial=0.01, maximum=0.01)
+            node.bmc.get_info_basic.side_effect = [
+                node.bmc.get_info_basic(), IpmiError(), IpmiError(),
+                node.bmc.get_info_basic()
+            ]
+            node.bmc.reset_mock()
+
+            node.mc_reset(wait=True)
+
+            self.assertEqual(node.bmc.method_calls[0], call.mc_reset("cold"))
+            self.assertEqual(node.bmc.get_info_basic.call_count, 4)
+            self.assertEqual(node.wait_stats["mc_reset_down"].attempts, 2)
+            self.assertEqual(node.wait_stats["mc_reset_up"].attempts, 2)
+
+            # Reads after a reset don't use the cached snapshot
+            node.bmc.get_info_basic.side_effect = None
+            node.get_versions()
+            node.bmc.reset_mock()
+            node.mc_reset()
+            node.get_versions()
+            self.assertEqual(node.bmc.get_info_basic.call_count, 1)
+            self.assertEqual(node.bmc.get_firmware_info.call_count, 1)
+
+            # A node that never goes down hasn't reset
+            node.mc_reset_down_timeout = 0.1
+            self.assertRaises(TimeoutError, node.mc_reset, wait=True)
+
+    def test_circuit_breaker(self):
+        """ Test that a failing node trips its circuit breaker """
+        for node in self.nodes:
+            node.bmc.get_chassis_status.side_effect = IpmiError()
+            for _ in xrange(node.breaker.threshold):
+                self.assertRaises(IpmiError, node.get_power)
+            self.assertRaises(CircuitOpenError, node.get_power_policy)
+            self.assertEqual(node.bmc.get_chassis_status.call_count,
+                    node.breaker.threshold)
+
     def test_get_power_policy(self):
         """ Test node.get_power_policy method """
         for node in self.nodes:
@@ -122,6 +199,60 @@ class NodeTest(unittest.TestCase):
                 result["Board Temp"].sensor_reading.endswith("degrees C")
             )
 
+    def test_get_sensors_cached(self):
+        """ Test that cached SDRs let node.get_sensors read fewer sensors """
+        log = os.path.join(self.work_dir, "ipmitool.log")
+        ipmitool = os.path.join(self.work_dir, "ipmitool")
+        with open(ipmitool, "w") as script:
+            script.write("#!%s\n%s" % (sys.executable, FAKE_SDR_IPMITOOL))
+        os.chmod(ipmitool, 0755)
+        old_environ = dict(os.environ)
+        os.environ.update(IPMITOOL_PATH=ipmitool, FAKE_IPMITOOL_LOG=log)
+        try:
+            cache = SdrCache(directory=os.path.join(self.work_dir, "sdr"))
+            node = self.nodes[0]
+            node.sdr_cache = cache
+            node.get_sensors()
+            self.assertEqual(node.bmc.sdr_list.call_count, 1)
+
+            # The cache is kept per hardware and firmware version, and
+            # persisted
+            key = node._sdr_cache_key()
+            self.assertEqual(key, "TestBoard X00 ECX-0000-v0.0.0")
+            node = Node(ip_address=node.ip_address, bmc=DummyBMC,
+                        sdr_cache=SdrCache(directory=cache.directory))
+            result = node.get_sensors("temp")
+            self.assertEqual(result.keys(), ["Board Temp"])
+            self.assertEqual(result["Board Temp"].sensor_reading,
+                             "40.5 (+/- 0) degrees C")
+            self.assertEqual(node.bmc.sdr_list.call_count, 0)
+            self.assertEqual(
+                [x.split()[6:] for x in open(log)][-1],
+                ["-S", cache.dump_path(key), "sensor",
+                 "reading", "Board", "Temp"]
+            )
+
+            # A failed read drops the entry and falls back to sdr_list
+            self.assertRaises(NoSensorError, node.get_sensors, "bogus")
+            os.environ["FAKE_IPMITOOL_FAIL"] = "1"
+            self.assertEqual(len(node.get_sensors()), 2)
+            self.assertEqual(node.bmc.sdr_list.call_count, 1)
+            self.assertIsNone(cache.get(key))
+
+            # Another board with the same firmware gets its own entry
+            del os.environ["FAKE_IPMITOOL_FAIL"]
+            node.get_sensors()
+            node = Node(ip_address=node.ip_address, bmc=DummyBMC,
+                        sdr_cache=cache)
+            node.hardware_version = "OtherBoard X01"
+            node.get_sensors()
+            self.assertEqual(node.bmc.sdr_list.call_count, 1)
+            self.assertIsNotNone(cache.get(key))
+            self.assertIsNotNone(cache.get(node._sdr_cache_key()))
+        finally:
+            os.environ.clear()
+            os.environ.update(old_environ)
+
     def test_is_updatable(self):
         """ Test node.is_updatable method """
         for node in self.nodes:
@@ -318,12 +449,30 @@ class NodeTest(unittest.TestCase):
 
             self.assertEqual(result, "eth0")
 
+    def test_edit_ubootenv(self):
+        """ Test node.edit_ubootenv method """
+        for node in self.nodes:
+            with node.edit_ubootenv() as ubootenv:
+                ubootenv.set_boot_order(["disk", "pxe"])
+                ubootenv.set_pxe_interface("eth0")
+
+            # One download and one upload for both changes
+            ubootenv_partition = node.bmc.partitions[5]
+            self.assertEqual(ubootenv_partition.retrieves, 1)
+            self.assertEqual(ubootenv_partition.updates, 1)
+
+            # Reads after the write download the new environment once
+            node.get_boot_order()
+            node.get_pxe_interface()
+            self.assertEqual(ubootenv_partition.retrieves, 2)
+
     def test_get_versions(self):
         """ Test node.get_versions method """
         for node in self.nodes:
             result = node.get_versions()
 
-            self.assertEqual(node.bmc.method_calls, [
+            # Sub-queries run concurrently, so their order varies
+            self.assertItemsEqual(node.bmc.method_calls, [
                 call.get_info_basic(),
                 call.get_firmware_info(),
                 call.get_info_card(),
@@ -333,6 +482,81 @@ class NodeTest(unittest.TestCase):
                     "ecme_timestamp"]:
                 self.assertTrue(hasattr(result, attr))
 
+    def test_get_versions_batched(self):
+        """ Test that get_versions only pipelines what the batch didn't
+        answer """
+        node = self.nodes[0]
+        node.pipeline = Mock(wraps=node.pipeline)
+        answered = ["get_info_basic", "get_firmware_info"]
+        with patch.object(IpmiBatch, "answered",
+                lambda self, method: method in answered):
+            result = node.get_versions()
+        self.assertEqual(node.pipeline.call_args,
+                call(node._get_hardware_version, node._get_pmic_version))
+        self.assertEqual(result.hardware_version, node.hardware_version)
+        self.assertItemsEqual(node.bmc.method_calls, [
+            call.get_info_basic(),
+            call.get_firmware_info(),
+            call.get_info_card(),
+            call.pmic_get_version()
+        ])
+
+        # Cached reads aren't pipelined (or batched) either
+        node.pipeline.reset_mock()
+        node.get_versions()
+        self.assertEqual(node.pipeline.call_args,
+                call(node._get_pmic_version))
+
+    def test_pipeline(self):
+        """ Test node.pipeline method """
+        node = self.nodes[0]
+        node.inflight_limiter = InflightLimiter(limit=2)
+        first, second = Event(), Event()
+
+        def meet(mine, other):
+            """ Only returns True if the other call runs concurrently """
+            mine.set()
+            return other.wait(5)
+
+        results = node.pipeline(
+            (meet, first, second), (meet, second, first),
+            node.get_sensors_dict, node.get_firmware_info_dict
+        )
+        self.assertEqual(results[:2], [True, True])
+        self.assertEqual(set(results[2]), set(node.get_sensors_dict()))
+        self.assertEqual(len(results[3]), len(node.bmc.partitions))
+
+        # Nested pipelines run inline instead of waiting on slots
+        self.assertEqual(node.pipeline((node.pipeline, (len, "ab"))), [[2]])
+
+        def fail():
+            """ A failing sub-query """
+            raise IpmiError("fail")
+        self.assertRaises(IpmiError, node.pipeline, fail, node.get_power)
+
+    def test_snapshot(self):
+        """ Test node.snapshot method """
+        for node in self.nodes:
+            node.get_versions()
+            node.get_firmware_info()
+            result = node.snapshot()
+
+            self.assertEqual(node.bmc.get_info_basic.call_count, 1)
+            self.assertEqual(node.bmc.get_firmware_info.call_count, 1)
+            self.assertEqual(len(result["fwinfo"]), len(node.bmc.partitions))
+            self.assertEqual(result["info_basic"].firmware_version,
+                    "ECX-0000-v0.0.0")
+
+            # Callers get copies, not the cached objects
+            result["fwinfo"][0].version = "changed"
+            self.assertNotEqual(node.get_firmware_info()[0].version,
+                    "changed")
+
+            # Config reset changes partitions, so the cache is dropped
+            node.config_reset()
+            node.snapshot()
+            self.assertEqual(node.bmc.get_info_basic.call_count, 2)
+
     def test_get_fabric_ipinfo(self):
         """ Test node.get_fabric_ipinfo method """
         for node in self.nodes:
@@ -343,6 +567,35 @@ class NodeTest(unittest.TestCase):
             self.assertEqual(result, dict([(i, DummyBMC.ip_addresses[i])
                     for i in range(len(DummyBMC.ip_addresses))]))
 
+    def test_probe_tftp(self):
+        """ Test node.probe_tftp method """
+        for node in self.nodes:
+            result = node.probe_tftp()
+
+            self.assertTrue(node.bmc.fabric_config_get_ip_info.called)
+            self.assertEqual(result["ecme"], None)
+            self.assertTrue(result["host"] >= 0)
+
+            # Cached result is reused
+            calls = node.bmc.fabric_config_get_ip_info.call_count
+            self.assertEqual(node.probe_tftp(), result)
+            self.assertEqual(node.bmc.fabric_config_get_ip_info.call_count,
+                    calls)
+
+    def test_transport_cache(self):
+        """ Test that nodes remember which TFTP path works """
+        for node in self.nodes:
+            node.get_fabric_ipinfo()
+            self.assertEqual(node.transport_cache.get(node.ip_address),
+                    "host")
+
+            # Second transfer goes straight to the host TFTP server
+            node.bmc.fabric_config_get_ip_info.reset_mock()
+            node.get_fabric_ipinfo()
+            calls = node.bmc.fabric_config_get_ip_info.call_args_list
+            self.assertEqual(len(calls), 1)
+            self.assertTrue("tftp_addr" in calls[0][1])
+
     def test_get_fabric_macaddrs(self):
         """ Test node.get_fabric_macaddrs method """
         for node in self.nodes:
@@ -360,8 +613,11 @@ class NodeTest(unittest.TestCase):
     def test_get_fabric_uplink_info(self):
         """ Test node.get_fabric_uplink_info method """
         for node in self.nodes:
-            node.get_fabric_uplink_info()
+            result = node.get_fabric_uplink_info()
             self.assertTrue(node.bmc.fabric_config_get_uplink_info.called)
+            self.assertEqual(sorted(result.keys()),
+                    range(len(node.bmc.ip_addresses)))
+            self.assertEqual(result[0], {'eth0': 0, 'eth1': 0, 'mgmt': 0})
 
     def test_get_uplink_info(self):
         """ Test node.get_uplink_info method """
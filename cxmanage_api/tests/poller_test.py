@@ -0,0 +1,122 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: poller_test.py"""
+
+import time
+import unittest
+
+from pyipmi import IpmiError
+
+from cxmanage_api.fabric import Fabric
+from cxmanage_api.poller import SensorPoller, RingBuffer, parse_reading, \
+        nearest_rank
+from cxmanage_api.tests import DummyNode
+
+
+class SensorPollerTest(unittest.TestCase):
+    """ Tests involving the fabric sensor poller """
+
+    def setUp(self):
+        self.fabric = Fabric(DummyNode.ip_addresses[0], node=DummyNode)
+        self.nodes = [DummyNode(i) for i in DummyNode.ip_addresses]
+        self.fabric._nodes = dict((i, self.nodes[i])
+                for i in xrange(len(self.nodes)))
+        self.poller = SensorPoller(self.fabric, sensors=["Power"],
+                                   interval=0.05, size=4)
+
+    def tearDown(self):
+        self.poller.stop()
+
+    def test_parse_reading(self):
+        """ Test parsing sensor readings """
+        self.assertEqual(parse_reading("1.200 (+/- 0) Amps"), (1.2, "Amps"))
+        self.assertEqual(parse_reading("-3.5 degrees C"), (-3.5, "degrees C"))
+        self.assertEqual(parse_reading("42"), (42.0, ""))
+        self.assertEqual(parse_reading("No Reading"), (None, ""))
+        self.assertEqual(parse_reading(None), (None, ""))
+
+    def test_nearest_rank(self):
+        """ Test nearest-rank percentiles """
+        values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 100]
+        self.assertEqual([nearest_rank(values, p) for p in [0, 10, 50, 90,
+                91, 100]], [1, 1, 5, 9, 100, 100])
+        self.assertEqual(nearest_rank([], 50), None)
+
+    def test_ring_buffer(self):
+        """ Test that ring buffers keep only the newest samples """
+        ring = RingBuffer(3)
+        self.assertEqual(ring.latest(), None)
+        for i in range(5):
+            ring.append(i, i * 10)
+        self.assertEqual(ring.latest(), (4, 40))
+        self.assertEqual(ring.samples(), [(2, 20), (3, 30), (4, 40)])
+        self.assertEqual(ring.samples(since=3), [(3, 30), (4, 40)])
+
+    def test_poll(self):
+        """ Test polling and querying """
+        self.nodes[1].get_sensors.side_effect = IpmiError("fail")
+        for _ in range(6):
+            self.assertEqual(self.poller.poll(), len(self.nodes) - 1)
+        self.assertEqual(self.poller.polls, 6)
+        self.assertEqual(self.poller.errors.keys(), [1])
+        self.assertEqual(self.poller.units, {"Node Power": "Watts"})
+
+        # Only the selected sensors are polled, and only size samples kept
+        self.assertEqual(self.poller.latest(0, "Board Temp"), None)
+        self.assertEqual(self.poller.latest(1, "Node Power"), None)
+        self.assertEqual(len(self.poller.series(0, "Node Power")), 4)
+        self.assertEqual(self.poller.series(0, "Node Power")[-1],
+                         self.poller.latest(0, "Node Power"))
+
+        summary = self.poller.summary("Node Power")
+        self.assertEqual(summary["count"], 4 * (len(self.nodes) - 1))
+        self.assertTrue(0 <= summary["min"] <= summary["mean"] <=
+                        summary["max"] <= 10)
+        self.assertEqual(self.poller.percentile("Node Power", 0),
+                         summary["min"])
+        self.assertEqual(self.poller.percentile("Node Power", 100),
+                         summary["max"])
+        self.assertEqual(self.poller.summary("Node Power", node_ids=[0],
+                                             window=60)["count"], 4)
+        self.assertEqual(self.poller.summary("Bogus")["count"], 0)
+        self.assertEqual(self.poller.percentile("Bogus", 50), None)
+
+    def test_start(self):
+        """ Test polling in the background """
+        self.poller.start()
+        time.sleep(0.3)
+        self.poller.stop()
+        polls = self.poller.polls
+        self.assertTrue(polls >= 2)
+        time.sleep(0.1)
+        self.assertEqual(self.poller.polls, polls)
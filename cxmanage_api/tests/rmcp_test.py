@@ -0,0 +1,76 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: rmcp_test.py"""
+
+import time
+import unittest
+
+from cxmanage_api.rmcp import RmcpPinger, build_ping, build_pong, \
+        parse_message, ASF_PRESENCE_PING, ASF_PRESENCE_PONG
+from cxmanage_api.tests import DummyRmcpResponder
+
+
+class RmcpTest(unittest.TestCase):
+    """ Tests involving RMCP presence pings """
+
+    def setUp(self):
+        self.responder = DummyRmcpResponder()
+        self.pinger = RmcpPinger(port=self.responder.port, timeout=0.2)
+
+    def tearDown(self):
+        self.responder.stop()
+
+    def test_messages(self):
+        """ Test building and parsing ping/pong packets """
+        self.assertEqual(parse_message(build_ping(7)), (ASF_PRESENCE_PING, 7))
+        self.assertEqual(parse_message(build_pong(7)), (ASF_PRESENCE_PONG, 7))
+        self.assertEqual(parse_message("garbage"), None)
+        self.assertEqual(parse_message("\x06\x00\xff\x07" + "\x00" * 12),
+                None)
+
+    def test_sweep(self):
+        """ Test that live hosts report a latency and dead ones None """
+        start = time.time()
+        results = self.pinger.sweep(["127.0.0.1", "127.0.0.2"])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(set(results), set(["127.0.0.1", "127.0.0.2"]))
+        self.assertIsNotNone(results["127.0.0.1"])
+        self.assertIsNone(results["127.0.0.2"])
+        self.assertEqual(self.responder.pings, 1)
+
+    def test_iter_alive(self):
+        """ Test lazily sweeping a generator of hosts """
+        self.pinger.window = 2
+        hosts = ("127.0.0.%i" % i for i in range(1, 6))
+        alive = list(self.pinger.iter_alive(hosts))
+        self.assertEqual([host for host, _ in alive], ["127.0.0.1"])
@@ -0,0 +1,171 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: rmcpplus_test.py"""
+
+import unittest
+
+from pyipmi import make_bmc, IpmiError
+
+from cxmanage_api.rmcpplus import AES, NativeBMC, RmcpPlusSession, \
+        RmcpPlusTransport, build_ipmi_message, parse_ipmi_message, \
+        build_session_packet, parse_session_packet, console_session_id, \
+        PAYLOAD_IPMI, PAYLOAD_RAKP2
+from cxmanage_api.tests import DummyRmcpPlusBMC
+from cxmanage_api.tests.dummy_rmcpplus import GUID
+
+
+class RmcpPlusTest(unittest.TestCase):
+    """ Tests involving the native RMCP+ transport """
+
+    def setUp(self):
+        self.bmc = DummyRmcpPlusBMC()
+        self.transport = RmcpPlusTransport()
+
+    def tearDown(self):
+        self.bmc.stop()
+
+    def session(self, **kwargs):
+        """ Make a session with the dummy BMC """
+        kwargs.setdefault("cipher_suite", 2)
+        kwargs.setdefault("timeout", 0.2)
+        return RmcpPlusSession("127.0.0.1", "admin", "admin",
+                               port=self.bmc.port, transport=self.transport,
+                               **kwargs)
+
+    def test_messages(self):
+        """ Test building and parsing IPMI messages and session packets """
+        message = build_ipmi_message(0x06, 0x37, 5, "\x01")
+        self.assertEqual(parse_ipmi_message(message), (0x06, 0x37, 5, "\x01"))
+        response = build_ipmi_message(0x06, 0x37, 5, "\x00", response=True)
+        self.assertEqual(parse_ipmi_message(response),
+                         (0x07, 0x37, 5, "\x00"))
+        self.assertIsNone(parse_ipmi_message(message[:-1] + "\x00"))
+
+        packet = build_session_packet(PAYLOAD_IPMI, 9, 1, message, "k" * 20)
+        self.assertEqual(len(packet[4:]) % 4, 0)
+        self.assertEqual(parse_session_packet(packet, "k" * 20)[1:],
+                         (9, 1, message))
+        self.assertIsNone(parse_session_packet(packet, "x" * 20))
+        self.assertIsNone(parse_session_packet(packet))
+        self.assertIsNone(parse_session_packet(packet[:-1] + "\x00",
+                                               "k" * 20))
+        self.assertEqual(console_session_id(packet), 9)
+
+        packet = build_session_packet(PAYLOAD_RAKP2, 0, 0,
+                                      "\x01\x00\x00\x00\x2a\x00\x00\x00")
+        self.assertEqual(console_session_id(packet), 42)
+
+    def test_session(self):
+        """ Test opening a session and sending requests """
+        for cipher_suite in [1, 2]:
+            session = self.session(cipher_suite=cipher_suite)
+            self.assertFalse(session.is_open)
+            self.assertEqual(len(session.request(0x06, 0x37)), 16)
+            self.assertTrue(session.is_open)
+            session.request(0x00, 0x01)
+            session.close()
+            self.assertFalse(session.is_open)
+        self.assertEqual(self.bmc.opened, 2)
+        self.assertEqual(self.bmc.sessions, {})
+
+    @unittest.skipIf(AES is None, "pycrypto is not installed")
+    def test_encrypted_session(self):
+        """ Test a session with AES-CBC-128 confidentiality """
+        session = self.session(cipher_suite=3)
+        self.assertEqual(len(session.request(0x06, 0x37)), 16)
+
+    def test_errors(self):
+        """ Test bad credentials, completion codes and timeouts """
+        session = RmcpPlusSession("127.0.0.1", "admin", "wrong",
+                                  port=self.bmc.port, cipher_suite=2,
+                                  timeout=0.2, transport=self.transport)
+        self.assertRaises(IpmiError, session.request, 0x06, 0x37)
+        self.assertFalse(session.is_open)
+
+        session = self.session()
+        self.assertRaises(IpmiError, session.request, 0x06, 0x99)
+        self.assertTrue(session.is_open)
+
+        self.bmc.drop = 1
+        self.assertEqual(len(session.request(0x06, 0x37)), 16)
+
+        self.bmc.drop = 100
+        session = self.session(timeout=0.05, retries=1)
+        self.assertRaises(IpmiError, session.request, 0x06, 0x37)
+        self.assertEqual(self.bmc.drop, 98)
+
+    def test_shared_transport(self):
+        """ Test that sessions with several BMCs share one socket """
+        other = DummyRmcpPlusBMC()
+        try:
+            sessions = [self.session(), self.session(),
+                        RmcpPlusSession("127.0.0.1", "admin", "admin",
+                                        port=other.port, cipher_suite=2,
+                                        transport=self.transport)]
+            for session in sessions:
+                session.request(0x06, 0x37)
+            self.assertEqual(self.bmc.opened, 2)
+            self.assertEqual(other.opened, 1)
+            self.assertEqual(len(self.transport._queues), 3)
+            for session in sessions:
+                session.close()
+            self.assertEqual(self.transport._queues, {})
+        finally:
+            other.stop()
+
+    def test_native_bmc(self):
+        """ Test the BMC commands that go over RMCP+ """
+        bmc = make_bmc(NativeBMC, hostname="127.0.0.1", username="admin",
+                       password="admin", port=self.bmc.port,
+                       cipher_suite=2, transport=self.transport,
+                       verbose=False)
+        self.assertEqual(bmc.guid().system_guid, GUID)
+        self.assertEqual(bmc.info().firmware_revision, "1.02")
+
+        self.assertFalse(bmc.get_chassis_status().power_on)
+        bmc.set_chassis_power(mode="on")
+        self.assertTrue(bmc.get_chassis_status().power_on)
+        bmc.set_chassis_power(mode="off")
+        self.assertFalse(bmc.get_chassis_status().power_on)
+        self.assertRaises(IpmiError, bmc.set_chassis_power, mode="bogus")
+
+        bmc.set_chassis_policy("always-on")
+        self.assertEqual(bmc.get_chassis_status().power_restore_policy,
+                         "always-on")
+
+        bmc.mc_reset("cold")
+        self.assertEqual(self.bmc.resets, 1)
+        self.assertFalse(bmc.session.is_open)
+        self.assertEqual(bmc.guid().system_guid, GUID)
+        self.assertEqual(self.bmc.opened, 2)
+        bmc.close()
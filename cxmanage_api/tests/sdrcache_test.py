@@ -0,0 +1,95 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: sdrcache_test.py"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cxmanage_api.sdrcache import SdrCache, parse_sensor_readings
+from cxmanage_api.tests import TestSensor
+
+
+KEY = "ECX-1000-v2.1.5"
+SENSORS = [TestSensor("Node Power", "8.5 (+/- 0) Watts"),
+           TestSensor("Board Temp", "42.5 (+/- 0) degrees C")]
+
+
+class SdrCacheTest(unittest.TestCase):
+    """ Tests involving the SDR cache """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="cxmanage_sdrcache_test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def dump(self, cache):
+        """ Put a dump in place, the way a node would """
+        filename = cache.temp_dump_path(KEY)
+        open(filename, "w").write("SDR")
+        cache.commit_dump(KEY, filename)
+
+    def test_record(self):
+        """ Test that entries need a dump, and can be invalidated """
+        cache = SdrCache()
+        cache.record(KEY, SENSORS)
+        self.assertIsNone(cache.get(KEY))
+        self.dump(cache)
+        self.assertEqual([vars(x) for x in cache.get(KEY)],
+                         [vars(x) for x in SENSORS])
+
+        cache.invalidate(KEY)
+        self.assertIsNone(cache.get(KEY))
+        self.assertFalse(os.path.exists(cache.dump_path(KEY)))
+
+    def test_persist(self):
+        """ Test that entries survive in a directory """
+        directory = os.path.join(self.work_dir, "sdr")
+        cache = SdrCache(directory=directory)
+        self.dump(cache)
+        cache.record(KEY, SENSORS)
+
+        cache = SdrCache(directory=directory)
+        self.assertEqual([x.sensor_name for x in cache.get(KEY)],
+                         ["Node Power", "Board Temp"])
+        self.assertEqual(os.path.dirname(cache.dump_path("a/b c")), directory)
+        self.assertIsNone(cache.get("ECX-2000-v2.1.5"))
+
+    def test_parse_sensor_readings(self):
+        """ Test parsing "ipmitool sensor reading" output """
+        self.assertEqual(
+            parse_sensor_readings("Node Power | 8.5\nBoard Temp |\n\n"),
+            {"Node Power": "8.5", "Board Temp": None}
+        )
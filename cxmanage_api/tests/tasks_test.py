@@ -35,8 +35,10 @@
 
 import unittest
 import time
+from threading import Lock
 
-from cxmanage_api.tasks import TaskQueue
+from cxmanage_api.tasks import TaskQueue, HedgePolicy, InflightLimiter, \
+        failed_task
 
 
 class TaskTest(unittest.TestCase):
@@ -70,6 +72,73 @@ class TaskTest(unittest.TestCase):
         self.assertGreaterEqual(finish - start, 2.0)
 
 
+    def test_join_timeout(self):
+        """ Test that join gives up after a timeout """
+        task_queue = TaskQueue()
+        task = task_queue.put(time.sleep, 0.5)
+        self.assertFalse(task.join(0.05))
+        self.assertTrue(task.join())
+
+    def test_failed_task(self):
+        """ Test building a task that has already failed """
+        error = ValueError("never started")
+        task = failed_task(error)
+        self.assertFalse(task.is_alive())
+        self.assertTrue(task.join(0))
+        self.assertEqual(task.status, "Failed")
+        self.assertEqual(task.error, error)
+
+    def test_hedge_policy(self):
+        """ Test that slow calls get hedged """
+        policy = HedgePolicy(min_samples=4, min_delay=0.01)
+        for _ in xrange(4):
+            policy.record(0.01, "slow_read")
+            policy.record(5.0, "slower_read")
+        self.assertAlmostEqual(policy.delay("slow_read"), 0.01)
+        self.assertAlmostEqual(policy.delay("slower_read"), 5.0)
+        self.assertEqual(policy.delay("other_read"), None)
+
+        # First call hangs, the hedged call answers quickly
+        delays = [2.0, 0.0]
+
+        def slow_read():
+            """ Sleep for the next delay """
+            time.sleep(delays.pop(0))
+            return "result"
+
+        start = time.time()
+        self.assertEqual(policy.call(slow_read), "result")
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(policy.hedges, 1)
+
+    def test_inflight_limiter(self):
+        """ Test that the limiter caps concurrent calls per key """
+        limiter = InflightLimiter(limit=2)
+        lock = Lock()
+        inflight = {"a": 0, "b": 0}
+        peaks = {"a": 0, "b": 0}
+
+        def request(key):
+            """ Hold a slot for a moment, tracking how many are held """
+            with limiter.slot(key):
+                # Nested slots for the same key are free
+                with limiter.slot(key):
+                    with lock:
+                        inflight[key] += 1
+                        peaks[key] = max(peaks[key], inflight[key])
+                    time.sleep(0.05)
+                    with lock:
+                        inflight[key] -= 1
+
+        task_queue = TaskQueue()
+        tasks = [task_queue.put(request, key) for key in "ab" * 6]
+        for task in tasks:
+            task.join()
+            self.assertEqual(task.status, "Completed")
+        self.assertEqual(peaks, {"a": 2, "b": 2})
+        self.assertFalse(limiter.holds("a"))
+
+
 class Counter(object):
     """ Simple counter object for testing purposes """
     def __init__(self):
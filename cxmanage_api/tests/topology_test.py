@@ -0,0 +1,141 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: topology_test.py"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cxmanage_api.topology import TopologyCache, DEFAULT_TTL, node_slot
+
+
+NODES = {0: ("10.0.0.1", "GUID0"), 1: ("10.0.0.2", None)}
+MACS = {0: {0: ["00:00:00:00:00:00"]}, 1: {0: ["00:00:00:00:01:00"]}}
+
+
+class TopologyCacheTest(unittest.TestCase):
+    """ Tests involving the fabric topology cache """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="cxmanage_topology_test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_node_slot(self):
+        """ Test mapping node IDs to slots """
+        self.assertEqual([node_slot(x) for x in range(9)],
+                [0, 0, 0, 0, 1, 1, 1, 1, 2])
+
+    def test_record(self):
+        """ Test recording, validating and invalidating a fabric """
+        cache = TopologyCache()
+        self.assertEqual(cache.guid("10.0.0.1"), None)
+
+        cache.record("10.0.0.1", "GUID0", NODES)
+        self.assertEqual(cache.guid("10.0.0.1"), "GUID0")
+        self.assertEqual(cache.get("10.0.0.1", "GUID0"), NODES)
+
+        cache.invalidate("10.0.0.1")
+        self.assertEqual(cache.get("10.0.0.1", "GUID0"), None)
+
+    def test_fabric_of(self):
+        """ Test finding the fabric an address belongs to """
+        cache = TopologyCache()
+        cache.record("10.0.0.1", "GUID0", NODES)
+        self.assertEqual(cache.fabric_of("10.0.0.1"), "10.0.0.1")
+        self.assertEqual(cache.fabric_of("10.0.0.2"), "10.0.0.1")
+        self.assertEqual(cache.fabric_of("10.0.0.3"), None)
+
+    def test_details(self):
+        """ Test caching MAC addresses and hardware versions """
+        cache = TopologyCache()
+        cache.record_macs("10.0.0.1", MACS)
+        self.assertEqual(cache.macs("10.0.0.1"), {})
+
+        cache.record("10.0.0.1", "GUID0", NODES)
+        cache.record_macs("10.0.0.1", MACS)
+        cache.record_hardware_versions("10.0.0.1", {0: "TestBoard X00"})
+        self.assertEqual(cache.macs("10.0.0.1"), MACS)
+        self.assertEqual(cache.hardware_versions("10.0.0.1"),
+                {0: "TestBoard X00"})
+
+        # Kept for nodes that didn't move
+        cache.record("10.0.0.1", "GUID0",
+                {0: ("10.0.0.1", "GUID0"), 1: ("10.0.0.3", None)})
+        self.assertEqual(cache.macs("10.0.0.1"), {0: MACS[0]})
+        self.assertEqual(cache.hardware_versions("10.0.0.1"),
+                {0: "TestBoard X00"})
+
+        # Dropped if the ECME changed
+        cache.record("10.0.0.1", "NEWGUID", NODES)
+        self.assertEqual(cache.macs("10.0.0.1"), {})
+        self.assertEqual(cache.hardware_versions("10.0.0.1"), {})
+
+    def test_mismatch(self):
+        """ Test that an entry is dropped if the ECME's GUID changed """
+        cache = TopologyCache()
+        cache.record("10.0.0.1", "GUID0", NODES)
+        self.assertEqual(cache.get("10.0.0.1", "OTHERGUID"), None)
+        self.assertEqual(cache.guid("10.0.0.1"), None)
+
+    def test_ttl(self):
+        """ Test that entries expire """
+        cache = TopologyCache(ttl=0.1)
+        cache.record("10.0.0.1", "GUID0", NODES)
+        time.sleep(0.2)
+        self.assertEqual(cache.get("10.0.0.1", "GUID0"), None)
+
+        # Nodes can come and go without the ECME's GUID changing
+        self.assertEqual(TopologyCache().ttl, DEFAULT_TTL)
+
+    def test_persistence(self):
+        """ Test that entries are saved to and loaded from disk """
+        filename = os.path.join(self.work_dir, "topology.json")
+        cache = TopologyCache(filename=filename)
+        cache.record("10.0.0.1", "GUID0", NODES)
+        cache.record_macs("10.0.0.1", MACS)
+        cache.record_hardware_versions("10.0.0.1", {0: "TestBoard X00"})
+
+        cache = TopologyCache(filename=filename)
+        self.assertEqual(cache.get("10.0.0.1", "GUID0"), NODES)
+        self.assertEqual(cache.macs("10.0.0.1"), MACS)
+        self.assertEqual(cache.hardware_versions("10.0.0.1"),
+                {0: "TestBoard X00"})
+
+        with open(filename, "w") as json_file:
+            json_file.write("not json")
+        cache = TopologyCache(filename=filename)
+        self.assertEqual(cache.guid("10.0.0.1"), None)
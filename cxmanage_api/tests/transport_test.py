@@ -0,0 +1,105 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: transport_test.py"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from threading import Thread
+
+from cxmanage_api.transport import TransportCache
+
+
+class TransportCacheTest(unittest.TestCase):
+    """ Tests involving the TFTP transport cache """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix="cxmanage_transport_test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_record(self):
+        """ Test recording and invalidating a path """
+        cache = TransportCache()
+        self.assertEqual(cache.get("10.0.0.1"), None)
+
+        cache.record("10.0.0.1", "host", 0.5)
+        self.assertEqual(cache.get("10.0.0.1"), "host")
+        self.assertEqual(cache.latency("10.0.0.1"), 0.5)
+
+        cache.invalidate("10.0.0.1")
+        self.assertEqual(cache.get("10.0.0.1"), None)
+
+    def test_ttl(self):
+        """ Test that entries expire """
+        cache = TransportCache(ttl=0.1)
+        cache.record("10.0.0.1", "ecme", 0.5)
+        time.sleep(0.2)
+        self.assertEqual(cache.get("10.0.0.1"), None)
+
+    def test_persistence(self):
+        """ Test that entries are saved to and loaded from disk """
+        filename = os.path.join(self.work_dir, "transport.json")
+        cache = TransportCache(filename=filename)
+        cache.record("10.0.0.1", "host", 0.5)
+        cache.record("10.0.0.2", "ecme", 0.25)
+
+        cache = TransportCache(filename=filename)
+        self.assertEqual(cache.get("10.0.0.1"), "host")
+        self.assertEqual(cache.get("10.0.0.2"), "ecme")
+        self.assertEqual(cache.latency("10.0.0.2"), 0.25)
+
+    def test_concurrent_saves(self):
+        """ Test that saves from several threads don't collide """
+        filename = os.path.join(self.work_dir, "transport.json")
+        cache = TransportCache(filename=filename)
+        errors = []
+
+        def record(i):
+            """ Record an entry, which saves the file """
+            try:
+                for j in range(20):
+                    cache.record("10.0.%i.%i" % (i, j), "host", 0.5)
+            except OSError as err:
+                errors.append(err)
+
+        threads = [Thread(target=record, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.work_dir), ["transport.json"])
@@ -0,0 +1,109 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: ubootenv_test.py"""
+
+import struct
+import unittest
+
+from cxmanage_api.crc32 import get_crc32, TABLE
+from cxmanage_api.simg import create_simg
+from cxmanage_api.ubootenv import UbootEnv, ENVIRONMENT_SIZE
+from cxmanage_api.cx_exceptions import UbootenvError
+
+
+class UbootEnvTest(unittest.TestCase):
+    """ Tests involving the UbootEnv class """
+
+    def setUp(self):
+        self.ubootenv = UbootEnv()
+        for i in xrange(32):
+            self.ubootenv.variables["var%i" % (31 - i)] = "value %i" % i
+
+    def test_get_contents(self):
+        """ Test the serialized environment layout """
+        contents = self.ubootenv.get_contents()
+        self.assertEqual(len(contents), ENVIRONMENT_SIZE)
+
+        crc32 = struct.unpack("<I", contents[:4])[0]
+        self.assertEqual(crc32,
+                get_crc32(contents[4:], 0xFFFFFFFF) ^ 0xFFFFFFFF)
+
+        expected = "".join("var%i=value %i\0" % (31 - i, i)
+                for i in xrange(32)) + "\0"
+        self.assertEqual(contents[4:4 + len(expected)], expected)
+        self.assertEqual(contents[4 + len(expected):],
+                "\xff" * (ENVIRONMENT_SIZE - 4 - len(expected)))
+
+    def test_round_trip(self):
+        """ Test that parsing keeps variables and their order """
+        contents = self.ubootenv.get_contents()
+        for data in [contents, create_simg(contents)]:
+            ubootenv = UbootEnv(data)
+            self.assertEqual(ubootenv.variables.items(),
+                    self.ubootenv.variables.items())
+            self.assertEqual(ubootenv.get_contents(), contents)
+
+    def test_empty(self):
+        """ Test an environment with no variables """
+        ubootenv = UbootEnv(UbootEnv().get_contents())
+        self.assertEqual(len(ubootenv.variables), 0)
+
+    def test_too_large(self):
+        """ Test that oversized environments are rejected """
+        self.ubootenv.variables["big"] = "x" * ENVIRONMENT_SIZE
+        self.assertRaises(UbootenvError, self.ubootenv.get_contents)
+
+    def test_diff(self):
+        """ Test the diff between two environments """
+        other = UbootEnv(self.ubootenv.get_contents())
+        self.assertEqual(self.ubootenv.diff(other), {})
+
+        other.variables["var0"] = "changed"
+        del other.variables["var1"]
+        other.variables["new"] = "added"
+        self.assertEqual(self.ubootenv.diff(other).items(), [
+            ("var1", ("value 30", None)),
+            ("var0", ("value 31", "changed")),
+            ("new", (None, "added"))
+        ])
+
+    def test_crc32(self):
+        """ Test get_crc32 against the table implementation """
+        strings = ["", "Foo Bar Baz", "".join(chr(x) for x in xrange(256))]
+        for string in strings:
+            for crc in [0, 1, 0xFFFFFFFF]:
+                expected = crc
+                for char in string:
+                    expected = TABLE[(expected ^ ord(char)) & 0xff] ^ \
+                            (expected >> 8)
+                self.assertEqual(get_crc32(string, crc), expected)
@@ -0,0 +1,79 @@
+# pylint: disable=too-many-public-methods
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+"""Calxeda: wait_test.py"""
+
+import time
+import unittest
+
+from cxmanage_api.wait import WaitSchedule
+from cxmanage_api.cx_exceptions import TimeoutError
+
+
+class WaitScheduleTest(unittest.TestCase):
+    """ Tests involving the adaptive wait schedule """
+
+    def test_delays(self):
+        """ Test that delays back off up to the maximum """
+        schedule = WaitSchedule(initial=0.5, factor=2, maximum=4, jitter=0.1)
+        delays = schedule.delays()
+        expected = [0.5, 1, 2, 4, 4, 4]
+        for value in expected:
+            delay = delays.next()
+            self.assertGreaterEqual(delay, value * 0.9)
+            self.assertLessEqual(delay, value * 1.1)
+
+    def test_wait_for(self):
+        """ Test waiting for a condition that eventually succeeds """
+        schedule = WaitSchedule(initial=0.01, factor=2, maximum=0.05)
+        results = iter([None, False, ValueError(), "done"])
+
+        def condition():
+            """ Return (or raise) the next result """
+            result = results.next()
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        stats = schedule.wait_for(condition, timeout=5,
+                allowed_errors=(ValueError,))
+        self.assertEqual(stats.attempts, 4)
+        self.assertEqual(stats.result, "done")
+        self.assertLess(stats.elapsed, 1)
+
+    def test_timeout(self):
+        """ Test that we give up at the deadline """
+        schedule = WaitSchedule(initial=0.05, factor=2, maximum=0.1)
+        start = time.time()
+        self.assertRaises(TimeoutError, schedule.wait_for, lambda: False,
+                timeout=0.3)
+        self.assertLess(time.time() - start, 1)
@@ -0,0 +1,333 @@
+"""Calxeda: topology.py"""
+
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+
+import os
+import json
+import time
+from threading import Lock
+
+from cxmanage_api import atomic_write
+
+
+# Nodes per slot (cards carry four nodes each)
+NODES_PER_SLOT = 4
+
+# Seconds a cached fabric layout is trusted before it's read again
+DEFAULT_TTL = 3600
+
+
+def node_slot(node_id):
+    """Get the slot a node is in.
+
+    >>> node_slot(6)
+    1
+
+    """
+    return node_id // NODES_PER_SLOT
+
+
+class TopologyCache(object):
+    """Remembers the layout of each fabric we've seen.
+
+    Entries are keyed by the IP address of the ECME we asked, and hold that
+    ECME's GUID along with the node ID, IP address and (if known) GUID of
+    every node in its fabric. Before an entry is trusted, the ECME at that
+    address is asked for its GUID -- a single IPMI call -- and the entry is
+    dropped if it doesn't match. That's a lot cheaper than pulling ipinfo
+    over TFTP every time a fabric is opened.
+
+    Each entry can also hold the MAC addresses and hardware version of its
+    nodes, once something has read them. These are kept across record()
+    calls for nodes that haven't moved.
+
+    >>> from cxmanage_api.topology import TopologyCache
+    >>> cache = TopologyCache(filename='topology.json')
+    >>> cache.record('10.20.1.9', 'e2f1...', {0: ('10.20.1.9', 'e2f1...'),
+    ...                                       1: ('10.20.1.10', None)})
+    >>> cache.get('10.20.1.9', 'e2f1...')
+    {0: ('10.20.1.9', 'e2f1...'), 1: ('10.20.1.10', None)}
+    >>> cache.record_hardware_versions('10.20.1.9', {0: 'EnergyCard X04'})
+    >>> cache.hardware_versions('10.20.1.9')
+    {0: 'EnergyCard X04'}
+
+    :param filename: Optional JSON file to persist entries to.
+    :type filename: string
+    :param ttl: Number of seconds an entry stays valid, or None for
+                forever. The ECME's GUID only tells us it wasn't replaced,
+                not that nodes weren't added or removed, so keep this
+                finite. Default: DEFAULT_TTL (an hour)
+    :type ttl: float
+
+    """
+
+    def __init__(self, filename=None, ttl=DEFAULT_TTL):
+        """Default constructor for the TopologyCache class."""
+        self.filename = filename
+        self.ttl = ttl
+
+        self._lock = Lock()
+        self._entries = {}
+
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def get(self, ip_address, guid):
+        """Get the cached layout of a fabric.
+
+        :param ip_address: IP address of the ECME the fabric was read from.
+        :type ip_address: string
+        :param guid: Current GUID of that ECME. The entry is only returned
+                     (and is otherwise dropped) if this matches.
+        :type guid: string
+
+        :returns: Map of node ID to (IP address, GUID), or None.
+        :rtype: dictionary
+
+        """
+        with self._lock:
+            entry = self._entries.get(ip_address)
+            if entry is None:
+                return None
+            if (entry["guid"] != guid or (self.ttl is not None and
+                    time.time() - entry["timestamp"] > self.ttl)):
+                del self._entries[ip_address]
+                return None
+            return dict((node_id, tuple(node))
+                        for node_id, node in entry["nodes"].iteritems())
+
+    def guid(self, ip_address):
+        """Get the ECME GUID an entry was recorded with.
+
+        :param ip_address: IP address of the ECME.
+        :type ip_address: string
+
+        :returns: The GUID, or None if there's no entry.
+        :rtype: string
+
+        """
+        with self._lock:
+            entry = self._entries.get(ip_address)
+            return entry["guid"] if entry else None
+
+    def fabric_of(self, ip_address):
+        """Find the entry whose fabric includes an address. The entry isn't
+        validated, so use this as a hint only.
+
+        :param ip_address: IP address of any node.
+        :type ip_address: string
+
+        :returns: IP address of the ECME the entry was read from, or None.
+        :rtype: string
+
+        """
+        with self._lock:
+            if ip_address in self._entries:
+                return ip_address
+            for key, entry in self._entries.iteritems():
+                if any(node[0] == ip_address
+                       for node in entry["nodes"].itervalues()):
+                    return key
+        return None
+
+    def macs(self, ip_address):
+        """Get the cached MAC addresses of a fabric's nodes. The entry
+        isn't validated, so only use this after get().
+
+        :param ip_address: IP address of the ECME the fabric was read from.
+        :type ip_address: string
+
+        :returns: Map of node ID to {port: [MAC addresses]}.
+        :rtype: dictionary
+
+        """
+        return self._get_details(ip_address, "macs")
+
+    def hardware_versions(self, ip_address):
+        """Get the cached hardware versions of a fabric's nodes. The entry
+        isn't validated, so only use this after get().
+
+        :param ip_address: IP address of the ECME the fabric was read from.
+        :type ip_address: string
+
+        :returns: Map of node ID to hardware version.
+        :rtype: dictionary
+
+        """
+        return self._get_details(ip_address, "hardware_versions")
+
+    def record(self, ip_address, guid, nodes):
+        """Record the layout of a fabric.
+
+        MAC addresses and hardware versions already cached for this ECME
+        are kept for nodes whose ID and IP address haven't changed.
+
+        :param ip_address: IP address of the ECME the fabric was read from.
+        :type ip_address: string
+        :param guid: GUID of that ECME.
+        :type guid: string
+        :param nodes: Map of node ID to (IP address, GUID). GUIDs may be
+                      None if we haven't read them.
+        :type nodes: dictionary
+
+        """
+        nodes = dict((int(node_id), tuple(node))
+                     for node_id, node in nodes.iteritems())
+        with self._lock:
+            old_entry = self._entries.get(ip_address)
+            entry = {
+                "guid": guid,
+                "nodes": nodes,
+                "timestamp": time.time(),
+                "macs": {},
+                "hardware_versions": {}
+            }
+            if old_entry and old_entry["guid"] == guid:
+                for key in ("macs", "hardware_versions"):
+                    for node_id, value in old_entry[key].iteritems():
+                        old_node = old_entry["nodes"].get(node_id)
+                        if (old_node and node_id in nodes and
+                                old_node[0] == nodes[node_id][0]):
+                            entry[key][node_id] = value
+            self._entries[ip_address] = entry
+        if self.filename:
+            self.save()
+
+    def record_macs(self, ip_address, macs):
+        """Record the MAC addresses of some of a fabric's nodes. Does
+        nothing if we don't know the fabric.
+
+        :param ip_address: IP address of the ECME the fabric was read from.
+        :type ip_address: string
+        :param macs: Map of node ID to {port: [MAC addresses]}.
+        :type macs: dictionary
+
+        """
+        self._record_details(ip_address, "macs", macs)
+
+    def record_hardware_versions(self, ip_address, hardware_versions):
+        """Record the hardware versions of some of a fabric's nodes. Does
+        nothing if we don't know the fabric.
+
+        :param ip_address: IP address of the ECME the fabric was read from.
+        :type ip_address: string
+        :param hardware_versions: Map of node ID to hardware version.
+        :type hardware_versions: dictionary
+
+        """
+        self._record_details(ip_address, "hardware_versions",
+                             hardware_versions)
+
+    def invalidate(self, ip_address):
+        """Forget the fabric read from this ECME.
+
+        :param ip_address: IP address of the ECME.
+        :type ip_address: string
+
+        """
+        with self._lock:
+            changed = self._entries.pop(ip_address, None) is not None
+        if changed and self.filename:
+            self.save()
+
+    def clear(self):
+        """Forget all entries."""
+        with self._lock:
+            self._entries = {}
+
+    def load(self):
+        """Load entries from our file, skipping any that are malformed."""
+        try:
+            entries = json.load(open(self.filename))
+        except (IOError, ValueError):
+            return
+
+        with self._lock:
+            for ip_address, entry in entries.iteritems():
+                try:
+                    nodes = {}
+                    for node_id, (node_ip, node_guid) in \
+                            entry["nodes"].iteritems():
+                        nodes[int(node_id)] = (
+                            str(node_ip), node_guid and str(node_guid)
+                        )
+                    macs = {}
+                    for node_id, ports in \
+                            entry.get("macs", {}).iteritems():
+                        macs[int(node_id)] = {}
+                        for port, addresses in ports.iteritems():
+                            if isinstance(addresses, basestring):
+                                addresses = [addresses]
+                            macs[int(node_id)][int(port)] = [
+                                str(x) for x in addresses
+                            ]
+                    hardware_versions = dict(
+                        (int(node_id), str(version)) for node_id, version
+                        in entry.get("hardware_versions", {}).iteritems()
+                    )
+                    self._entries[str(ip_address)] = {
+                        "guid": str(entry["guid"]),
+                        "nodes": nodes,
+                        "timestamp": float(entry["timestamp"]),
+                        "macs": macs,
+                        "hardware_versions": hardware_versions
+                    }
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    pass
+
+    def save(self):
+        """Write entries to our file. The write is atomic."""
+        with self._lock:
+            data = json.dumps(self._entries)
+        atomic_write(self.filename, data)
+
+    def _get_details(self, ip_address, key):
+        """Copy one of an entry's per-node detail maps."""
+        with self._lock:
+            entry = self._entries.get(ip_address)
+            return dict(entry[key]) if entry else {}
+
+    def _record_details(self, ip_address, key, values):
+        """Merge values into one of an entry's per-node detail maps."""
+        with self._lock:
+            entry = self._entries.get(ip_address)
+            if entry is None:
+                return
+            entry[key].update((int(node_id), value)
+                              for node_id, value in values.iteritems())
+        if self.filename:
+            self.save()
+
+
+# End of file: ./topology.py
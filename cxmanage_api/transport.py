@@ -0,0 +1,177 @@
+"""Calxeda: transport.py"""
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+
+import os
+import json
+import time
+from threading import Lock
+
+from cxmanage_api import atomic_write
+
+
+class TransportCache(object):
+    """Remembers which TFTP path worked for each node, and how fast it was.
+
+    Nodes can reach a TFTP server over two paths: "ecme" (the server hosted by
+    the ECME itself) or "host" (our own TFTP server). On some networks one of
+    them never works, so we remember the last path that succeeded and try it
+    first next time. Entries expire after ttl seconds, at which point we go
+    back to trying the ECME path first.
+
+    >>> from cxmanage_api.transport import TransportCache
+    >>> cache = TransportCache(ttl=600)
+    >>> cache.record('10.20.1.9', 'host', 0.25)
+    >>> cache.get('10.20.1.9')
+    'host'
+
+    :param ttl: Number of seconds an entry stays valid.
+    :type ttl: float
+    :param filename: Optional JSON file to persist entries to.
+    :type filename: string
+
+    """
+
+    def __init__(self, ttl=600, filename=None):
+        """Default constructor for the TransportCache class."""
+        self.ttl = ttl
+        self.filename = filename
+
+        self._lock = Lock()
+        self._entries = {}
+
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def get(self, ip_address):
+        """Get the TFTP path that last worked for this node.
+
+        :param ip_address: IP address of the node.
+        :type ip_address: string
+
+        :returns: "ecme", "host", or None if we don't know (or it expired).
+        :rtype: string
+
+        """
+        with self._lock:
+            entry = self._entries.get(ip_address)
+            if entry is None:
+                return None
+            if time.time() - entry["timestamp"] > self.ttl:
+                del self._entries[ip_address]
+                return None
+            return entry["path"]
+
+    def latency(self, ip_address):
+        """Get the transfer time recorded for this node's TFTP path.
+
+        :param ip_address: IP address of the node.
+        :type ip_address: string
+
+        :returns: Latency in seconds, or None if there's no valid entry.
+        :rtype: float
+
+        """
+        if self.get(ip_address) is None:
+            return None
+        with self._lock:
+            return self._entries[ip_address]["latency"]
+
+    def record(self, ip_address, path, latency):
+        """Record a successful transfer over the given path.
+
+        :param ip_address: IP address of the node.
+        :type ip_address: string
+        :param path: "ecme" or "host".
+        :type path: string
+        :param latency: How long the transfer took, in seconds.
+        :type latency: float
+
+        """
+        with self._lock:
+            self._entries[ip_address] = {
+                "path": path,
+                "latency": latency,
+                "timestamp": time.time()
+            }
+        if self.filename:
+            self.save()
+
+    def invalidate(self, ip_address):
+        """Forget the path for this node, e.g. after it failed.
+
+        :param ip_address: IP address of the node.
+        :type ip_address: string
+
+        """
+        with self._lock:
+            changed = self._entries.pop(ip_address, None) is not None
+        if changed and self.filename:
+            self.save()
+
+    def clear(self):
+        """Forget all entries."""
+        with self._lock:
+            self._entries = {}
+
+    def load(self):
+        """Load entries from our file, dropping any that have expired."""
+        try:
+            entries = json.load(open(self.filename))
+        except (IOError, ValueError):
+            return
+
+        now = time.time()
+        with self._lock:
+            for ip_address, entry in entries.iteritems():
+                try:
+                    if now - entry["timestamp"] <= self.ttl:
+                        self._entries[str(ip_address)] = {
+                            "path": str(entry["path"]),
+                            "latency": float(entry["latency"]),
+                            "timestamp": float(entry["timestamp"])
+                        }
+                except (KeyError, TypeError, ValueError):
+                    pass
+
+    def save(self):
+        """Write entries to our file. The write is atomic."""
+        with self._lock:
+            data = json.dumps(self._entries)
+        atomic_write(self.filename, data)
+
+
+DEFAULT_TRANSPORT_CACHE = TransportCache()
+
+
+# End of file: ./transport.py
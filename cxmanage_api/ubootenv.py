@@ -31,10 +31,11 @@
 # DAMAGE.
 
 
+import zlib
 import struct
+from collections import OrderedDict
 
 from cxmanage_api.simg import has_simg, get_simg_contents
-from cxmanage_api.crc32 import get_crc32
 from cxmanage_api.cx_exceptions import UbootenvError
 
 
@@ -58,17 +59,25 @@ class UbootEnv(object):
 
     def __init__(self, contents=None):
         """Default constructor for the UbootEnv class."""
-        self.variables = {}
+        # Keep variables in the order they were read, so serializing the
+        # same environment always gives the same bytes.
+        self.variables = OrderedDict()
 
         if (contents != None):
             if (has_simg(contents)):
                 contents = get_simg_contents(contents)
 
-            contents = contents.rstrip("%c%c" % (chr(0), chr(255)))[4:]
-            lines = contents.split(chr(0))
-            for line in lines:
-                part = line.partition("=")
-                self.variables[part[0]] = part[2]
+            # Variables are NUL terminated, and an extra NUL ends the list.
+            end = contents.find("\0\0", 4)
+            if (end == -1):
+                data = contents[4:].rstrip("\0\xff")
+            else:
+                data = contents[4:end]
+
+            for line in data.split("\0"):
+                if line:
+                    name, _, value = line.partition("=")
+                    self.variables[name] = value
 
     # pylint: disable=R0912
     def set_boot_order(self, boot_args):
@@ -284,18 +293,49 @@ class UbootEnv(object):
         :rtype: string
 
         """
-        contents = ""
-        # Add variables
-        for variable in self.variables:
-            contents += "%s=%s\0" % (variable, self.variables[variable])
-        contents += "\0"
+        # Leave room for the crc32, then add variables
+        contents = bytearray(4)
+        for name, value in self.variables.iteritems():
+            contents.extend("%s=%s\0" % (name, value))
+        contents.append(0)
+
+        if (len(contents) > ENVIRONMENT_SIZE):
+            raise UbootenvError("U-Boot environment is too large")
+
         # Add padding to end
-        contents += "".join([chr(255)
-                for _ in range(ENVIRONMENT_SIZE - len(contents) - 4)])
+        contents.extend("\xff" * (ENVIRONMENT_SIZE - len(contents)))
+
         # Add crc32 to beginning
-        crc32 = get_crc32(contents, 0xFFFFFFFF) ^ 0xFFFFFFFF
-        contents = struct.pack("<I", crc32) + contents
-        return contents
+        crc32 = zlib.crc32(buffer(contents, 4)) & 0xFFFFFFFF
+        struct.pack_into("<I", contents, 0, crc32)
+        return str(contents)
+
+    def diff(self, other):
+        """Get the variables that differ between two environments.
+
+        >>> old = node.get_ubootenv()
+        >>> new = node.get_ubootenv()
+        >>> new.set_pxe_interface('eth1')
+        >>> old.diff(new)
+        OrderedDict([('ethprime', (None, 'xgmac1'))])
+
+        :param other: Environment to compare against.
+        :type other: `UbootEnv <ubootenv.html>`_
+
+        :returns: Map of variable name to (our value, their value). A value
+                  of None means the variable isn't set on that side.
+        :rtype: OrderedDict
+
+        """
+        result = OrderedDict()
+        for name, value in self.variables.iteritems():
+            other_value = other.variables.get(name)
+            if (value != other_value):
+                result[name] = (value, other_value)
+        for name, other_value in other.variables.iteritems():
+            if (name not in self.variables):
+                result[name] = (None, other_value)
+        return result
 
 
 def validate_boot_args(boot_args):
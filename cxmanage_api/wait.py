@@ -0,0 +1,151 @@
+"""Calxeda: wait.py"""
+
+
+# Copyright (c) 2012-2013, Calxeda Inc.
+#
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# * Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+# * Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+# * Neither the name of Calxeda Inc. nor the names of its contributors
+# may be used to endorse or promote products derived from this software
+# without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT HOLDERS OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS
+# OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH
+# DAMAGE.
+
+import time
+import random
+
+from cxmanage_api.cx_exceptions import TimeoutError
+
+
+class WaitStats(object):
+    """Timing details for a single wait.
+
+    :param attempts: How many times the condition was checked.
+    :type attempts: integer
+    :param elapsed: Total seconds spent waiting.
+    :type elapsed: float
+    :param result: Whatever the condition returned on success.
+    :type result: object
+
+    """
+
+    def __init__(self, attempts=0, elapsed=0.0, result=None):
+        """Default constructor for the WaitStats class."""
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.result = result
+
+    def __repr__(self):
+        return "WaitStats(attempts=%i, elapsed=%.3f)" % (self.attempts,
+                                                         self.elapsed)
+
+
+class WaitSchedule(object):
+    """An adaptive polling schedule.
+
+    Polls start out fast, then back off exponentially up to a maximum
+    interval. Each delay is randomized by +/- jitter (a fraction), so a whole
+    fabric of nodes doesn't poll in lockstep.
+
+    >>> from cxmanage_api.wait import WaitSchedule
+    >>> schedule = WaitSchedule(initial=0.25, factor=2, maximum=5)
+    >>> stats = schedule.wait_for(lambda: node.get_power(), timeout=30)
+    >>> stats.attempts, stats.elapsed
+    (4, 1.9)
+
+    :param initial: Delay before the second check, in seconds.
+    :type initial: float
+    :param factor: Multiplier applied to the delay after each check.
+    :type factor: float
+    :param maximum: Largest delay between checks, in seconds.
+    :type maximum: float
+    :param jitter: Fraction of each delay to randomize by.
+    :type jitter: float
+
+    """
+
+    def __init__(self, initial=0.25, factor=1.5, maximum=5.0, jitter=0.1):
+        """Default constructor for the WaitSchedule class."""
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.jitter = jitter
+
+    def delays(self):
+        """Generate the delays between checks, forever.
+
+        :returns: A generator of delays in seconds.
+        :rtype: generator
+
+        """
+        delay = self.initial
+        while True:
+            yield delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            delay = min(delay * self.factor, self.maximum)
+
+    def wait_for(self, condition, timeout, allowed_errors=(),
+                 message="Timed out"):
+        """Check a condition until it returns something true.
+
+        The condition is checked immediately, then again after each delay in
+        the schedule. Exceptions in allowed_errors count as a failed check.
+
+        :param condition: Function to check. Returns a true value when done.
+        :type condition: function
+        :param timeout: Overall deadline, in seconds.
+        :type timeout: float
+        :param allowed_errors: Exceptions that count as a failed check.
+        :type allowed_errors: tuple
+        :param message: Message for the TimeoutError.
+        :type message: string
+
+        :returns: Timing details, including the condition's last result.
+        :rtype: WaitStats
+
+        :raises TimeoutError: If the condition isn't met before the deadline.
+
+        """
+        start = time.time()
+        deadline = start + timeout
+        stats = WaitStats()
+
+        for delay in self.delays():
+            stats.attempts += 1
+            try:
+                stats.result = condition()
+                if stats.result:
+                    stats.elapsed = time.time() - start
+                    return stats
+            except allowed_errors:
+                pass
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError(message)
+            time.sleep(min(delay, remaining))
+
+
+DEFAULT_WAIT_SCHEDULE = WaitSchedule()
+
+
+# End of file: ./wait.py
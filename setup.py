@@ -74,6 +74,7 @@ setup(
     ],
     extras_require={
         'docs': ['sphinx', 'cloud_sptheme'],
+        'rmcpplus': ['pycrypto'],
     },
     classifiers=[
         'License :: OSI Approved :: BSD License',